@@ -50,6 +50,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover everything below
+    'hockeycore.middleware.ServerTimingMiddleware',
+    # Sees the final body of everything below it
+    'hockeycore.middleware.CompressionMiddleware',
+    # 503 rather than 500 when the database pool is exhausted
+    'hockeycore.middleware.DatabaseBusyMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,27 +88,104 @@ WSGI_APPLICATION = 'hockeyapp.wsgi.application'
 
 ASGI_APPLICATION = 'hockeyapp.asgi.application'
 
-CHANNEL_LAYERS = {
-    "default": {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+# The Unix socket layer shares live_match_<id> groups between ASGI worker
+# processes on the same host. Windows has no Unix sockets, so fall back to
+# the single-process in-memory layer there.
+if os.name == 'posix':
+    CHANNEL_LAYERS = {
+        "default": {
+            'BACKEND': 'hockeycore.layers.UnixSocketChannelLayer',
+            'CONFIG': {
+                'path': os.getenv('CHANNEL_SOCKET_DIR', '/tmp/hockeyapp-channels'),
+                'capacity': 100,
+                'group_expiry': 86400,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Live score/status updates arriving within this many seconds of each other
+# are merged, per fixture, before they are broadcast (0 disables merging)
+LIVE_MATCH_COALESCE_WINDOW = 0.25
+
+# /metrics only answers requests with `Authorization: Bearer <METRICS_TOKEN>`;
+# without a token it answers nobody
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Responses smaller than this many bytes are not gzip/brotli-compressed
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+# Under ASGI, bodies of this many bytes or more are compressed in a worker
+# thread instead of on the event loop
+RESPONSE_COMPRESSION_OFFLOAD_SIZE = 32 * 1024
+
+# Public API responses are cached until the rows behind them change (see
+# hockeycore.responsecache). Every worker process on the host has to share
+# that cache, so it is a file cache of its own; 'default' stays Django's
+# per-process memory cache.
+CACHE_DIR = os.getenv('CACHE_DIR', '/tmp/hockeyapp-cache')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'responses'),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     },
 }
+RESPONSE_CACHE_ALIAS = 'responses'
+# Counters shared by the worker processes on the host (see
+# hockeycore.counters): the versions the in-memory search index, directory
+# and leaderboards of each worker are checked against, and the sequence
+# numbers of live broadcasts
+COUNTER_DIR = os.path.join(CACHE_DIR, 'counters')
+# Seconds a worker goes without re-reading a version counter
+VERSION_CHECK_INTERVAL = 1.0
+
+# Runs the tests against in-memory caches and a counter directory of their own
+TEST_RUNNER = 'hockeycore.testrunner.TestRunner'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections come from a bounded pool per process (see hockeycore.dbpool)
+# rather than one per request; DB_POOL_SIZE=0 connects per request instead
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 20))
+DB_POOL = {
+    'max_size': DB_POOL_SIZE,
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'hockeycore.dbpool.mysql' if DB_POOL_SIZE else 'django.db.backends.mysql',
         'NAME': os.getenv('DB_NAME'),
         'USER': 'root',
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': 'localhost',
         'PORT': '3306',
+        'OPTIONS': {'pool': DB_POOL} if DB_POOL_SIZE else {},
     }
 }
 
+# DB_ENGINE=sqlite runs against a local file instead, e.g. for benchmarks
+# without a MySQL server (see the seed_benchmark and run_benchmark commands)
+if os.getenv('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'hockeycore.dbpool.sqlite3' if DB_POOL_SIZE else 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {'pool': DB_POOL} if DB_POOL_SIZE else {},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -132,7 +215,21 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
-    
+    # Keyset pages; the next/previous page links are in the Link header
+    'DEFAULT_PAGINATION_CLASS': 'hockeycore.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+    # orjson for JSON; `Accept: application/msgpack` picks MessagePack
+    'DEFAULT_RENDERER_CLASSES': [
+        'hockeycore.renderers.ORJSONRenderer',
+        'hockeycore.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'hockeycore.renderers.ORJSONParser',
+        'hockeycore.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 # JWT Settings 
@@ -189,5 +286,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOWED_ORIGINS = [
     'http://10.0.2.2:8000',
 ]
+# The app follows the next page links in it
+CORS_EXPOSE_HEADERS = ['Link']
 
 ALLOWED_HOSTS = ['*']
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class HockeycoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hockeycore'
+
+    def ready(self):
+        # Connects the signal handlers that invalidate cached responses, keep
+        # the search index current and time SQL queries
+        from . import metrics, responsecache, search  # noqa: F401
@@ -0,0 +1,225 @@
+"""
+Async read path for the busiest public lists, under ASGI.
+
+The DRF viewsets are sync views. Under ASGI, Django runs each one in a
+thread for the whole request, so on match days the thread pool caps how
+many requests a worker process has in flight. The views here are async
+Django views. The page is read with the async ORM. The response cache
+lookup and the filters (which may read the database to check an id) take
+one short hop to a thread, and storing the response another. Between those
+steps the request holds no thread.
+
+Each one answers like its sync counterpart (`viewset`):
+- the same output (the serializer's projection, see projections);
+- the same keyset pages and Link header;
+- the viewset's filters, ?ordering= and ?fields=;
+- the same errors, through DRF's exception handler;
+- JSON or MessagePack, negotiated from Accept and ?format= by DRF's
+  content negotiation, and cached like the public viewsets.
+Not supported: ?search= (the index lives behind a sync lock), the
+browsable API (an HTML page asks for JSON here) and detail routes; they
+stay on the sync viewsets.
+
+    /api/async/fixtures/      like /api/simplefixtures/
+    /api/async/standings/     like /api/publicleaguestandings/
+    /api/async/players/       like /api/publicplayers/
+    /api/async/matchevents/   like /api/publicmatchevents/
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotAcceptable
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import directory, fieldsets, responsecache
+from .metrics import timed
+from .models import Fixture, LeagueStanding, MatchEvent, Player
+from .pagination import KeysetPagination
+from .projections import projection_for
+from .search import IndexedSearchFilter
+from .serializers import (
+    MATCH_EVENT_RELATED, LeagueStandingSerializer, MatchEventSerializer, PublicPlayerSerializer,
+    SimpleFixtureSerializer,
+)
+from .views import PublicLeagueStandingViewSet, PublicMatchEventViewSet, PublicPlayerViewSet, SimpleFixtureViewSet
+
+
+def _from_viewset(name):
+    return property(lambda view: getattr(view.viewset, name, None))
+
+
+class AsyncListView(View):
+    """
+    An async public list: `queryset` filtered and ordered by the backends of
+    the sync `viewset`, paged like it and rendered through
+    `serializer_class`'s projection.
+    """
+    http_method_names = ['get', 'head', 'options']
+    queryset = None
+    serializer_class = None
+    viewset = None
+    cache_endpoint = None
+    cache_resources = ()
+    # Read by the filter backends and KeysetPagination
+    filterset_class = _from_viewset('filterset_class')
+    filterset_fields = _from_viewset('filterset_fields')
+    ordering_fields = _from_viewset('ordering_fields')
+    ordering = _from_viewset('ordering')
+    pagination_class = KeysetPagination
+    # The configured renderers, less the HTML ones, which need a DRF view
+    renderer_classes = [
+        renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES if renderer.media_type != 'text/html'
+    ]
+    content_negotiation_class = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS
+
+    @property
+    def filter_backends(self):
+        # ?search= stays on the sync viewsets
+        return [
+            backend for backend in self.viewset.filter_backends if not issubclass(backend, IndexedSearchFilter)
+        ]
+
+    async def get(self, request, *args, **kwargs):
+        request = Request(request)
+        try:
+            request.accepted_renderer, request.accepted_media_type = self.negotiate(request)
+            key, response, queryset = await sync_to_async(self.lookup)(request)
+            if response is not None:
+                return response
+
+            selection = fieldsets.Selection.from_request(request)
+            paginator = self.pagination_class()
+            rows = self.rows(queryset, selection)
+            page = await paginator.apaginate_queryset(rows, request, self)
+            rows = [row async for row in rows] if page is None else page
+            people = await sync_to_async(directory.get_directory)()
+            if self.team_ids(rows) <= people.teams.keys():
+                data = self.serialize(rows, selection, people)
+            else:
+                # A team another process added a moment ago, read from the database
+                data = await sync_to_async(self.serialize)(rows, selection, people)
+        except APIException as exc:
+            return self.handle_exception(request, exc)
+
+        link = paginator.get_link_header() if page is not None else None
+        response = self.render(request, data, headers={'Link': link} if link else None)
+        response['X-Cache'] = 'MISS'
+        await sync_to_async(responsecache.store)(request, key, response)
+        return response
+
+    def lookup(self, request):
+        """
+        The cache key and cached response, and on a miss the filtered
+        queryset, which is not read yet.
+        """
+        key = responsecache.cache_key(request, self.cache_endpoint, self.cache_resources)
+        response = responsecache.lookup(request, self.cache_endpoint, key)
+        if response is not None:
+            return key, response, None
+        return key, None, self.filter_queryset(request, self.queryset.all())
+
+    def filter_queryset(self, request, queryset):
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+        return queryset
+
+    def negotiate(self, request, force=False):
+        """
+        The renderer and media type for the response, as the viewsets pick
+        them. With `force`, the first renderer when none is acceptable.
+        """
+        renderers = [renderer() for renderer in self.renderer_classes]
+        try:
+            return self.content_negotiation_class().select_renderer(request, renderers)
+        except NotAcceptable:
+            if not force:
+                raise
+            return renderers[0], renderers[0].media_type
+
+    def handle_exception(self, request, exc):
+        if getattr(request, 'accepted_renderer', None) is None:
+            request.accepted_renderer, request.accepted_media_type = self.negotiate(request, force=True)
+        context = {'view': self, 'args': self.args, 'kwargs': self.kwargs, 'request': request}
+        response = api_settings.EXCEPTION_HANDLER(exc, context)
+        headers = {name: value for name, value in response.items() if name != 'Content-Type'}
+        return self.render(request, response.data, status=response.status_code, headers=headers)
+
+    def rows(self, queryset, selection):
+        self.projection = projection_for(self.serializer_class, selection)
+        return queryset.values(*self.projection.columns)
+
+    def team_ids(self, rows):
+        columns = self.projection.team_columns
+        return {row[column] for row in rows for column in columns} - {None}
+
+    def serialize(self, rows, selection, people):
+        with timed('serialize'):
+            return self.projection.render(rows, people)
+
+    def render(self, request, data, status=200, headers=None):
+        renderer = request.accepted_renderer
+        with timed('render'):
+            content = renderer.render(data, request.accepted_media_type, {'view': self, 'request': request})
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        return HttpResponse(content, status=status, content_type=content_type, headers=headers)
+
+
+class FixtureListView(AsyncListView):
+    queryset = Fixture.objects.all()
+    serializer_class = SimpleFixtureSerializer
+    viewset = SimpleFixtureViewSet
+    cache_endpoint = 'async-fixtures'
+    cache_resources = ('fixtures', 'teams', 'leagues')
+
+
+class StandingListView(AsyncListView):
+    queryset = LeagueStanding.objects.all()
+    serializer_class = LeagueStandingSerializer
+    viewset = PublicLeagueStandingViewSet
+    cache_endpoint = 'async-standings'
+    cache_resources = ('standings', 'teams', 'leagues')
+
+
+class PlayerListView(AsyncListView):
+    queryset = Player.objects.all()
+    serializer_class = PublicPlayerSerializer
+    viewset = PublicPlayerViewSet
+    cache_endpoint = 'async-players'
+    cache_resources = ('players', 'teams')
+
+
+class MatchEventListView(AsyncListView):
+    """
+    Events nest their players, which a projection does not do: the page is
+    read as instances and goes through the serializer itself.
+    """
+    queryset = MatchEvent.objects.all()
+    serializer_class = MatchEventSerializer
+    viewset = PublicMatchEventViewSet
+    cache_endpoint = 'async-matchevents'
+    cache_resources = ('matchevents', 'players', 'teams')
+
+    def rows(self, queryset, selection):
+        queryset = queryset.select_related(*MATCH_EVENT_RELATED)
+        if selection is not None:
+            queryset = fieldsets.restrict(queryset, self.serializer_class, selection)
+        return queryset
+
+    def team_ids(self, rows):
+        # Only the players that were loaded; the rest are not sent
+        related = [MatchEvent._meta.get_field(name) for name in MATCH_EVENT_RELATED]
+        players = [
+            field.get_cached_value(event) for event in rows for field in related if field.is_cached(event)
+        ]
+        # A team column that was not loaded is not sent either
+        return {player.__dict__.get('team_id_id') for player in players if player is not None} - {None}
+
+    def serialize(self, rows, selection, people):
+        serializer = self.serializer_class(rows, many=True, context={fieldsets.CONTEXT_KEY: selection})
+        # The directory looked up above, rather than again from the serializer
+        serializer._directory = people
+        with timed('serialize'):
+            return serializer.data
@@ -0,0 +1,416 @@
+"""
+Synthetic data and an in-process benchmark of every hockeycore route.
+
+    seed(leagues=2, teams=10, players=20, events=5000)
+    results = run(iterations=20)
+
+seed() fills the database with leagues, teams with managers, staff and
+rosters, a double round-robin schedule per league (the first rounds played,
+one live, the rest upcoming) and match events, then rebuilds the derived
+tables. Fixture scores follow the goal events.
+
+run() requests every route in hockeycore/urls.py through the Django test
+client, so no server or network is involved. Routes that answer GET are
+requested with GET; the others (login, registration, score updates) with a
+POST inside a transaction that is rolled back, leaving the data as seeded.
+Each route reports latency percentiles over `iterations` requests, its SQL
+query count and its response size, both on a cold response cache and warm.
+"""
+import json
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.db import connection, reset_queries, transaction
+from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import directory, responsecache, search
+from .models import (
+    Fixture, League, LeagueTeam, Manager, MatchEvent, Player, Staff, Team, User,
+)
+from .playerstats import rebuild_player_stats
+from .schedule import round_robin
+from .standings import rebuild_all_standings
+
+ADMIN_EMAIL = 'benchmark-admin@example.com'
+ADMIN_PASSWORD = 'benchmark-password'
+
+FIRST_NAMES = [
+    'Anna', 'Ben', 'Carla', 'David', 'Elena', 'Frans', 'Greta', 'Hendrik', 'Ines', 'Johan',
+    'Karin', 'Lukas', 'Maria', 'Nico', 'Olga', 'Pieter', 'Renate', 'Stefan', 'Tanja', 'Uwe',
+]
+LAST_NAMES = [
+    'Amutenya', 'Botha', 'Coetzee', 'Diergaardt', 'Engelbrecht', 'Fourie', 'Gaseb', 'Hamutenya',
+    'Iipinge', 'Jacobs', 'Kandjii', 'Louw', 'Muller', 'Nghipondoka', 'Olivier', 'Pretorius',
+    'Shikongo', 'Van Wyk', 'Witbooi', 'Zaaruka',
+]
+TOWNS = [
+    'Windhoek', 'Swakopmund', 'Walvis Bay', 'Oshakati', 'Rundu', 'Keetmanshoop', 'Otjiwarongo',
+    'Gobabis', 'Katima Mulilo', 'Luderitz', 'Tsumeb', 'Rehoboth', 'Mariental', 'Okahandja',
+]
+MASCOTS = ['Lions', 'Eagles', 'Sharks', 'Rhinos', 'Jackals', 'Falcons', 'Cheetahs', 'Oryx']
+NATIONALITIES = ['Namibian', 'South African', 'German', 'Zimbabwean', 'Dutch']
+
+# Event types and how often they are generated
+EVENT_WEIGHTS = {
+    MatchEvent.Action.GOAL: 35,
+    MatchEvent.Action.CARD: 20,
+    MatchEvent.Action.SUBSTITUTION: 20,
+    MatchEvent.Action.SHOT: 15,
+    MatchEvent.Action.PENALTY: 5,
+    MatchEvent.Action.INJURY: 5,
+}
+
+# Query strings for routes that need (or are mostly called with) parameters
+QUERY_STRINGS = {
+    'publicplayers-list': 'search={word}',
+    'publicplayers-by-team': 'team_id={team}',
+    'publicfixtures-list': 'league_id={league}',
+    'publicleaguestandings-list': 'league_id={league}',
+    'publicplayerstats-list': 'player_id={player}',
+    'search': 'q={word}',
+}
+
+
+def _bulk_create(model, objects):
+    """
+    bulk_create that leaves primary keys set on every backend, including
+    MySQL where the insert does not return them.
+    """
+    model.objects.bulk_create(objects, batch_size=500)
+    if objects and objects[0].pk is None:
+        pks = model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objects)]
+        for instance, pk in zip(objects, reversed(list(pks))):
+            instance.pk = pk
+    return objects
+
+
+def seed(leagues=2, teams=10, players=20, events=5000, seed=0, start=date(2025, 1, 4)):
+    """
+    Add a synthetic data set and return the number of rows created per model.
+    """
+    rng = random.Random(seed)
+
+    def person(model, **fields):
+        return model(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES), **fields)
+
+    with transaction.atomic():
+        if not User.objects.filter(email=ADMIN_EMAIL).exists():
+            User.objects.create_user(ADMIN_EMAIL, 'Benchmark Admin', ADMIN_PASSWORD, role=User.Role.ADMIN)
+
+        offset = League.objects.count()
+        league_rows = _bulk_create(League, [
+            League(
+                name=f'Benchmark League {offset + n + 1}', season=str(start.year),
+                start_date=start, end_date=start + timedelta(weeks=2 * teams),
+                status=League.Status.RUNNING,
+            )
+            for n in range(leagues)
+        ])
+        managers = _bulk_create(Manager, [person(Manager) for _ in range(leagues * teams)])
+        team_rows = _bulk_create(Team, [
+            Team(
+                name=f'{rng.choice(TOWNS)} {rng.choice(MASCOTS)}', short_name=f'T{offset}-{n}'[:10],
+                founded_year=rng.randint(1950, 2020), manager=manager,
+            )
+            for n, manager in enumerate(managers)
+        ])
+        league_teams = {
+            league.pk: team_rows[n * teams:(n + 1) * teams] for n, league in enumerate(league_rows)
+        }
+        _bulk_create(LeagueTeam, [
+            LeagueTeam(league_id=league_id, team=team)
+            for league_id, members in league_teams.items() for team in members
+        ])
+        _bulk_create(Staff, [
+            person(Staff, role_title=title, team_id=team)
+            for team in team_rows for title in ('Coach', 'Physio')
+        ])
+        positions = [choice for choice, _ in Player.Position.choices]
+        player_rows = _bulk_create(Player, [
+            person(
+                Player, dob=date(1990, 1, 1) + timedelta(days=rng.randint(0, 5000)),
+                position=rng.choice(positions), jersey_no=number, nationality=rng.choice(NATIONALITIES),
+                team_id=team,
+            )
+            for team in team_rows for number in range(1, players + 1)
+        ])
+        rosters = {}
+        for player in player_rows:
+            rosters.setdefault(player.team_id_id, []).append(player.pk)
+
+        fixture_rows = []
+        for league_id, members in league_teams.items():
+            venues = {team.pk: f'{team.name.rsplit(" ", 1)[0]} Stadium' for team in members}
+            rounds = round_robin([team.pk for team in members])
+            played = int(len(rounds) * 0.6)
+            for number, pairs in enumerate(rounds):
+                if number < played:
+                    status = Fixture.Status.FINISHED
+                elif number == played:
+                    status = Fixture.Status.LIVE
+                else:
+                    status = Fixture.Status.UPCOMING
+                fixture_rows.extend(
+                    Fixture(
+                        match_datetime=start + timedelta(weeks=number), venue=venues[home],
+                        status=status, league_id_id=league_id, home_team_id_id=home, away_team_id_id=away,
+                    )
+                    for home, away in pairs
+                )
+        _bulk_create(Fixture, fixture_rows)
+
+        started = [fixture for fixture in fixture_rows if fixture.status != Fixture.Status.UPCOMING]
+        event_rows = []
+        goals = {}
+        kinds, weights = list(EVENT_WEIGHTS), list(EVENT_WEIGHTS.values())
+        for _ in range(events if started else 0):
+            fixture = rng.choice(started)
+            team_id = rng.choice((fixture.home_team_id_id, fixture.away_team_id_id))
+            roster = rosters[team_id]
+            player_id, other_id = rng.sample(roster, 2)
+            event = MatchEvent(
+                fixture=fixture, minute=rng.randint(1, 70), event_type=rng.choices(kinds, weights)[0],
+                player_id=player_id,
+            )
+            if event.event_type == MatchEvent.Action.GOAL:
+                goals[fixture.pk, team_id] = goals.get((fixture.pk, team_id), 0) + 1
+                if rng.random() < 0.7:
+                    event.assisting_id = other_id
+            elif event.event_type == MatchEvent.Action.CARD:
+                event.card_type = rng.choices(('green', 'yellow', 'red'), (6, 3, 1))[0]
+            elif event.event_type == MatchEvent.Action.SUBSTITUTION:
+                event.sub_in_id, event.sub_out_id = other_id, player_id
+            event_rows.append(event)
+        _bulk_create(MatchEvent, event_rows)
+
+        for fixture in started:
+            fixture.home_team_score = goals.get((fixture.pk, fixture.home_team_id_id), 0)
+            fixture.away_team_score = goals.get((fixture.pk, fixture.away_team_id_id), 0)
+            if fixture.home_team_score != fixture.away_team_score:
+                fixture.victor_id = (
+                    fixture.home_team_id_id if fixture.home_team_score > fixture.away_team_score
+                    else fixture.away_team_id_id
+                )
+        Fixture.objects.bulk_update(
+            started, ['home_team_score', 'away_team_score', 'victor'], batch_size=500
+        )
+
+        # Everything above skipped save() and its signals
+        rebuild_player_stats([fixture.pk for fixture in started])
+        rebuild_all_standings([league.pk for league in league_rows])
+        responsecache.invalidate(*{
+            resource for resources in responsecache.MODEL_RESOURCES.values() for resource in resources
+        })
+        transaction.on_commit(search.reload)
+        transaction.on_commit(directory.reload)
+
+    return {
+        'leagues': len(league_rows), 'teams': len(team_rows), 'players': len(player_rows),
+        'fixtures': len(fixture_rows), 'events': len(event_rows),
+    }
+
+
+def _walk(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _walk(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern
+
+
+def _samples():
+    """
+    Ids and a search word to fill route parameters, from the busiest league.
+    """
+    league = League.objects.annotate(fixtures=Count('fixture')).order_by('-fixtures', 'pk').first()
+    team = Team.objects.filter(leagueteam__league=league).order_by('pk').first() if league else None
+    player = Player.objects.filter(team_id=team).order_by('pk').first() if team else None
+    return {
+        'league': league.pk if league else 0,
+        'team': team.pk if team else 0,
+        'player': player.pk if player else 0,
+        'word': player.last_name[:4] if player else 'a',
+    }
+
+
+def _view_class(callback):
+    return getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+
+
+def routes():
+    """
+    Return (name, method, view class, pattern) for every route, one method
+    each: GET where the route answers it, otherwise POST.
+    """
+    from . import urls
+
+    found = []
+    for pattern in _walk(urls.urlpatterns):
+        if 'format' in pattern.pattern.regex.groupindex:
+            # The router's .json/.api suffix duplicates
+            continue
+        actions = getattr(pattern.callback, 'actions', None)
+        view_class = _view_class(pattern.callback)
+        if actions is not None:
+            methods = list(actions)
+        else:
+            methods = [method for method in ('get', 'post') if hasattr(view_class, method)]
+        method = 'get' if 'get' in methods else 'post'
+        found.append((pattern.name, method, view_class, pattern))
+    return found
+
+
+def _kwargs(pattern, view_class, samples):
+    kwargs = {}
+    for name in pattern.pattern.regex.groupindex:
+        if name == 'pk':
+            model = view_class.queryset.model
+            kwargs[name] = model.objects.order_by('pk').values_list('pk', flat=True).first() or 0
+        elif name == 'league_id':
+            kwargs[name] = samples['league']
+        elif name == 'board':
+            kwargs[name] = 'scorers'
+        else:
+            kwargs[name] = samples.get(name, 0)
+    return kwargs
+
+
+def _payload(name, samples, iteration):
+    if name == 'custom_login':
+        return {'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD}
+    if name == 'token_refresh':
+        return {'refresh': str(RefreshToken.for_user(User.objects.get(email=ADMIN_EMAIL)))}
+    if name == 'register':
+        return {'email': f'benchmark-fan-{iteration}@example.com', 'full_name': 'Fan', 'password': 'a-password'}
+    if name == 'add-team-to-league':
+        team = Team.objects.exclude(leagueteam__league=samples['league']).order_by('pk').first()
+        return {'league': samples['league'], 'team': team.pk if team else samples['team']}
+    if name == 'fixture-update-score':
+        return {'home_team_score': 2, 'away_team_score': 1}
+    return {}
+
+
+def _percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def _request(client, method, url, data, headers):
+    if method == 'get':
+        return client.get(url, headers=headers)
+    # Writes are measured and then undone
+    with transaction.atomic():
+        response = client.post(url, data, format='json', headers=headers)
+        transaction.set_rollback(True)
+    return response
+
+
+def _all_resources():
+    return {resource for resources in responsecache.MODEL_RESOURCES.values() for resource in resources}
+
+
+def run(iterations=20, only=None):
+    """
+    Request every route `iterations` times and return a report dict.
+    """
+    samples = _samples()
+    admin = User.objects.filter(email=ADMIN_EMAIL).first() or User.objects.filter(role=User.Role.ADMIN).first()
+    token = str(RefreshToken.for_user(admin).access_token) if admin else None
+    client = APIClient()
+    results = []
+
+    # Writes last, as they invalidate cached responses
+    ordered = sorted(routes(), key=lambda route: route[1] != 'get')
+    with override_settings(DEBUG=False):
+        for name, method, view_class, pattern in ordered:
+            if only and not any(part in name for part in only):
+                continue
+            url = reverse(name, kwargs=_kwargs(pattern, view_class, samples))
+            if name in QUERY_STRINGS:
+                url += '?' + QUERY_STRINGS[name].format(**samples)
+            headers = {}
+            if token and JWTAuthentication in getattr(view_class, 'authentication_classes', ()):
+                headers['Authorization'] = f'Bearer {token}'
+
+            responsecache.invalidate(*_all_resources())
+            # The query log is capped at 9000 entries
+            reset_queries()
+            with CaptureQueriesContext(connection) as cold_queries:
+                started = time.perf_counter()
+                response = _request(client, method, url, _payload(name, samples, 0), headers)
+                cold_ms = (time.perf_counter() - started) * 1000
+            # Counted now: the captured queries are read from the log lazily
+            cold_count = len(cold_queries)
+
+            timings = []
+            for iteration in range(1, iterations + 1):
+                data = _payload(name, samples, iteration)
+                started = time.perf_counter()
+                _request(client, method, url, data, headers)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            reset_queries()
+            with CaptureQueriesContext(connection) as warm_queries:
+                warm = _request(client, method, url, _payload(name, samples, iterations + 1), headers)
+            warm_count = len(warm_queries)
+
+            results.append({
+                'name': name,
+                'method': method.upper(),
+                'url': url,
+                'status': response.status_code,
+                'cache': warm.get('X-Cache', ''),
+                'cold_ms': round(cold_ms, 3),
+                'cold_queries': cold_count,
+                'p50_ms': round(_percentile(timings, 50), 3),
+                'p95_ms': round(_percentile(timings, 95), 3),
+                'p99_ms': round(_percentile(timings, 99), 3),
+                'queries': warm_count,
+                'bytes': len(warm.content),
+            })
+
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': connection.vendor,
+        'iterations': iterations,
+        'rows': {
+            model.__name__: model.objects.count()
+            for model in (League, Team, Player, Fixture, MatchEvent)
+        },
+        'results': results,
+    }
+
+
+def compare(previous, current):
+    """
+    Return (name, old p50, new p50, change %, old queries, new queries) for
+    the routes both reports measured.
+    """
+    before = {row['name']: row for row in previous['results']}
+    rows = []
+    for row in current['results']:
+        old = before.get(row['name'])
+        if old is None:
+            continue
+        change = (row['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0.0
+        rows.append((row['name'], old['p50_ms'], row['p50_ms'], round(change, 1), old['queries'], row['queries']))
+    return rows
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
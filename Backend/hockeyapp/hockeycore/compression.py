@@ -0,0 +1,105 @@
+"""
+gzip/brotli response compression.
+
+CompressionMiddleware compresses responses for clients that accept it, for
+every view. Responses from the response cache arrive already compressed:
+CachedResponseMixin stores the compressed bytes next to the plain ones, per
+encoding, under the same versioned key, so a hot endpoint is compressed
+once per invalidation instead of once per request.
+
+Brotli is used when the Brotli package is installed and the client accepts
+it, gzip otherwise. Bodies under RESPONSE_COMPRESSION_MIN_SIZE bytes are
+sent as they are; the headers would eat most of the saving. Under ASGI,
+bodies of RESPONSE_COMPRESSION_OFFLOAD_SIZE bytes or more are compressed in
+a worker thread rather than on the event loop.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Most preferred first
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(text/|application/(json|msgpack|javascript|xml)|application/[\w.+-]*\+(json|xml))'
+)
+
+# Live responses are compressed per request, cached ones once: they can
+# afford the slower, smaller setting
+LEVELS = {
+    'gzip': {False: 6, True: 9},
+    'br': {False: 4, True: 9},
+}
+
+_accept_encoding = re.compile(r'([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?')
+
+
+def min_size():
+    return getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)
+
+
+def offload_size():
+    return getattr(settings, 'RESPONSE_COMPRESSION_OFFLOAD_SIZE', 32 * 1024)
+
+
+def negotiate(request):
+    """
+    Return the encoding to compress the response to `request` with, or None.
+    """
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if not header:
+        return None
+    accepted = {}
+    for name, quality in _accept_encoding.findall(header.lower()):
+        try:
+            accepted[name] = float(quality) if quality else 1.0
+        except ValueError:
+            continue
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(content, encoding, cached=False):
+    level = LEVELS[encoding][cached]
+    if encoding == 'br':
+        return brotli.compress(content, quality=level)
+    # mtime=0 so the same body always compresses to the same bytes
+    return gzip.compress(content, compresslevel=level, mtime=0)
+
+
+def compressible(response):
+    """
+    Whether `response` is worth compressing, whatever the client accepts.
+    """
+    return (
+        not response.streaming
+        and not response.has_header('Content-Encoding')
+        and COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')) is not None
+        and len(response.content) >= min_size()
+    )
+
+
+def apply(response, encoding, content):
+    """
+    Replace the body of `response` with `content`, compressed with `encoding`.
+    """
+    response.content = content
+    response['Content-Length'] = str(len(content))
+    response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if response.has_header('ETag'):
+        # The representation changed, so a strong validator no longer holds
+        etag = response['ETag']
+        response['ETag'] = etag if etag.startswith('W/') else f'W/{etag}'
+    return response
@@ -1,23 +1,98 @@
-import json
+import asyncio
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from . import events, livestate, metrics
+from .renderers import dumps_json, dumps_msgpack
+
+# Clients asking for this subprotocol get MessagePack binary frames instead of JSON text
+BINARY_SUBPROTOCOL = 'msgpack'
+
 class LiveMatchConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.group_name = f"live_match_{self.scope['url_route']['kwargs']['fixture_id']}"
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        self.fixture_id = int(self.scope['url_route']['kwargs']['fixture_id'])
+        self.group_name = f"live_match_{self.fixture_id}"
+        self.state = None
+        events.set_socket_loop(asyncio.get_running_loop())
+        async with metrics.observe_channel_layer('group_add', 'consumer'):
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+
+        self.state = await livestate.acquire(self.fixture_id)
+        if self.state is None:
+            metrics.websocket_rejects.inc()
+            await self.close(code=4404)
+            return
+        self.binary = BINARY_SUBPROTOCOL in self.scope.get('subprotocols', ())
+        await self.accept(subprotocol=BINARY_SUBPROTOCOL if self.binary else None)
+        metrics.websocket_connects.inc()
+        metrics.websocket_open.inc()
+
+        # A reconnecting client only gets what it missed, if we still have it
+        missed = None
+        since = self.resume_from()
+        if since is not None:
+            missed = self.state.messages_since(since)
+        if missed is None:
+            await self.send_payload(self.state.snapshot())
+        else:
+            for message in missed:
+                await self.send_message(message)
+
+    def resume_from(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return int(query['since'][0])
+        except (KeyError, ValueError):
+            return None
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if self.state is not None:
+            livestate.release(self.fixture_id)
+            self.state = None
+            metrics.websocket_disconnects.inc()
+            metrics.websocket_open.dec()
+        async with metrics.observe_channel_layer('group_discard', 'consumer'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        metrics.websocket_frames.inc()
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def send_payload(self, payload):
+        if self.binary:
+            await self.send(bytes_data=dumps_msgpack(payload))
+        else:
+            await self.send(text_data=dumps_json(payload).decode())
+
+    async def send_message(self, message):
+        if message['type'] == 'match_update':
+            await self.send_update(message)
+        else:
+            await self.send_event(message)
 
     async def match_update(self, event):
-        await self.send(text_data=json.dumps({
+        livestate.record(self.fixture_id, event)
+        await self.send_update(event)
+
+    async def send_update(self, update):
+        await self.send_payload({
             'type': 'score_update',
-            **event["data"]
-        }))
+            'seq': update.get('seq'),
+            **update["data"]
+        })
 
     async def match_event(self, event):
-        await self.send(text_data=json.dumps({
+        livestate.record(self.fixture_id, event)
+        await self.send_event(event)
+
+    async def send_event(self, event):
+        await self.send_payload({
             'type': 'match_event',
+            'seq': event.get('seq'),
             **event["data"]
-        }))
\ No newline at end of file
+        })
+
+    async def match_batch(self, event):
+        # Several events for this fixture committed together; replay them in order
+        for message in event['messages']:
+            await getattr(self, message['type'])(message)
@@ -0,0 +1,88 @@
+"""
+Counters every worker process on the host shares.
+
+Each counter is a small file under COUNTER_DIR holding its value as fixed
+width digits. Adding to it reads and rewrites the value under an exclusive
+flock, so two processes adding at the same moment get different values, and
+no database or cache round trip is involved. Where flock is missing (not a
+Unix host) the counters are only atomic within the process.
+"""
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+WIDTH = 20
+
+_lock = threading.Lock()
+_made = set()
+
+
+def _directory():
+    directory = getattr(settings, 'COUNTER_DIR', None) or os.path.join(tempfile.gettempdir(), 'hockeyapp-counters')
+    if directory not in _made:
+        os.makedirs(directory, exist_ok=True)
+        _made.add(directory)
+    return directory
+
+
+def _path(name):
+    return os.path.join(_directory(), re.sub(r'[^\w.-]', '_', name))
+
+
+@contextmanager
+def _locked(fd, exclusive):
+    if fcntl is None:
+        with _lock:
+            yield
+        return
+    fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _read(fd):
+    os.lseek(fd, 0, os.SEEK_SET)
+    data = os.read(fd, WIDTH)
+    return int(data) if data else 0
+
+
+def get(name):
+    """
+    Return the counter's value, 0 if nothing was added to it yet.
+    """
+    try:
+        fd = os.open(_path(name), os.O_RDONLY)
+    except FileNotFoundError:
+        return 0
+    try:
+        with _locked(fd, exclusive=False):
+            return _read(fd)
+    finally:
+        os.close(fd)
+
+
+def add(name, count=1):
+    """
+    Add `count` to the counter and return the new value.
+    """
+    fd = os.open(_path(name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        with _locked(fd, exclusive=True):
+            value = _read(fd) + count
+            # Always WIDTH bytes, so the old value is overwritten whole
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, b'%0*d' % (WIDTH, value))
+    finally:
+        os.close(fd)
+    return value
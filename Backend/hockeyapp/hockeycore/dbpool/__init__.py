@@ -0,0 +1,382 @@
+"""
+Bounded database connection pool, shared by every thread of a process.
+
+Django opens a connection per thread and, with CONN_MAX_AGE at 0, closes it
+when the request ends. Under ASGI every sync view runs in a thread of its
+own, so each request pays for a new connection. The number of open
+connections also follows the number of threads in flight. The pooled
+backends here hand out connections from a per-process pool instead. The
+connection is returned when Django closes it, at the end of the request
+as usual, and the next request reuses it.
+
+- At most `max_size` connections are open, in use or idle. A request that
+  finds them all in use waits up to `timeout` seconds for one to come back,
+  then fails with PoolTimeout.
+- A connection idle for more than `check_after` seconds is pinged before
+  it is handed out. One that fails is replaced. So is one that saw a
+  database error and fails the same check when it comes back.
+- Connections are closed after `max_lifetime` seconds (keep it under the
+  server's wait_timeout), or once idle for `max_idle` seconds, so the pool
+  shrinks again after a spike.
+- Session setup (autocommit aside) runs once per connection, not once per
+  request.
+
+Wait time, connections in use and idle, opens, closes and timeouts go to
+metrics as hockeycore_db_pool_*. Utilisation is in use over max_size.
+
+Settings:
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'hockeycore.dbpool.mysql',  # or hockeycore.dbpool.sqlite3
+            ...
+            'CONN_MAX_AGE': 0,  # the pool keeps connections, not Django
+            'OPTIONS': {
+                'pool': {
+                    'max_size': 20,        # connections per process
+                    'timeout': 10.0,       # wait for a free one, seconds
+                    'check_after': 30.0,   # idle time before a ping, seconds
+                    'max_lifetime': 1800.0,
+                    'max_idle': 600.0,
+                },
+            },
+        },
+    }
+"""
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import closing
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError
+
+from .. import metrics
+
+
+class PoolTimeout(OperationalError):
+    """
+    No connection came free within the pool's timeout.
+    """
+
+
+class _Entry:
+    __slots__ = ('pool', 'connection', 'created', 'returned', 'initialised')
+
+    def __init__(self, pool, connection, now):
+        self.pool = pool
+        self.connection = connection
+        self.created = now
+        self.returned = now
+        self.initialised = False
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        # Already broken, which is why it is being closed
+        pass
+
+
+class _Waiter:
+    """
+    A thread queued for a connection. The releasing thread hands it a slot
+    directly: `entry`, or None to open a new connection in it.
+    """
+    __slots__ = ('event', 'granted', 'entry')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.entry = None
+
+
+class ConnectionPool:
+    def __init__(self, alias, max_size=20, timeout=10.0, check_after=30.0, max_lifetime=1800.0, max_idle=600.0):
+        if max_size < 1:
+            raise ImproperlyConfigured(f"Connection pool for '{alias}' needs a max_size of at least 1.")
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        # Most recently returned last: the warmest connection goes out first
+        # and the rest age out through max_idle
+        self._idle = []
+        # First come, first served: a connection coming back goes to the
+        # longest waiter, not to whichever thread asks next
+        self._waiters = deque()
+        # Slots taken: connections checked out, or being opened
+        self._in_use = 0
+        self._closed = False
+        self.opened = 0
+        self.timeouts = 0
+        self.acquired = 0
+        self.waited = 0.0
+        self.longest_wait = 0.0
+        self.peak_in_use = 0
+        metrics.db_pool_max_connections.set(max_size, alias=alias)
+        self._publish()
+
+    def _publish(self):
+        metrics.db_pool_connections.set(self._in_use, alias=self.alias, state='in_use')
+        metrics.db_pool_connections.set(len(self._idle), alias=self.alias, state='idle')
+
+    def _stale(self, entry, now):
+        if now - entry.created > self.max_lifetime:
+            return 'expired'
+        if now - entry.returned > self.max_idle:
+            return 'idle'
+        return None
+
+    def _prune(self, now):
+        """
+        Take the idle connections past their lifetime or idle time out of
+        the pool. Returns them, with the reason, for closing outside the lock.
+        """
+        stale = [(entry, self._stale(entry, now)) for entry in self._idle]
+        self._idle = [entry for entry, reason in stale if reason is None]
+        return [(entry, reason) for entry, reason in stale if reason is not None]
+
+    def _discard(self, entries):
+        for entry, reason in entries:
+            _close(entry.connection)
+            metrics.db_pool_closed.inc(alias=self.alias, reason=reason)
+
+    def _hand_over(self, entry):
+        """
+        With the lock held, pass a slot, with `entry` in it or None, to the
+        longest waiter. Returns False if nobody is waiting.
+        """
+        if not self._waiters:
+            return False
+        waiter = self._waiters.popleft()
+        waiter.granted, waiter.entry = True, entry
+        waiter.event.set()
+        return True
+
+    def _free_slot(self):
+        with self._lock:
+            if not self._hand_over(None):
+                self._in_use -= 1
+            self._publish()
+
+    def acquire(self, connect, check):
+        """
+        Return a pool entry holding a usable connection, waiting for one if
+        all max_size are in use. `connect()` opens a new connection and
+        `check(connection)` says whether an idle one still works.
+        """
+        started = time.monotonic()
+        waiter = entry = None
+        with self._lock:
+            if self._closed:
+                raise ImproperlyConfigured(f"Connection pool for '{self.alias}' is closed.")
+            stale = self._prune(started)
+            if not self._waiters and self._idle:
+                entry = self._idle.pop()
+                self._in_use += 1
+            elif not self._waiters and self._in_use + len(self._idle) < self.max_size:
+                # A free slot: open a connection in it below
+                self._in_use += 1
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+            self._publish()
+        self._discard(stale)
+
+        if waiter is not None:
+            waiter.event.wait(self.timeout)
+            with self._lock:
+                # Granted just as the wait ran out counts as in time
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    self.timeouts += 1
+            if not waiter.granted:
+                metrics.db_pool_timeouts.inc(alias=self.alias)
+                raise PoolTimeout(
+                    f"No database connection free in the '{self.alias}' pool "
+                    f"({self.max_size} in use) after {self.timeout:g}s."
+                )
+            entry = waiter.entry
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.acquired += 1
+            self.waited += waited
+            self.longest_wait = max(self.longest_wait, waited)
+            self.peak_in_use = max(self.peak_in_use, self._in_use)
+        metrics.db_pool_wait_seconds.observe(waited, alias=self.alias)
+
+        try:
+            if entry is not None and time.monotonic() - entry.returned > self.check_after:
+                if not check(entry.connection):
+                    self._discard([(entry, 'unhealthy')])
+                    entry = None
+            if entry is None:
+                entry = _Entry(self, connect(), time.monotonic())
+                with self._lock:
+                    self.opened += 1
+                metrics.db_pool_opened.inc(alias=self.alias)
+        except BaseException:
+            # The slot goes to whoever is waiting for it
+            self._free_slot()
+            raise
+        return entry
+
+    def release(self, entry, healthy=True):
+        """
+        Return `entry`, acquired from this pool, for reuse, or close it if
+        it is not `healthy`.
+        """
+        now = time.monotonic()
+        reason = 'unhealthy' if not healthy else self._stale(entry, now)
+        with self._lock:
+            if self._closed:
+                reason = reason or 'closed'
+            if reason is None:
+                entry.returned = now
+            if not self._hand_over(entry if reason is None else None):
+                self._in_use -= 1
+                if reason is None:
+                    self._idle.append(entry)
+            self._publish()
+        if reason is not None:
+            self._discard([(entry, reason)])
+
+    def close(self):
+        """
+        Close the idle connections. Those in use are closed as they come back.
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._publish()
+        self._discard([(entry, 'closed') for entry in idle])
+
+    def reset_peaks(self):
+        with self._lock:
+            self.peak_in_use = self._in_use
+            self.longest_wait = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'peak_in_use': self.peak_in_use,
+                'opened': self.opened,
+                'acquired': self.acquired,
+                'waited': self.waited,
+                'longest_wait': self.longest_wait,
+                'timeouts': self.timeouts,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_key(alias, settings_dict):
+    # The test runner points an alias at a different database: it gets a pool of its own
+    return (alias, *(str(settings_dict.get(name)) for name in ('NAME', 'HOST', 'PORT', 'USER')))
+
+
+def get_pool(alias, settings_dict):
+    """
+    The pool for database `alias` as `settings_dict` configures it.
+    """
+    key = _pool_key(alias, settings_dict)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = settings_dict['OPTIONS'].get('pool') or {}
+            if options is True:
+                options = {}
+            pool = _pools[key] = ConnectionPool(alias, **options)
+        return pool
+
+
+def pools():
+    with _pools_lock:
+        return list(_pools.values())
+
+
+def close_pools():
+    """
+    Close and forget every pool.
+    """
+    with _pools_lock:
+        closing_pools = list(_pools.values())
+        _pools.clear()
+    for pool in closing_pools:
+        pool.close()
+
+
+def _usable(connection):
+    try:
+        with closing(connection.cursor()) as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except Exception:
+        return False
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Database backend side of the pool: connecting takes a connection from
+    it and closing gives the connection back.
+    """
+    _pool_entry = None
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def check_settings(self):
+        super().check_settings()
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured(
+                f"Database '{self.alias}' is pooled: set CONN_MAX_AGE to 0, the pool keeps connections open."
+            )
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # The backends pass OPTIONS on to the driver
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        self._pool_entry = self.pool.acquire(
+            functools.partial(super().get_new_connection, conn_params), _usable,
+        )
+        return self._pool_entry.connection
+
+    def init_connection_state(self):
+        # Session settings outlive the checkout; only a new connection needs them
+        if self._pool_entry is None or not self._pool_entry.initialised:
+            super().init_connection_state()
+            if self._pool_entry is not None:
+                self._pool_entry.initialised = True
+
+    def _close(self):
+        entry, self._pool_entry = self._pool_entry, None
+        if entry is None:
+            return super()._close()
+        healthy = True
+        try:
+            if self.in_atomic_block or not self.autocommit:
+                # Closed mid-transaction: the next user must not inherit it
+                entry.connection.rollback()
+            if self.errors_occurred:
+                healthy = _usable(entry.connection)
+        except Exception:
+            healthy = False
+        finally:
+            self.connection = None
+            entry.pool.release(entry, healthy)
@@ -0,0 +1,193 @@
+"""
+In-process directory of team and player display records.
+
+Live broadcasts and the public serializers show the same few columns of the
+teams and players they mention: names, short names, logos. Instead of a join
+or a lazy query per reference, they read them from here: one small record
+per row, keyed by id, loaded with one query per model on first use.
+
+Committed saves and deletes update the records in place. As with the search
+index, a version counter (see hockeycore.versions) tells other worker
+processes to reload theirs. A reference the directory does not know yet (a row committed by
+another process a moment ago) is resolved from the database by the caller.
+"""
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from . import versions
+
+VERSION_KEY = 'hockeycore:directory'
+
+_lock = threading.RLock()
+_directory = None
+
+
+class TeamRecord:
+    __slots__ = ('id', 'name', 'short_name', 'logo_url')
+
+    def __init__(self, id, name, short_name, logo_url):
+        self.id = id
+        self.name = name
+        self.short_name = short_name
+        self.logo_url = logo_url
+
+    @classmethod
+    def from_model(cls, team):
+        return cls(team.id, team.name, team.short_name, team.logo_url)
+
+
+class PlayerRecord:
+    __slots__ = ('id', 'first_name', 'last_name', 'team_id')
+
+    def __init__(self, id, first_name, last_name, team_id):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.team_id = team_id
+
+    @classmethod
+    def from_model(cls, player):
+        return cls(player.id, player.first_name, player.last_name, player.team_id_id)
+
+    @property
+    def name(self):
+        return f'{self.first_name} {self.last_name}'
+
+
+# Record class and the columns it is built from, per model name
+RECORDS = {
+    'team': (TeamRecord, ('id', 'name', 'short_name', 'logo_url')),
+    'player': (PlayerRecord, ('id', 'first_name', 'last_name', 'team_id_id')),
+}
+
+
+class Directory:
+    def __init__(self, version):
+        self.version = version
+        self.teams = {}
+        self.players = {}
+
+    def records(self, kind):
+        return self.teams if kind == 'team' else self.players
+
+    def team(self, team_id, instance=None):
+        """
+        Return the record for `team_id`, falling back to `instance`, a
+        callable returning the Team (a lazy relation, read only on a miss).
+        """
+        record = self.teams.get(team_id)
+        if record is None and team_id is not None and instance is not None:
+            record = TeamRecord.from_model(instance())
+        return record
+
+    def player(self, player_id, instance=None):
+        """
+        Return the record for `player_id`; see team().
+        """
+        record = self.players.get(player_id)
+        if record is None and player_id is not None and instance is not None:
+            record = PlayerRecord.from_model(instance())
+        return record
+
+
+def _models():
+    from .models import Player, Team
+
+    return {'team': Team, 'player': Player}
+
+
+def _current_version():
+    return versions.current(VERSION_KEY)
+
+
+def _bump():
+    return versions.bump(VERSION_KEY)
+
+
+def build():
+    """
+    Load a fresh directory from the database.
+    """
+    directory = Directory(_current_version())
+    for kind, model in _models().items():
+        record_class, columns = RECORDS[kind]
+        records = directory.records(kind)
+        for row in model.objects.values_list(*columns).iterator():
+            records[row[0]] = record_class(*row)
+    return directory
+
+
+def get_directory():
+    """
+    Return this process's directory, loading it if it is missing or another
+    process has changed a team or player since.
+    """
+    global _directory
+    version = _current_version()
+    with _lock:
+        if _directory is None or _directory.version != version:
+            _directory = build()
+        return _directory
+
+
+def reload():
+    """
+    Make every process reload its directory on next use, after rows were
+    written without signals (bulk_create, update).
+    """
+    global _directory
+    with _lock:
+        _bump()
+        _directory = None
+
+
+def _apply(kind, id, record):
+    global _directory
+    with _lock:
+        version = _bump()
+        if _directory is None:
+            return
+        if version != _directory.version + 1:
+            _directory = None
+            return
+        records = _directory.records(kind)
+        if record is None:
+            records.pop(id, None)
+        else:
+            records[id] = record
+        _directory.version = version
+
+
+def _kind(sender):
+    for kind, model in _models().items():
+        if sender is model:
+            return kind
+    return None
+
+
+def _saved(sender, instance, update_fields=None, **kwargs):
+    kind = _kind(sender)
+    if kind is None:
+        return
+    # A save of other columns (a player's jersey number) leaves the record,
+    # and every other process's directory, as it is
+    if update_fields is not None and not {
+        sender._meta.get_field(name).attname for name in update_fields
+    } & set(RECORDS[kind][1]):
+        return
+    record = RECORDS[kind][0].from_model(instance)
+    transaction.on_commit(lambda: _apply(kind, record.id, record), using=kwargs.get('using'))
+
+
+def _deleted(sender, instance, **kwargs):
+    kind = _kind(sender)
+    if kind is None:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: _apply(kind, pk, None), using=kwargs.get('using'))
+
+
+post_save.connect(_saved, dispatch_uid='hockeycore.directory.saved')
+post_delete.connect(_deleted, dispatch_uid='hockeycore.directory.deleted')
@@ -0,0 +1,332 @@
+"""
+Domain event bus for live match broadcasts.
+
+Model saves publish events here instead of calling the channel layer
+directly. Inside a transaction each event is queued with
+`transaction.on_commit`, so nothing goes out for work that is rolled back
+(a savepoint included), and all events for one fixture that commit
+together go out as a single `match_batch` message.
+
+Score/status updates are throttled per fixture before they reach the
+channel layer: the first goes out at once and opens a window of
+LIVE_MATCH_COALESCE_WINDOW seconds, updates inside it are merged, and the
+latest state is sent when it closes. Events are never merged.
+
+`bulk_changes()` defers (or drops) broadcasts and standings recomputes for
+the duration of a bulk operation.
+"""
+import asyncio
+import itertools
+import threading
+import weakref
+from contextlib import contextmanager
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from . import counters, metrics
+from .standings import apply_result_change, rebuild_all_standings
+
+_local = threading.local()
+
+# Fixture id -> _Window, while its updates are being throttled
+_windows = {}
+_windows_lock = threading.Lock()
+
+# The event loop this process serves live sockets from, if any
+_socket_loop = None
+
+# The event loop sends from other threads go through when there is none
+_sender_loop = None
+_sender_lock = threading.Lock()
+
+
+def group_name(fixture_id):
+    return f"live_match_{fixture_id}"
+
+
+class _Queued:
+    """
+    A message waiting for its transaction to commit.
+
+    Its on_commit hook holds the only strong reference to it. When the
+    savepoint or transaction it was queued in rolls back, Django drops the
+    hook and the message goes with it, and out of the thread's queue, which
+    only keeps weak references.
+    """
+    __slots__ = ('fixture_id', 'message', 'sent', '__weakref__')
+
+    def __init__(self, fixture_id, message):
+        self.fixture_id = fixture_id
+        self.message = message
+        self.sent = False
+
+    def deliver(self):
+        # The first hook to run after a commit sends everything that
+        # survived, grouped by fixture; the rest find their message sent
+        if not self.sent:
+            _flush_queued()
+
+
+def _queued():
+    # Keyed by a running number, so messages keep the order they were
+    # queued in; entries of rolled back messages drop out by themselves
+    if not hasattr(_local, 'queued'):
+        _local.queued = weakref.WeakValueDictionary()
+        _local.queued_count = itertools.count()
+    return _local.queued
+
+
+def _queue(fixture_id, message):
+    queued = _Queued(fixture_id, message)
+    _queued()[next(_local.queued_count)] = queued
+    transaction.on_commit(queued.deliver)
+
+
+def _flush_queued():
+    pending = list(_queued().values())
+    _local.queued.clear()
+    messages = {}
+    for queued in pending:
+        if not queued.sent:
+            queued.sent = True
+            messages.setdefault(queued.fixture_id, []).append(queued.message)
+    send_batch(messages)
+
+
+def _bulk_stack():
+    if not hasattr(_local, 'bulk'):
+        _local.bulk = []
+    return _local.bulk
+
+
+def _send_or_queue(messages):
+    """
+    Send {fixture_id: [message, ...]} now in autocommit, or once the
+    current transaction commits.
+    """
+    if transaction.get_autocommit():
+        send_batch(messages)
+        return
+    for fixture_id, fixture_messages in messages.items():
+        for message in fixture_messages:
+            _queue(fixture_id, message)
+
+
+def broadcasts_suppressed():
+    return any(not frame['broadcast'] for frame in _bulk_stack())
+
+
+def standings_suppressed():
+    return any(not frame['standings'] for frame in _bulk_stack())
+
+
+def publish(fixture_id, message_type, data):
+    """
+    Queue a `message_type` event (a LiveMatchConsumer handler name) for the
+    fixture's live group.
+    """
+    if broadcasts_suppressed():
+        return
+
+    message = {'type': message_type, 'data': data}
+    stack = _bulk_stack()
+    if stack:
+        stack[0]['messages'].setdefault(fixture_id, []).append(message)
+        return
+
+    _send_or_queue({fixture_id: [message]})
+
+
+def result_changed(old_result, new_result):
+    """
+    Update the standings for a fixture result change, or remember the
+    leagues involved while inside bulk_changes().
+    """
+    stack = _bulk_stack()
+    if not stack:
+        apply_result_change(old_result, new_result)
+        return
+    if standings_suppressed():
+        return
+
+    for result in (old_result, new_result):
+        if result is not None and result.counted:
+            stack[0]['leagues'].add(result.league_id)
+
+
+@contextmanager
+def bulk_changes(broadcast=True, standings=True):
+    """
+    Defer broadcasts and standings recomputes until the block exits.
+
+    On a clean exit every league touched is rebuilt once and the queued
+    broadcasts are published, one message per fixture. Pass
+    `broadcast=False` or `standings=False` to drop them instead.
+    """
+    stack = _bulk_stack()
+    stack.append({'broadcast': broadcast, 'standings': standings, 'leagues': set(), 'messages': {}})
+    try:
+        yield
+    finally:
+        frame = stack.pop()
+
+    # Nested blocks leave everything to the outermost one
+    if stack:
+        return
+
+    if frame['leagues']:
+        rebuild_all_standings(frame['leagues'])
+    if frame['messages']:
+        _send_or_queue(frame['messages'])
+
+
+def _sequence_key(fixture_id):
+    return f"hockeycore:live:{fixture_id}"
+
+
+def next_sequence(fixture_id, count=1):
+    """
+    Reserve `count` sequence numbers for messages about to go to the
+    fixture's live group and return the first.
+
+    Each fixture has a counter of its own (see hockeycore.counters), shared
+    by every worker on the host, as the channel layer is. Numbers only ever
+    go up, by one per message, whichever worker sends them, without a
+    database write per broadcast.
+    """
+    return counters.add(_sequence_key(fixture_id), count) - count + 1
+
+
+def current_sequence(fixture_id):
+    """
+    Return the last sequence number sent to the fixture's live group.
+    """
+    return counters.get(_sequence_key(fixture_id))
+
+
+class _Window:
+    __slots__ = ('pending',)
+
+    def __init__(self):
+        # The merged updates held back until the window closes
+        self.pending = None
+
+
+def _coalesce_window():
+    return getattr(settings, 'LIVE_MATCH_COALESCE_WINDOW', 0.25)
+
+
+def _open_window(fixture_id, length):
+    window = _windows[fixture_id] = _Window()
+    timer = threading.Timer(length, _close_window, (fixture_id, length))
+    timer.daemon = True
+    timer.start()
+    return window
+
+
+def _close_window(fixture_id, length):
+    with _windows_lock:
+        window = _windows.pop(fixture_id, None)
+        update = window.pending if window is not None else None
+        if update is not None:
+            # Something arrived during the window: send it and keep throttling
+            _open_window(fixture_id, length)
+    if update is not None:
+        _send_fixture(fixture_id, [update])
+
+
+def _coalesce(fixture_id, messages):
+    """
+    Return the fixture's messages that go out now, holding back and merging
+    the updates that fall inside an open window.
+    """
+    length = _coalesce_window()
+    if length <= 0:
+        return messages
+
+    outgoing = []
+    with _windows_lock:
+        window = _windows.get(fixture_id)
+        for message in messages:
+            if message['type'] != 'match_update':
+                # A held-back score goes first so clients see everything
+                # in the order it happened
+                if window is not None and window.pending is not None:
+                    outgoing.append(window.pending)
+                    window.pending = None
+                outgoing.append(message)
+            elif window is None:
+                outgoing.append(message)
+                window = _open_window(fixture_id, length)
+            else:
+                previous = window.pending or {'data': {}}
+                window.pending = {**message, 'data': {**previous['data'], **message['data']}}
+    return outgoing
+
+
+def send_batch(messages):
+    """
+    Send {fixture_id: [message, ...]} to the live groups, one channel layer
+    message per fixture, after throttling the score/status updates.
+    """
+    for fixture_id, fixture_messages in messages.items():
+        fixture_messages = _coalesce(fixture_id, fixture_messages)
+        if fixture_messages:
+            _send_fixture(fixture_id, fixture_messages)
+
+
+def _send_fixture(fixture_id, messages):
+    # Messages are stamped with their sequence number here, after the data
+    # they describe has been committed
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    first = next_sequence(fixture_id, len(messages))
+    messages = [{**message, 'seq': first + offset} for offset, message in enumerate(messages)]
+    if len(messages) == 1:
+        message = messages[0]
+    else:
+        message = {'type': 'match_batch', 'messages': messages}
+    _dispatch(channel_layer, group_name(fixture_id), message)
+
+
+def set_socket_loop(loop):
+    """
+    Record the event loop this process serves live sockets from, so sends
+    from other threads reach them through it.
+    """
+    global _socket_loop
+    _socket_loop = loop
+
+
+async def _group_send(channel_layer, group, message):
+    async with metrics.observe_channel_layer('group_send', 'broadcast'):
+        await channel_layer.group_send(group, message)
+
+
+def _sender():
+    """
+    A long-lived event loop in a thread of its own, for processes that serve
+    no live sockets (management commands, WSGI workers). Sending from the
+    same loop every time keeps the channel layer's connections to other
+    processes open between broadcasts.
+    """
+    global _sender_loop
+    with _sender_lock:
+        if _sender_loop is None:
+            _sender_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sender_loop.run_forever, name='live-broadcasts', daemon=True).start()
+        return _sender_loop
+
+
+def _dispatch(channel_layer, group, message):
+    # The calling thread waits for the hand-off to the layer, not for
+    # delivery to sockets. Window timers have no event loop of their own:
+    # local sockets are only woken from the loop they are served from.
+    loop = _socket_loop
+    if loop is None or not loop.is_running():
+        loop = _sender()
+    asyncio.run_coroutine_threadsafe(_group_send(channel_layer, group, message), loop).result()
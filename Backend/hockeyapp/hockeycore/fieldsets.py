@@ -0,0 +1,301 @@
+"""
+Sparse fieldsets: ?fields= and ?expand= on every hockeycore endpoint.
+
+`?fields=id,venue,home_team.name` limits a response to the fields listed; a
+dotted name picks fields of a nested object. A nested object listed without
+sub-fields is sent as its id, unless it is also named in `?expand=`, which
+sends it whole (`?expand=home_team.manager` for deeper levels). Fields named
+only in `?expand=` are selected too. Without either parameter, responses are
+unchanged.
+
+The selection also trims the query (SparseFieldsViewMixin). The queryset
+loads only() the columns the selected fields read. It joins only the
+relations they traverse and keeps only the prefetches they use, so
+unrequested columns and joins are never fetched. What a field reads comes
+from its source. Fields whose source does not say (method fields, source
+'*') declare it in the serializer's Meta.field_lookups, as ORM paths, or as
+a `lookups` attribute on the field class. If any selected field reads
+something unknown, the queryset is left as it is.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import ForeignObjectRel
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+# Serializer context key the view passes the Selection under
+CONTEXT_KEY = 'sparse_fields'
+
+
+def parse(value):
+    """
+    'id,home_team.name' -> {'id': {}, 'home_team': {'name': {}}}
+    """
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in path.split('.'):
+            name = name.strip()
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def _freeze(tree):
+    if tree is None:
+        return None
+    return tuple(sorted((name, _freeze(sub)) for name, sub in tree.items()))
+
+
+class Selection:
+    """
+    The fields to send at one level of a response. `fields` is a tree of
+    names parsed from ?fields=, or None for all of them. `expand` is a tree
+    parsed from ?expand=.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand or {}
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        The request's selection, or None if it has none (or is a write).
+        """
+        params = request.query_params
+        if request.method not in SAFE_METHODS or ('fields' not in params and 'expand' not in params):
+            return None
+        fields = parse(params['fields']) if 'fields' in params else None
+        return cls(fields, parse(params.get('expand')))
+
+    def key(self):
+        return (_freeze(self.fields), _freeze(self.expand))
+
+    def names(self):
+        """
+        The field names selected at this level, None for all of them.
+        """
+        if self.fields is None:
+            return None
+        return list(self.fields) + [name for name in self.expand if name not in self.fields]
+
+    def nested(self, name):
+        """
+        The selection inside nested object `name`, or None to send it as
+        its id.
+        """
+        expand = self.expand.get(name)
+        if self.fields is None:
+            return Selection(None, expand)
+        if self.fields.get(name):
+            return Selection(self.fields[name], expand)
+        if expand is not None:
+            return Selection(None, expand)
+        return None
+
+
+def model_field(model, name):
+    """
+    The field, relation included, that `name` (a field name, attname or
+    reverse accessor such as 'matchevent_set') refers to on `model`.
+    """
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        for field in model._meta.get_fields():
+            if getattr(field, 'attname', None) == name:
+                return field
+            if isinstance(field, ForeignObjectRel) and field.get_accessor_name() == name:
+                return field
+        raise
+
+
+def _foreign_key(model, source):
+    if source is None or '.' in source or source == '*':
+        return None
+    try:
+        field = model_field(model, source)
+    except FieldDoesNotExist:
+        return None
+    if field.concrete and (field.many_to_one or field.one_to_one):
+        return field
+    return None
+
+
+def _check(fields, tree, param):
+    """
+    Reject names in `tree` (from ?fields= or ?expand=) that are not readable
+    fields, and sub-fields or expansions of fields that are not nested
+    objects.
+    """
+    if not tree:
+        return
+    readable = {name: field for name, field in fields.items() if not field.write_only}
+    unknown = [name for name in tree if name not in readable]
+    if unknown:
+        raise serializers.ValidationError({param: [f"Unknown field(s): {', '.join(unknown)}"]})
+    flat = [
+        name for name, sub in tree.items()
+        if (sub or param == 'expand') and not isinstance(readable[name], serializers.BaseSerializer)
+    ]
+    if flat:
+        raise serializers.ValidationError({param: [f"Not nested object(s): {', '.join(flat)}"]})
+
+
+def trim(serializer, fields, selection):
+    """
+    Drop the fields `selection` leaves out of `fields` (a serializer's
+    get_fields()) and pass each kept nested serializer its part of it.
+    """
+    _check(fields, selection.fields, 'fields')
+    _check(fields, selection.expand, 'expand')
+    names = selection.names()
+    if names is not None:
+        fields = {name: field for name, field in fields.items() if name in names or field.write_only}
+
+    model = serializer.Meta.model
+    for name, field in list(fields.items()):
+        if not isinstance(field, serializers.BaseSerializer) or field.write_only:
+            continue
+        nested = selection.nested(name)
+        if nested is None:
+            if not isinstance(field, serializers.ListSerializer) and _foreign_key(model, field.source or name):
+                source = {} if field.source in (None, name) else {'source': field.source}
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **source)
+                continue
+            nested = Selection()
+        child = field.child if isinstance(field, serializers.ListSerializer) else field
+        child._sparse_selection = nested
+    return fields
+
+
+class SparseFieldsMixin:
+    """
+    Serializer side of sparse fieldsets: the request's Selection, from the
+    context at the top level and from the parent below it, trims the
+    fields.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.sparse_selection()
+        if selection is None:
+            return fields
+        return trim(self, fields, selection)
+
+    def sparse_selection(self):
+        if hasattr(self, '_sparse_selection'):
+            return self._sparse_selection
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is None:
+            return self.context.get(CONTEXT_KEY)
+        return None
+
+
+def lookups(serializer):
+    """
+    The ORM paths the readable fields of `serializer` read, or None if one
+    of them reads something the fields do not say.
+    """
+    declared = getattr(getattr(serializer, 'Meta', None), 'field_lookups', {})
+    paths = []
+    for field in serializer._readable_fields:
+        if field.field_name in declared:
+            paths.extend(declared[field.field_name])
+        elif hasattr(field, 'lookups'):
+            paths.extend(field.lookups)
+        elif isinstance(field, serializers.ListSerializer) or field.source == '*':
+            return None
+        elif isinstance(field, serializers.BaseSerializer):
+            nested = lookups(field)
+            if nested is None:
+                return None
+            prefix = '__'.join(field.source_attrs)
+            paths.append(prefix)
+            paths.extend(f'{prefix}__{path}' for path in nested)
+        elif isinstance(field, serializers.SerializerMethodField):
+            return None
+        else:
+            paths.append('__'.join(field.source_attrs))
+    return paths
+
+
+def _plan(model, paths):
+    """
+    Split ORM paths into only() columns, select_related() joins and
+    prefetch_related() roots.
+    """
+    columns, joins, prefetches = set(), set(), set()
+    for path in paths:
+        target = model
+        hops = []
+        names = path.split('__')
+        for position, name in enumerate(names, 1):
+            field = model_field(target, name)
+            hops.append(field.get_accessor_name() if isinstance(field, ForeignObjectRel) else field.name)
+            joined = '__'.join(hops)
+            last = position == len(names)
+            if not field.is_relation:
+                columns.add(joined)
+                break
+            if field.many_to_many or field.one_to_many:
+                prefetches.add(joined)
+                break
+            if field.concrete and last:
+                # The foreign key column alone, no join
+                columns.add(joined)
+                break
+            joins.add(joined)
+            target = field.related_model
+            if last:
+                # A reverse one-to-one has no column on this side
+                columns.add(f'{joined}__{target._meta.pk.name}')
+    return columns, joins, prefetches
+
+
+def restrict(queryset, serializer_class, selection, context=None):
+    """
+    `queryset` loading only what `serializer_class` needs for `selection`.
+    """
+    serializer = serializer_class(context={**(context or {}), CONTEXT_KEY: selection})
+    paths = lookups(serializer)
+    if paths is None:
+        return queryset
+    columns, joins, prefetches = _plan(queryset.model, paths)
+    kept = [
+        lookup for lookup in queryset._prefetch_related_lookups
+        if getattr(lookup, 'prefetch_to', lookup).split('__')[0] in prefetches
+    ]
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if joins:
+        queryset = queryset.select_related(*joins)
+    if kept:
+        queryset = queryset.prefetch_related(*kept)
+    return queryset.only(*columns) if columns else queryset.only(queryset.model._meta.pk.name)
+
+
+class SparseFieldsViewMixin:
+    """
+    View side of sparse fieldsets: reads ?fields= and ?expand= once, hands
+    the selection to the serializer and trims the queryset to match.
+    """
+
+    def sparse_selection(self):
+        if not hasattr(self, '_sparse_selection'):
+            request = getattr(self, 'request', None)
+            self._sparse_selection = Selection.from_request(request) if request is not None else None
+        return self._sparse_selection
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context[CONTEXT_KEY] = self.sparse_selection()
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        selection = self.sparse_selection()
+        if selection is None:
+            return queryset
+        return restrict(queryset, self.get_serializer_class(), selection, {'request': self.request})
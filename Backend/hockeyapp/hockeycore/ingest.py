@@ -0,0 +1,80 @@
+"""
+Bulk match event ingestion.
+
+A scorer that lost its connection sends the events it queued as one batch.
+ingest_events() writes them with a single INSERT, moves the player stats for
+the whole batch at once and publishes one `match_event` per event in match
+order. Being in one transaction, the events reach `live_match_<id>` as a
+single match_batch message once it commits.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max
+
+from . import events, playerstats
+from .responsecache import invalidate
+
+# Enough to tell the events of one batch apart when their ids must be read back
+_IDENTITY = ('minute', 'event_type', 'player_id', 'assisting_id', 'card_type', 'sub_in_id', 'sub_out_id')
+
+
+def _read_back_ids(fixture, created, after):
+    """
+    Set the primary keys bulk_create could not return (MySQL), matching the
+    fixture's new rows to the events by content. Events with the same
+    content are interchangeable.
+    """
+    from .models import MatchEvent
+
+    ids = defaultdict(list)
+    rows = MatchEvent.objects.filter(fixture=fixture, pk__gt=after or 0).order_by('pk')
+    for pk, *identity in rows.values_list('pk', *_IDENTITY):
+        ids[tuple(identity)].append(pk)
+    for event in created:
+        event.pk = ids[tuple(getattr(event, attname) for attname in _IDENTITY)].pop(0)
+
+
+def ingest_events(fixture, items):
+    """
+    Create MatchEvents for `fixture` from validated `items` (dicts with
+    Player instances, see BulkMatchEventSerializer) and return them in
+    match order.
+    """
+    from .models import MatchEvent
+
+    created = [
+        MatchEvent(
+            fixture=fixture, minute=item['minute'], event_type=item['event_type'],
+            player=item['player'], assisting=item.get('assisting'), card_type=item.get('card_type'),
+            sub_in=item.get('sub_in'), sub_out=item.get('sub_out'),
+        )
+        for item in items
+    ]
+    # Stable, so events in the same minute keep the order they were sent in
+    created.sort(key=lambda event: event.minute)
+
+    # Every event is for the same fixture, so their stats add up into one change
+    lines = defaultdict(lambda: dict.fromkeys(playerstats.STAT_FIELDS, 0))
+    for event in created:
+        for player_id, line in playerstats.event_lines(lambda attname: getattr(event, attname)).items():
+            for field, count in line.items():
+                lines[player_id][field] += count
+
+    with transaction.atomic():
+        returns_ids = transaction.get_connection().features.can_return_rows_from_bulk_insert
+        if not returns_ids:
+            after = MatchEvent.objects.filter(fixture=fixture).aggregate(last=Max('pk'))['last']
+        MatchEvent.objects.bulk_create(created)
+        if not returns_ids:
+            _read_back_ids(fixture, created, after)
+
+        if lines:
+            playerstats.apply_event_change(None, (fixture.pk, dict(lines)), {fixture.pk: fixture.league_id_id})
+        # bulk_create sends no signals
+        invalidate('matchevents')
+
+        if not events.broadcasts_suppressed():
+            for event in created:
+                events.publish(fixture.pk, 'match_event', event.broadcast_payload())
+    return created
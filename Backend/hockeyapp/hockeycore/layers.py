@@ -0,0 +1,294 @@
+"""
+Channel layer shared by every ASGI worker process on one host.
+
+Each process keeps its own channels and group memberships in memory, exactly
+like InMemoryChannelLayer, and listens on a Unix socket in a shared
+directory. group_send() delivers to local members and forwards the message to
+every other process's socket, which delivers it to its own members. send() to
+a channel created by another process goes straight to that process.
+
+No broker is involved: a process that dies just leaves a stale socket file,
+which the next sender cleans up.
+
+Anyone who can connect to a socket can inject messages into live match
+groups, so the directory is created private (0700) to the user running the
+workers, and a directory owned by anybody else is refused. Frames over
+MAX_FRAME_SIZE from a peer drop its connection.
+
+Settings:
+
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'hockeycore.layers.UnixSocketChannelLayer',
+            'CONFIG': {
+                'path': '/tmp/hockeyapp-channels',  # shared socket directory
+                'capacity': 100,                     # per channel
+                'expiry': 60,                        # message expiry, seconds
+                'group_expiry': 86400,               # membership expiry, seconds
+                'send_timeout': 1.0,                 # wait on a backed-up peer, seconds
+            },
+        },
+    }
+"""
+import asyncio
+import atexit
+import logging
+import os
+import random
+import stat
+import string
+import struct
+import tempfile
+import time
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+SOCKET_SUFFIX = '.sock'
+MAX_FRAME_SIZE = 1024 * 1024
+FRAME_HEADER = struct.Struct('!I')
+
+
+def _random_string(length=12):
+    return ''.join(random.choice(string.ascii_letters) for _ in range(length))
+
+
+class UnixSocketChannelLayer(InMemoryChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path=None, peer_refresh=1.0, send_timeout=1.0, cleanup_interval=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path or os.path.join(tempfile.gettempdir(), 'hockeyapp-channels')
+        self.peer_refresh = peer_refresh
+        self.send_timeout = send_timeout
+        self.cleanup_interval = cleanup_interval
+        self.token = f"{os.getpid()}-{_random_string(6)}"
+        self.socket_path = os.path.join(self.path, self.token + SOCKET_SUFFIX)
+
+        self._server = None
+        self._server_loop = None
+        self._connections = set()
+        self._writers = {}
+        self._writers_loop = None
+        self._peers = []
+        self._peers_checked = 0
+        self._last_cleanup = 0
+
+    def _clean_expired(self):
+        # The in-memory version scans every channel and group and runs on
+        # every receive() and group_send(); with many sockets per worker that
+        # dominates, so only sweep once per `cleanup_interval`.
+        now = time.monotonic()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        super()._clean_expired()
+
+    # Local socket
+
+    async def _ensure_listening(self):
+        """
+        Start listening on this process's socket from the running event loop.
+        Processes that only ever send (management commands, WSGI workers)
+        never listen and so never receive forwarded messages.
+        """
+        loop = asyncio.get_running_loop()
+        if self._server_loop is loop:
+            return
+
+        if self._server is not None:
+            self._server.close()
+            self._unlink()
+        else:
+            self._prepare_directory()
+            atexit.register(self._unlink)
+
+        self._server = await asyncio.start_unix_server(self._handle_peer, path=self.socket_path)
+        self._server_loop = loop
+
+    def _prepare_directory(self):
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        info = os.lstat(self.path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            raise ImproperlyConfigured(
+                f"Channel layer directory {self.path} is not a directory owned by this user."
+            )
+        if stat.S_IMODE(info.st_mode) & 0o077:
+            # Created earlier with a looser umask: nobody else may connect
+            os.chmod(self.path, 0o700)
+
+    def _unlink(self):
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    async def _handle_peer(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                (size,) = FRAME_HEADER.unpack(header)
+                if size > MAX_FRAME_SIZE:
+                    logger.warning('Dropping channel layer peer sending a %d byte frame', size)
+                    break
+                envelope = msgpack.unpackb(await reader.readexactly(size), raw=False)
+                await self._deliver(envelope)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # Event loop shutting down; end quietly rather than have asyncio
+            # log the cancelled connection handler
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _deliver(self, envelope):
+        if 'g' in envelope:
+            await super().group_send(envelope['g'], envelope['m'])
+            return
+        try:
+            await super().send(envelope['c'], envelope['m'])
+        except ChannelFull:
+            pass
+
+    # Peers
+
+    def _peer_paths(self):
+        now = time.monotonic()
+        if now - self._peers_checked > self.peer_refresh:
+            try:
+                self._peers = [
+                    entry.path for entry in os.scandir(self.path)
+                    if entry.name.endswith(SOCKET_SUFFIX) and entry.path != self.socket_path
+                ]
+            except FileNotFoundError:
+                self._peers = []
+            self._peers_checked = now
+        return self._peers
+
+    def _forget_peer(self, path, stale=False):
+        self._writers.pop(path, None)
+        if stale:
+            # Nobody is listening any more; clear away the stale socket file
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            if path in self._peers:
+                self._peers.remove(path)
+
+    def _close_writers(self):
+        """
+        Close the connections opened from the previous event loop, from that
+        loop. Senders are expected to stay on one loop (hockeycore.events
+        keeps one for threads without their own); this is for when they do
+        not.
+        """
+        loop, writers, self._writers = self._writers_loop, self._writers, {}
+        if loop is None or loop.is_closed():
+            # Nothing can run their close any more; their sockets are closed
+            # when the transports are collected
+            return
+        for writer in writers.values():
+            if loop.is_running():
+                loop.call_soon_threadsafe(writer.close)
+            else:
+                writer.close()
+
+    async def _writer(self, path):
+        # Connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._writers_loop is not loop:
+            self._close_writers()
+            self._writers_loop = loop
+
+        writer = self._writers.get(path)
+        if writer is None or writer.is_closing():
+            _, writer = await asyncio.open_unix_connection(path)
+            self._writers[path] = writer
+        return writer
+
+    async def _forward(self, path, frame):
+        """
+        Write a frame to a peer. Returns False if the peer is gone or does not
+        drain within `send_timeout`.
+        """
+        for attempt in range(2):
+            try:
+                writer = await self._writer(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                self._forget_peer(path, stale=True)
+                return False
+            try:
+                writer.write(frame)
+                await asyncio.wait_for(writer.drain(), self.send_timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+            except ConnectionError:
+                # Peer restarted or dropped the connection; reconnect once
+                self._forget_peer(path)
+        return False
+
+    def _encode(self, envelope):
+        data = msgpack.packb(envelope, use_bin_type=True)
+        if len(data) > MAX_FRAME_SIZE:
+            raise ValueError(f"Channel layer message too large ({len(data)} bytes)")
+        return FRAME_HEADER.pack(len(data)) + data
+
+    def _owner_path(self, channel):
+        # Specific channel names look like "<prefix>.<token>!<id>"
+        if '!' not in channel:
+            return None
+        token = self.non_local_name(channel)[:-1].rsplit('.', 1)[-1]
+        if token == self.token:
+            return None
+        return os.path.join(self.path, token + SOCKET_SUFFIX)
+
+    # Channel layer API
+
+    async def new_channel(self, prefix='specific.'):
+        await self._ensure_listening()
+        return f"{prefix}.{self.token}!{_random_string()}"
+
+    async def receive(self, channel):
+        await self._ensure_listening()
+        return await super().receive(channel)
+
+    async def send(self, channel, message):
+        owner = self._owner_path(channel)
+        if owner is None:
+            return await super().send(channel, message)
+
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        if not await self._forward(owner, self._encode({'c': channel, 'm': message})):
+            raise ChannelFull(channel)
+
+    async def group_add(self, group, channel):
+        await self._ensure_listening()
+        await super().group_add(group, channel)
+
+    async def group_send(self, group, message):
+        await super().group_send(group, message)
+
+        peers = self._peer_paths()
+        if peers:
+            frame = self._encode({'g': group, 'm': message})
+            await asyncio.gather(*(self._forward(path, frame) for path in list(peers)))
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            self._server_loop = None
+            self._unlink()
+        for writer in list(self._connections) + list(self._writers.values()):
+            writer.close()
+        self._writers = {}
@@ -0,0 +1,283 @@
+"""
+Per-league leaderboards (top scorers, assists, cards) kept in memory.
+
+Each league's boards are loaded from PlayerSeasonStat the first time they
+are read in a process, with one indexed query. After that, committed match
+event changes are applied to them in place: a player's entry moves in
+O(log n), and finding a player's rank or the start of a board is O(log n)
+too.
+
+Worker processes each keep their own boards. Every change bumps a per-league
+version counter (see hockeycore.versions). A process that finds the version has moved
+past what it applied itself reloads that league on the next read.
+"""
+import math
+import random
+import threading
+
+from . import versions
+
+# Board name -> the PlayerSeasonStat counts it ranks by (summed)
+BOARDS = {
+    'scorers': ('goals',),
+    'assists': ('assists',),
+    'cards': ('green_cards', 'yellow_cards', 'red_cards'),
+}
+
+MAX_LEVEL = 32
+_END = (math.inf,)
+
+_lock = threading.RLock()
+_leagues = {}
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        # Number of entries each link skips over, counting the one it lands on
+        self.width = [1] * levels
+
+
+class RankedSet:
+    """
+    A sorted set with O(log n) add, discard, index and rank, built as an
+    indexable skip list.
+    """
+
+    def __init__(self):
+        self._tail = _Node(_END, 0)
+        self._head = _Node(None, MAX_LEVEL)
+        self._head.next = [self._tail] * MAX_LEVEL
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not self._tail:
+            yield node.key
+            node = node.next[0]
+
+    def _random_levels(self):
+        levels = 1
+        while levels < MAX_LEVEL and random.random() < 0.5:
+            levels += 1
+        return levels
+
+    def add(self, key):
+        chain = [None] * MAX_LEVEL
+        skipped = [0] * MAX_LEVEL
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level].key < key:
+                skipped[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        if node.next[0].key == key:
+            return
+
+        new = _Node(key, self._random_levels())
+        steps = 0
+        for level in range(len(new.next)):
+            previous = chain[level]
+            new.next[level] = previous.next[level]
+            previous.next[level] = new
+            new.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += skipped[level]
+        for level in range(len(new.next), MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def discard(self, key):
+        chain = [None] * MAX_LEVEL
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = node.next[0]
+        if target.key != key:
+            return
+
+        for level in range(len(target.next)):
+            previous = chain[level]
+            previous.width[level] += target.width[level] - 1
+            previous.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        node = self._head
+        remaining = index + 1
+        for level in reversed(range(MAX_LEVEL)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node.key
+
+    def rank(self, key):
+        """
+        Return how many keys sort before `key`.
+        """
+        node = self._head
+        count = 0
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level].key < key:
+                count += node.width[level]
+                node = node.next[level]
+        return count
+
+
+class Leaderboard:
+    """
+    Players ranked by a count, highest first, ties by player id. Players
+    with a count of zero are left off.
+
+    Committed changes are applied in place from other threads under the
+    module lock, so reads take it too.
+    """
+    __slots__ = ('counts', 'ranked')
+
+    def __init__(self):
+        self.counts = {}
+        self.ranked = RankedSet()
+
+    def add(self, player_id, delta):
+        self.set(player_id, self.counts.get(player_id, 0) + delta)
+
+    def set(self, player_id, count):
+        old = self.counts.pop(player_id, 0)
+        if old > 0:
+            self.ranked.discard((-old, player_id))
+        if count > 0:
+            self.counts[player_id] = count
+            self.ranked.add((-count, player_id))
+
+    def rank(self, player_id):
+        """
+        Return the player's standard competition rank (tied players share
+        a rank, 1, 2, 2, 4), or None if they are not on the board.
+        """
+        with _lock:
+            count = self.counts.get(player_id)
+            if count is None:
+                return None
+            return self.ranked.rank((-count, -math.inf)) + 1
+
+    def top(self, limit):
+        """
+        Return [(rank, player_id, count)] for the first `limit` entries.
+        """
+        rows = []
+        with _lock:
+            for index, (negative, player_id) in enumerate(self.ranked):
+                if index >= limit:
+                    break
+                if rows and rows[-1][2] == -negative:
+                    rank = rows[-1][0]
+                else:
+                    rank = index + 1
+                rows.append((rank, player_id, -negative))
+        return rows
+
+    def __len__(self):
+        return len(self.ranked)
+
+
+class _LeagueBoards:
+    __slots__ = ('version', 'boards')
+
+    def __init__(self, version):
+        self.version = version
+        self.boards = {name: Leaderboard() for name in BOARDS}
+
+    def set(self, player_id, counts):
+        for name, fields in BOARDS.items():
+            self.boards[name].set(player_id, sum(counts.get(field, 0) for field in fields))
+
+
+def _version_key(league_id):
+    return f"hockeycore:leaderboards:{league_id}"
+
+
+def _current_version(league_id):
+    return versions.current(_version_key(league_id))
+
+
+def _bump(league_id):
+    return versions.bump(_version_key(league_id))
+
+
+def _load(league_id):
+    from .models import PlayerSeasonStat
+
+    # Read the version first: a change that lands during the query bumps it
+    # again and makes the next read reload
+    league = _LeagueBoards(_current_version(league_id))
+    fields = sorted({field for fields in BOARDS.values() for field in fields})
+    rows = PlayerSeasonStat.objects.filter(league_id=league_id).values_list('player_id', *fields)
+    for player_id, *counts in rows:
+        league.set(player_id, dict(zip(fields, counts)))
+    return league
+
+
+def board(league_id, name):
+    """
+    Return the league's `name` Leaderboard, loading or reloading the league
+    if it is missing or out of date.
+    """
+    version = _current_version(league_id)
+    with _lock:
+        league = _leagues.get(league_id)
+        if league is None or league.version != version:
+            league = _leagues[league_id] = _load(league_id)
+        return league.boards[name]
+
+
+def season_changed(stats):
+    """
+    Apply committed PlayerSeasonStat rows, {(league_id, player_id): {stat: count}}
+    with an empty dict for a row that no longer exists. Setting the counts
+    rather than adding to them means a board loaded after the commit can
+    take the same change again without counting it twice.
+    """
+    leagues = {}
+    for (league_id, player_id), counts in stats.items():
+        leagues.setdefault(league_id, []).append((player_id, counts))
+
+    with _lock:
+        for league_id, changes in leagues.items():
+            version = _bump(league_id)
+            league = _leagues.get(league_id)
+            if league is None:
+                continue
+            if version != league.version + 1:
+                # Someone else changed the league too; reload on next read
+                del _leagues[league_id]
+                continue
+            for player_id, counts in changes:
+                league.set(player_id, counts)
+            league.version = version
+
+
+def reload(league_ids=None):
+    """
+    Make every process reload `league_ids` (or every league it holds) on its
+    next read, after a bulk rewrite of PlayerSeasonStat.
+    """
+    from .models import League
+
+    if league_ids is None:
+        league_ids = League.objects.values_list('id', flat=True)
+    with _lock:
+        for league_id in league_ids:
+            _bump(league_id)
+            _leagues.pop(league_id, None)
@@ -0,0 +1,150 @@
+"""
+Per-process live match state for LiveMatchConsumer.
+
+While a worker has sockets open for a fixture it keeps that fixture's
+current score, status and events in memory, plus a bounded ring buffer of
+the last messages sent. The state is loaded from the database once, when
+the first socket for the fixture connects, and from then on is kept up to
+date by the broadcasts themselves. New sockets get a snapshot from it, and
+reconnecting sockets with `?since=<seq>` get just what they missed.
+"""
+import asyncio
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .events import current_sequence
+
+_states = {}
+_loading = {}
+
+
+class LiveMatchState:
+    __slots__ = (
+        'fixture_id', 'score', 'status', 'events',
+        'buffer', 'buffered', 'floor', 'last_seq', 'subscribers',
+    )
+
+    def __init__(self, fixture_id, score, status, events, floor):
+        self.fixture_id = fixture_id
+        self.score = score
+        self.status = status
+        # Event id -> payload, in the order they happened
+        self.events = {event['id']: event for event in events}
+        self.buffer = deque(maxlen=getattr(settings, 'LIVE_MATCH_RESUME_BUFFER', 256))
+        self.buffered = set()
+        # Every message with seq <= floor is reflected in the state but may not be in the buffer
+        self.floor = floor
+        self.last_seq = floor
+        self.subscribers = 0
+
+    def record(self, message):
+        """
+        Apply a broadcast message once, however many local sockets see it.
+        """
+        seq = message.get('seq')
+        if seq is None or seq <= self.floor or seq in self.buffered:
+            return
+
+        if len(self.buffer) == self.buffer.maxlen:
+            evicted = self.buffer.popleft()['seq']
+            self.buffered.discard(evicted)
+            self.floor = max(self.floor, evicted)
+        self.buffer.append(message)
+        self.buffered.add(seq)
+        self.last_seq = max(self.last_seq, seq)
+
+        data = message['data']
+        if message['type'] == 'match_update':
+            self.score = data.get('score', self.score)
+            self.status = data.get('status', self.status)
+        elif message['type'] == 'match_event' and data.get('id') is not None:
+            self.events[data['id']] = data
+
+    def messages_since(self, seq):
+        """
+        Return the buffered messages after `seq`, or None if the buffer no
+        longer reaches back that far.
+        """
+        if seq < self.floor or seq > self.last_seq:
+            # Too old, or not a number this fixture has handed out
+            return None
+        return sorted((m for m in self.buffer if m['seq'] > seq), key=lambda m: m['seq'])
+
+    def snapshot(self):
+        return {
+            'type': 'snapshot',
+            'seq': self.last_seq,
+            'score': self.score,
+            'status': self.status,
+            'events': list(self.events.values()),
+        }
+
+
+@database_sync_to_async
+def _load(fixture_id):
+    from .models import Fixture, MatchEvent
+
+    # Anything broadcast before this point is already in the database
+    floor = current_sequence(fixture_id)
+    fixture = Fixture.objects.filter(pk=fixture_id).first()
+    if fixture is None:
+        return None
+
+    match_events = (
+        MatchEvent.objects.filter(fixture_id=fixture_id)
+        .select_related('player__team_id', 'assisting', 'sub_in', 'sub_out')
+        .order_by('minute', 'id')
+    )
+    return LiveMatchState(
+        fixture_id,
+        score=fixture.score_display,
+        status=fixture.status,
+        events=[event.broadcast_payload() for event in match_events],
+        floor=floor,
+    )
+
+
+async def acquire(fixture_id):
+    """
+    Return the fixture's state, loading it if no local socket holds it yet.
+    Returns None for a fixture that does not exist.
+    """
+    state = _states.get(fixture_id)
+    if state is None:
+        loading = _loading.get(fixture_id)
+        if loading is None:
+            loading = _loading[fixture_id] = asyncio.ensure_future(_load(fixture_id))
+            try:
+                state = await loading
+            finally:
+                del _loading[fixture_id]
+            if state is not None:
+                _states[fixture_id] = state
+        else:
+            state = await asyncio.shield(loading)
+            state = _states.get(fixture_id, state)
+
+    if state is not None:
+        state.subscribers += 1
+    return state
+
+
+def release(fixture_id):
+    """
+    Drop a socket's hold on the state; the last one out forgets it, since
+    nothing keeps it current without subscribers.
+    """
+    state = _states.get(fixture_id)
+    if state is None:
+        return
+    state.subscribers -= 1
+    if state.subscribers <= 0:
+        del _states[fixture_id]
+
+
+def record(fixture_id, message):
+    state = _states.get(fixture_id)
+    if state is not None:
+        state.record(message)
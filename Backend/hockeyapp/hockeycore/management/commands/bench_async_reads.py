@@ -0,0 +1,126 @@
+import asyncio
+import statistics
+import threading
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+# (name, sync route, async route), with the same query string
+ROUTES = [
+    ('fixtures', '/api/simplefixtures/', '/api/async/fixtures/'),
+    ('standings', '/api/publicleaguestandings/', '/api/async/standings/'),
+    ('players', '/api/publicplayers/', '/api/async/players/'),
+    ('matchevents', '/api/publicmatchevents/', '/api/async/matchevents/'),
+]
+
+
+async def _get(app, path, query):
+    """
+    One GET through the ASGI application, as a server would make it.
+    Returns the status code.
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'headers': [(b'host', b'localhost')],
+        'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+    }
+    requested = False
+    disconnected = asyncio.Event()
+    status = None
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Django listens for the client going away until the response is sent
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+async def _load(app, path, query, clients, requests, uncached):
+    """
+    `clients` concurrent clients making `requests` GETs between them.
+    Returns (elapsed seconds, latencies, statuses, most threads alive).
+    """
+    latencies, statuses = [], set()
+    remaining = iter(range(requests))
+    peak_threads = threading.active_count()
+    running = True
+
+    async def watch_threads():
+        nonlocal peak_threads
+        while running:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.005)
+
+    async def client():
+        for number in remaining:
+            # A distinct query string per request misses the response cache
+            request_query = f'{query}&bust={number}' if uncached else query
+            started = time.perf_counter()
+            statuses.add(await _get(app, path, request_query))
+            latencies.append(time.perf_counter() - started)
+
+    watcher = asyncio.ensure_future(watch_threads())
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    running = False
+    await watcher
+    return elapsed, latencies, statuses, peak_threads
+
+
+def _percentile(values, percent):
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1] if len(values) > 1 else values[0]
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent throughput of the sync public viewsets and their async versions under ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help='Concurrent clients')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per route and path')
+        parser.add_argument('--query', default='page_size=100', help='Query string for every request')
+        parser.add_argument(
+            '--route', action='append', dest='routes', choices=[name for name, _, _ in ROUTES],
+            help='Only this route (repeatable).'
+        )
+        parser.add_argument(
+            '--uncached', action='store_true', help='Make every request miss the response cache'
+        )
+
+    def handle(self, *args, **options):
+        app = get_asgi_application()
+        clients, requests = options['clients'], options['requests']
+        routes = [route for route in ROUTES if not options['routes'] or route[0] in options['routes']]
+
+        self.stdout.write(
+            f"{clients} clients, {requests} requests per path, "
+            f"{'uncached' if options['uncached'] else 'response cache warm'}"
+        )
+        self.stdout.write(f"{'route':<12} {'path':<6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'threads':>8}  status")
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost']):
+            for name, sync_path, async_path in routes:
+                for label, path in (('sync', sync_path), ('async', async_path)):
+                    # One request first, so both paths start with a warm cache and directory
+                    asyncio.run(_get(app, path, options['query']))
+                    elapsed, latencies, statuses, threads = asyncio.run(
+                        _load(app, path, options['query'], clients, requests, options['uncached'])
+                    )
+                    self.stdout.write(
+                        f"{name:<12} {label:<6} {len(latencies) / elapsed:>9.0f} "
+                        f"{_percentile(latencies, 50) * 1000:>9.1f} {_percentile(latencies, 99) * 1000:>9.1f} "
+                        f"{threads:>8}  {','.join(str(status) for status in sorted(statuses))}"
+                    )
@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from hockeycore.layers import UnixSocketChannelLayer
+
+GROUP = 'live_match_bench'
+
+
+async def _receive_all(layer, channels, messages, idle_timeout=None):
+    """
+    Receive `messages` on every channel. Returns how many arrived; with an
+    `idle_timeout` a channel gives up once nothing arrives for that long.
+    """
+    async def drain(channel):
+        received = 0
+        try:
+            for _ in range(messages):
+                await asyncio.wait_for(layer.receive(channel), idle_timeout)
+                received += 1
+        except asyncio.TimeoutError:
+            pass
+        return received
+
+    return sum(await asyncio.gather(*(drain(channel) for channel in channels)))
+
+
+async def _join(layer, subscribers):
+    channels = [await layer.new_channel() for _ in range(subscribers)]
+    for channel in channels:
+        await layer.group_add(GROUP, channel)
+    return channels
+
+
+def _worker(path, subscribers, messages, ready, done):
+    async def run():
+        layer = UnixSocketChannelLayer(path=path, capacity=messages + 1)
+        channels = await _join(layer, subscribers)
+        ready.set()
+        received = await _receive_all(layer, channels, messages, idle_timeout=10)
+        done.put((time.perf_counter(), received))
+        await layer.close()
+
+    asyncio.run(run())
+
+
+async def _send(layer, messages):
+    for i in range(messages):
+        await layer.group_send(GROUP, {'type': 'match_update', 'data': {'score': f'{i}-0', 'status': 'LIVE'}})
+        # Let local receivers and the socket reader run, as a live server would
+        await asyncio.sleep(0)
+
+
+def bench_in_memory(subscribers, messages):
+    async def run():
+        layer = InMemoryChannelLayer(capacity=messages + 1)
+        channels = await _join(layer, subscribers)
+        start = time.perf_counter()
+        receiving = asyncio.ensure_future(_receive_all(layer, channels, messages))
+        await _send(layer, messages)
+        received = await receiving
+        return time.perf_counter() - start, received
+
+    return asyncio.run(run())
+
+
+def bench_unix_socket(processes, subscribers, messages):
+    path = tempfile.mkdtemp(prefix='hockeyapp-bench-')
+    ready = [multiprocessing.Event() for _ in range(processes)]
+    done = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_worker, args=(path, subscribers, messages, ready[i], done))
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for event in ready:
+        event.wait()
+
+    async def run():
+        layer = UnixSocketChannelLayer(path=path, peer_refresh=0)
+        start = time.perf_counter()
+        await _send(layer, messages)
+        await layer.close()
+        return start
+
+    start = asyncio.run(run())
+    results = [done.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    finished = max(finished for finished, _ in results)
+    return finished - start, sum(received for _, received in results)
+
+
+class Command(BaseCommand):
+    help = 'Compare group_send fan-out throughput of the in-memory and Unix socket channel layers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Worker processes holding sockets')
+        parser.add_argument('--subscribers', type=int, default=100, help='Sockets per worker process')
+        parser.add_argument('--messages', type=int, default=100, help='Messages sent to the group')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        subscribers = options['subscribers']
+        messages = options['messages']
+        total = processes * subscribers
+
+        rows = [
+            ('in-memory (1 process)', bench_in_memory(total, messages)),
+            (f'unix socket ({processes} processes)', bench_unix_socket(processes, subscribers, messages)),
+        ]
+
+        self.stdout.write(f'{messages} messages to a group of {total} subscribers')
+        for name, (elapsed, received) in rows:
+            self.stdout.write(
+                f'{name:<28} {elapsed * 1000:9.1f} ms  {received / elapsed:12,.0f} deliveries/s'
+                f'  ({total * messages - received} lost)'
+            )
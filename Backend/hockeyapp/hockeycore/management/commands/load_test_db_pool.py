@@ -0,0 +1,102 @@
+import asyncio
+import itertools
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+
+from hockeycore import dbpool
+
+from .bench_async_reads import _get, _percentile
+
+# Public lists that miss the response cache on every request (see --paths)
+PATHS = ['/api/simplefixtures/', '/api/async/fixtures/', '/api/publicplayers/', '/api/async/players/']
+
+
+async def _phase(app, paths, query, clients, requests):
+    """
+    `clients` concurrent clients making `requests` uncached GETs between
+    them, spread over `paths`. Returns (elapsed seconds, latencies, statuses).
+    """
+    latencies, statuses = [], {}
+    remaining = iter(range(requests))
+    rotation = itertools.cycle(paths)
+
+    async def client():
+        for number in remaining:
+            started = time.perf_counter()
+            status = await _get(app, next(rotation), f'{query}&bust={time.time_ns()}.{number}')
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - started, latencies, statuses
+
+
+class Command(BaseCommand):
+    help = 'Load test the database connection pool with a match-day spike of concurrent ASGI requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--steps', default='10,50,200,400,50',
+            help='Concurrent clients in each phase of the spike, comma separated'
+        )
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per phase')
+        parser.add_argument('--query', default='page_size=50', help='Query string for every request')
+        parser.add_argument(
+            '--path', action='append', dest='paths', help=f'Path to request (repeatable, default {PATHS})'
+        )
+
+    def handle(self, *args, **options):
+        app = get_asgi_application()
+        paths = options['paths'] or PATHS
+        steps = [int(step) for step in options['steps'].split(',')]
+        settings_dict = connections['default'].settings_dict
+        pooled = 'pool' in settings_dict['OPTIONS']
+        # Unpooled, every connection Django makes is a new one
+        created = []
+        connection_created.connect(lambda **kwargs: created.append(1), weak=False, dispatch_uid='load_test_db_pool')
+
+        self.stdout.write(
+            f"{settings_dict['ENGINE']}, "
+            + (f"pool of {dbpool.get_pool('default', settings_dict).max_size}" if pooled else 'no pool')
+            + f", {options['requests']} uncached requests per phase over {len(paths)} paths"
+        )
+        self.stdout.write(
+            f"{'clients':>7} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'opened':>7} {'peak':>5} "
+            f"{'wait ms':>8} {'max wait':>9} {'timeouts':>8}  statuses"
+        )
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost']):
+            asyncio.run(_get(app, paths[0], options['query']))
+            for clients in steps:
+                if pooled:
+                    pool = dbpool.get_pool('default', settings_dict)
+                    pool.reset_peaks()
+                    before = pool.stats()
+                created.clear()
+
+                elapsed, latencies, statuses = asyncio.run(
+                    _phase(app, paths, options['query'], clients, options['requests'])
+                )
+
+                if pooled:
+                    after = pool.stats()
+                    acquired = after['acquired'] - before['acquired']
+                    opened = after['opened'] - before['opened']
+                    waits = (
+                        f"{after['peak_in_use']:>5} "
+                        f"{(after['waited'] - before['waited']) / max(acquired, 1) * 1000:>8.2f} "
+                        f"{after['longest_wait'] * 1000:>9.1f} {after['timeouts'] - before['timeouts']:>8}"
+                    )
+                else:
+                    opened = len(created)
+                    waits = f"{'-':>5} {'-':>8} {'-':>9} {'-':>8}"
+                self.stdout.write(
+                    f"{clients:>7} {len(latencies) / elapsed:>7.0f} {_percentile(latencies, 50) * 1000:>8.1f} "
+                    f"{_percentile(latencies, 99) * 1000:>8.1f} {opened:>7} {waits}  "
+                    + ','.join(f'{status}x{count}' for status, count in sorted(statuses.items()))
+                )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from hockeycore.models import PlayerSeasonStat, PlayerStat
+from hockeycore.playerstats import rebuild_player_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute player statistics and season totals from match events'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fixture', type=int, action='append', dest='fixtures',
+            help='Fixture id to rebuild (repeatable). Defaults to every fixture.'
+        )
+
+    def handle(self, *args, **options):
+        rebuild_player_stats(options['fixtures'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{PlayerStat.objects.count()} fixture and '
+            f'{PlayerSeasonStat.objects.count()} season stat rows'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from hockeycore.models import League
+from hockeycore.standings import rebuild_all_standings
+
+
+class Command(BaseCommand):
+    help = 'Recompute league standings from finished fixtures'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--league', type=int, action='append', dest='leagues',
+            help='League id to rebuild (repeatable). Defaults to every league.'
+        )
+
+    def handle(self, *args, **options):
+        league_ids = options['leagues']
+        rebuild_all_standings(league_ids)
+
+        count = len(league_ids) if league_ids else League.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt standings for {count} league(s)'))
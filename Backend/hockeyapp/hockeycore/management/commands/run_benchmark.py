@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from hockeycore.benchmark import compare, load, run, save
+
+
+class Command(BaseCommand):
+    help = 'Time every hockeycore route in-process and save the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per route.')
+        parser.add_argument(
+            '--route', action='append', dest='routes',
+            help='Only routes whose name contains this (repeatable).'
+        )
+        parser.add_argument('--output', help='Where to write the JSON report.')
+        parser.add_argument('--compare', help='An earlier report to compare p50 latencies against.')
+
+    def handle(self, *args, **options):
+        report = run(iterations=options['iterations'], only=options['routes'])
+
+        self.stdout.write(
+            f"{'route':<36} {'method':<6} {'status':>6} {'p50':>9} {'p95':>9} {'p99':>9} "
+            f"{'cold':>9} {'queries':>8} {'bytes':>9} cache"
+        )
+        for row in report['results']:
+            self.stdout.write(
+                f"{row['name']:<36} {row['method']:<6} {row['status']:>6} {row['p50_ms']:>9.2f} "
+                f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['cold_ms']:>9.2f} "
+                f"{row['cold_queries']:>3}/{row['queries']:<4} {row['bytes']:>9} {row['cache']}"
+            )
+
+        if options['compare']:
+            self.stdout.write('')
+            self.stdout.write(f"{'route':<36} {'p50 before':>11} {'p50 now':>9} {'change':>8} queries")
+            for name, old, new, change, old_queries, new_queries in compare(load(options['compare']), report):
+                self.stdout.write(
+                    f"{name:<36} {old:>11.2f} {new:>9.2f} {change:>+7.1f}% {old_queries} -> {new_queries}"
+                )
+
+        output = options['output'] or time.strftime('benchmark-%Y%m%d-%H%M%S.json')
+        save(report, output)
+        self.stdout.write(self.style.SUCCESS(f"{len(report['results'])} routes, report written to {output}"))
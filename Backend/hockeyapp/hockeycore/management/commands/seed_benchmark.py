@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from hockeycore.benchmark import ADMIN_EMAIL, seed
+
+
+class Command(BaseCommand):
+    help = 'Add synthetic leagues, teams, rosters, fixtures and match events for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leagues', type=int, default=2)
+        parser.add_argument('--teams', type=int, default=10, help='Teams per league.')
+        parser.add_argument('--players', type=int, default=20, help='Players per team.')
+        parser.add_argument('--events', type=int, default=5000, help='Match events in total.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable data.')
+
+    def handle(self, *args, **options):
+        created = seed(
+            leagues=options['leagues'], teams=options['teams'], players=options['players'],
+            events=options['events'], seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{count} {name}' for name, count in created.items())
+            + f' (admin user {ADMIN_EMAIL})'
+        ))
@@ -0,0 +1,346 @@
+"""
+Request and live match metrics, exposed in the Prometheus text format.
+
+ServerTimingMiddleware (hockeycore.middleware) times every request: SQL
+queries (count and time, through a wrapper on each database connection),
+serialization (views using TimedSerializerMixin), rendering and the total.
+The numbers go back to the client in a Server-Timing header and into
+per-route histograms. LiveMatchConsumer and the broadcasts in events.py
+record WebSocket connections and channel layer latency here too, and the
+pooled database backends (hockeycore.dbpool) their connections and waits.
+
+Metrics are kept per process. With several workers, each /metrics response
+covers the worker that answered it; run one scrape target per worker (or a
+single worker) when exact totals matter.
+"""
+import threading
+import time
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with _lock:
+            series = sorted(self._series.items())
+            lines.extend(self._render_series(key, value) for key, value in series)
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._series.get(self._key(labels), 0)
+
+    def _render_series(self, key, value):
+        return f'{self.name}{_labels(self.labelnames, key)} {_number(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per bucket counts (not cumulative), then sum and count
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def _render_series(self, key, series):
+        counts, total, count = series
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            le = (('le', _number(float(bound))),)
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+        lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, (("le", "+Inf"),))} {count}')
+        lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}')
+        lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {count}')
+        return '\n'.join(lines)
+
+
+REQUEST_LABELS = ('route', 'method')
+
+requests_total = Counter(
+    'hockeycore_requests_total', 'HTTP requests by route, method and status.',
+    ('route', 'method', 'status'),
+)
+request_seconds = Histogram(
+    'hockeycore_request_duration_seconds', 'Total time spent on a request.', REQUEST_LABELS,
+)
+request_db_seconds = Histogram(
+    'hockeycore_request_db_seconds', 'Time a request spent in SQL queries.', REQUEST_LABELS,
+)
+request_queries = Histogram(
+    'hockeycore_request_queries', 'SQL queries made by a request.', REQUEST_LABELS, QUERY_BUCKETS,
+)
+request_serialize_seconds = Histogram(
+    'hockeycore_request_serialize_seconds', 'Time a request spent in serializers.', REQUEST_LABELS,
+)
+request_render_seconds = Histogram(
+    'hockeycore_request_render_seconds', 'Time a request spent rendering its response.', REQUEST_LABELS,
+)
+websocket_connects = Counter(
+    'hockeycore_websocket_connects_total', 'Live match WebSocket connections accepted.',
+)
+websocket_rejects = Counter(
+    'hockeycore_websocket_rejects_total', 'Live match WebSocket connections refused (unknown fixture).',
+)
+websocket_disconnects = Counter(
+    'hockeycore_websocket_disconnects_total', 'Live match WebSocket connections closed.',
+)
+websocket_open = Gauge(
+    'hockeycore_websocket_connections', 'Live match WebSocket connections currently open.',
+)
+websocket_frames = Counter(
+    'hockeycore_websocket_frames_total', 'Frames sent to live match WebSocket clients.',
+)
+channel_layer_seconds = Histogram(
+    'hockeycore_channel_layer_seconds', 'Channel layer call latency by operation and caller.',
+    ('operation', 'source'),
+)
+
+db_pool_wait_seconds = Histogram(
+    'hockeycore_db_pool_wait_seconds', 'Time spent waiting for a pooled database connection.',
+    ('alias',), WAIT_BUCKETS,
+)
+db_pool_connections = Gauge(
+    'hockeycore_db_pool_connections', 'Pooled database connections by state (in_use, idle).',
+    ('alias', 'state'),
+)
+db_pool_max_connections = Gauge(
+    'hockeycore_db_pool_max_connections', 'Most database connections the pool opens.', ('alias',),
+)
+db_pool_opened = Counter(
+    'hockeycore_db_pool_opened_total', 'Database connections opened by the pool.', ('alias',),
+)
+db_pool_closed = Counter(
+    'hockeycore_db_pool_closed_total',
+    'Pooled database connections closed, by reason (expired, idle, unhealthy, closed).',
+    ('alias', 'reason'),
+)
+db_pool_timeouts = Counter(
+    'hockeycore_db_pool_timeouts_total', 'Requests that found no pooled database connection in time.',
+    ('alias',),
+)
+
+
+def render():
+    """
+    Return every metric in the Prometheus text exposition format.
+    """
+    from . import responsecache
+
+    cache_stats = responsecache.stats()
+    lines = [metric.render() for metric in _registry]
+    for name, description in (('hits', 'served from'), ('misses', 'missing from')):
+        lines.append(f'# HELP hockeycore_response_cache_{name}_total Public responses {description} the cache.')
+        lines.append(f'# TYPE hockeycore_response_cache_{name}_total counter')
+        for endpoint, counts in cache_stats.items():
+            lines.append(
+                f'hockeycore_response_cache_{name}_total{_labels(("endpoint",), (endpoint,))} {counts[name]}'
+            )
+    return '\n'.join(lines) + '\n'
+
+
+class RequestTimings:
+    """
+    What one request spent, in seconds, filled in while it runs.
+    """
+    __slots__ = ('started', 'queries', 'db', 'serialize', 'render', 'render_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.render_started = None
+
+    def server_timing(self, total):
+        """
+        Return the Server-Timing header value (durations in milliseconds).
+        """
+        return ', '.join([
+            f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize * 1000:.2f}',
+            f'render;dur={self.render * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+
+_current = ContextVar('hockeycore_request_timings', default=None)
+
+
+def current():
+    return _current.get()
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record_request(timings, route, method, status):
+    total = time.perf_counter() - timings.started
+    labels = {'route': route, 'method': method}
+    requests_total.inc(route=route, method=method, status=status)
+    request_seconds.observe(total, **labels)
+    request_db_seconds.observe(timings.db, **labels)
+    request_queries.observe(timings.queries, **labels)
+    request_serialize_seconds.observe(timings.serialize, **labels)
+    request_render_seconds.observe(timings.render, **labels)
+    return total
+
+
+class timed(ContextDecorator):
+    """
+    Add the time spent inside to the current request's `name` timing
+    ('serialize' or 'render'). Does nothing outside a request.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = None
+
+    def _recreate_cm(self):
+        # A fresh instance per call, so nested and concurrent uses keep their own start
+        return type(self)(self.name)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        timings = _current.get()
+        if timings is not None:
+            setattr(timings, self.name, getattr(timings, self.name) + time.perf_counter() - self.started)
+        return False
+
+
+class TimedSerializerMixin:
+    """
+    View mixin counting the time its serializers take to build their output
+    towards the request's serialize timing.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        serializer.to_representation = timed('serialize')(serializer.to_representation)
+        return serializer
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def _instrument_connection(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class observe_channel_layer:
+    """
+    Async context manager timing a channel layer call into
+    channel_layer_seconds.
+    """
+
+    def __init__(self, operation, source):
+        self.operation = operation
+        self.source = source
+
+    async def __aenter__(self):
+        self.started = time.perf_counter()
+
+    async def __aexit__(self, *exc):
+        channel_layer_seconds.observe(
+            time.perf_counter() - self.started, operation=self.operation, source=self.source,
+        )
+        return False
@@ -0,0 +1,128 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+
+from . import compression, dbpool, metrics
+
+
+class ServerTimingMiddleware:
+    """
+    Times each request (SQL, serializers, rendering, total), returns the
+    breakdown in a Server-Timing header and records it in the per-route
+    histograms on /metrics. Goes first in MIDDLEWARE so the total covers
+    the rest of the stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings)
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns
+        timings = metrics.current()
+        if timings is not None:
+            timings.render_started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self.rendered(timings))
+        return response
+
+    def rendered(self, timings):
+        timings.render += time.perf_counter() - timings.render_started
+
+    def finish(self, request, response, timings):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None else 'unmatched'
+        total = metrics.record_request(timings, route, request.method, response.status_code)
+        response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+
+class CompressionMiddleware:
+    """
+    gzip/brotli-compresses responses for clients that accept it (see
+    compression). Responses that are already encoded, such as those the
+    response cache stores precompressed, pass through untouched.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if compression.compressible(response) and len(response.content) >= compression.offload_size():
+            # A large body takes milliseconds to compress; other requests
+            # on the event loop must not wait for it
+            return await sync_to_async(self.compress, thread_sensitive=False)(request, response)
+        return self.compress(request, response)
+
+    def compress(self, request, response):
+        if not compression.compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.negotiate(request)
+        if encoding is None:
+            return response
+        return compression.apply(response, encoding, compression.compress(response.content, encoding))
+
+
+class DatabaseBusyMiddleware:
+    """
+    Answers 503 with a Retry-After header, instead of a 500, when a view
+    found every pooled database connection in use for the whole pool
+    timeout (see dbpool). Nothing is wrong with the request; under a spike
+    the client should simply try again.
+    """
+    sync_capable = True
+    async_capable = True
+    retry_after = 1
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, dbpool.PoolTimeout):
+            return None
+        return JsonResponse(
+            {'detail': 'The service is busy, please try again.'},
+            status=503, headers={'Retry-After': str(self.retry_after)},
+        )
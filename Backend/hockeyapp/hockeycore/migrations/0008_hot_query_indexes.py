@@ -0,0 +1,65 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+def remove_duplicate_standings(apps, schema_editor):
+    # Keep the first row for each (league, team); the table is rebuilt from
+    # fixtures anyway, so nothing is lost
+    LeagueStanding = apps.get_model('hockeycore', 'LeagueStanding')
+    seen = set()
+    duplicates = []
+    for pk, league_id, team_id in LeagueStanding.objects.order_by('id').values_list('id', 'league_id', 'team_id'):
+        if (league_id, team_id) in seen:
+            duplicates.append(pk)
+        seen.add((league_id, team_id))
+    LeagueStanding.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hockeycore', '0007_manager_photo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fixture',
+            name='away_team_score',
+            field=models.PositiveSmallIntegerField(blank=True, default=0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='fixture',
+            name='home_team_score',
+            field=models.PositiveSmallIntegerField(blank=True, default=0, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='fixture',
+            index=models.Index(fields=['league_id', 'status', 'match_datetime'], name='fixture_league_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fixture',
+            index=models.Index(fields=['status', 'match_datetime'], name='fixture_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fixture',
+            index=models.Index(fields=['match_datetime'], name='fixture_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaguestanding',
+            index=models.Index(fields=['league_id', 'position'], name='standing_league_position_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='matchevent',
+            index=models.Index(fields=['fixture', 'minute'], name='matchevent_fixture_minute_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['last_name'], name='player_last_name_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_standings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='leaguestanding',
+            constraint=models.UniqueConstraint(fields=('league_id', 'team_id'), name='unique_league_standing'),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:29
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+STAT_FIELDS = ('goals', 'assists', 'green_cards', 'yellow_cards', 'red_cards', 'subbed_on', 'subbed_off')
+CARD_FIELDS = {'green': 'green_cards', 'yellow': 'yellow_cards', 'red': 'red_cards'}
+
+
+def backfill_player_stats(apps, schema_editor):
+    # Nothing wrote PlayerStat before; build it and the season totals from
+    # the events recorded so far
+    MatchEvent = apps.get_model('hockeycore', 'MatchEvent')
+    PlayerStat = apps.get_model('hockeycore', 'PlayerStat')
+    PlayerSeasonStat = apps.get_model('hockeycore', 'PlayerSeasonStat')
+
+    fixtures = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))
+    seasons = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))
+    rows = MatchEvent.objects.values_list(
+        'fixture_id', 'fixture__league_id', 'event_type', 'player_id',
+        'assisting_id', 'card_type', 'sub_in_id', 'sub_out_id',
+    )
+    for fixture_id, league_id, event_type, player, assisting, card_type, sub_in, sub_out in rows.iterator():
+        credits = []
+        if event_type == 'goal':
+            credits = [(player, 'goals'), (assisting, 'assists')]
+        elif event_type == 'card':
+            credits = [(player, CARD_FIELDS.get(card_type))]
+        elif event_type == 'substitution':
+            credits = [(sub_in, 'subbed_on'), (sub_out, 'subbed_off')]
+        for player_id, field in credits:
+            if player_id is not None and field is not None:
+                fixtures[fixture_id, player_id][field] += 1
+                seasons[league_id, player_id][field] += 1
+
+    PlayerStat.objects.all().delete()
+    PlayerStat.objects.bulk_create([
+        PlayerStat(fixture_id_id=fixture_id, player_id_id=player_id, **totals)
+        for (fixture_id, player_id), totals in fixtures.items()
+    ], batch_size=500)
+    PlayerSeasonStat.objects.bulk_create([
+        PlayerSeasonStat(league_id_id=league_id, player_id_id=player_id, **totals)
+        for (league_id, player_id), totals in seasons.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hockeycore', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerSeasonStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('goals', models.IntegerField(default=0)),
+                ('assists', models.IntegerField(default=0)),
+                ('green_cards', models.IntegerField(default=0)),
+                ('yellow_cards', models.IntegerField(default=0)),
+                ('red_cards', models.IntegerField(default=0)),
+                ('subbed_on', models.IntegerField(default=0)),
+                ('subbed_off', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='playerstat',
+            name='green_cards',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstat',
+            name='red_cards',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstat',
+            name='subbed_off',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstat',
+            name='subbed_on',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstat',
+            name='yellow_cards',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='playerstat',
+            constraint=models.UniqueConstraint(fields=('player_id', 'fixture_id'), name='unique_player_fixture_stat'),
+        ),
+        migrations.AddField(
+            model_name='playerseasonstat',
+            name='league_id',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hockeycore.league'),
+        ),
+        migrations.AddField(
+            model_name='playerseasonstat',
+            name='player_id',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hockeycore.player'),
+        ),
+        migrations.AddConstraint(
+            model_name='playerseasonstat',
+            constraint=models.UniqueConstraint(fields=('player_id', 'league_id'), name='unique_player_season_stat'),
+        ),
+        migrations.RunPython(backfill_player_stats, migrations.RunPython.noop),
+    ]
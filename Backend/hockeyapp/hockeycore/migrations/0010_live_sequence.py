@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hockeycore', '0009_player_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveSequence',
+            fields=[
+                ('fixture_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
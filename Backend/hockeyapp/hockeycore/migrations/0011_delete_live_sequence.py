@@ -0,0 +1,16 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:26
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hockeycore', '0010_live_sequence'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='LiveSequence',
+        ),
+    ]
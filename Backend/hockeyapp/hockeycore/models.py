@@ -3,8 +3,8 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, Permis
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password
 
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from . import directory, events, playerstats
+from .standings import FixtureResult, rebuild_league_standings
 
 class UserManager(BaseUserManager):
     def create_user(self, email, full_name, password=None, role='FAN'):
@@ -138,7 +138,69 @@ class Player(models.Model):
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
-class Fixture(models.Model):
+    class Meta:
+        indexes = [
+            # Player lists page through (last_name, id)
+            models.Index(fields=['last_name'], name='player_last_name_idx'),
+        ]
+
+class LoadedValuesMixin:
+    """
+    Remembers the field values a model instance was loaded (or last saved)
+    with, so save() can tell what changed without querying.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return
+        if fields is None:
+            attnames = [f.attname for f in self._meta.concrete_fields]
+        else:
+            attnames = [self._meta.get_field(name).attname for name in fields]
+        for attname in attnames:
+            if attname in self.__dict__:
+                loaded[attname] = self.__dict__[attname]
+
+    def _snapshot_loaded_values(self):
+        self._loaded_values = {
+            f.attname: self.__dict__[f.attname]
+            for f in self._meta.concrete_fields
+            if f.attname in self.__dict__
+        }
+
+    def loaded_value(self, attname):
+        """
+        Return the value `attname` had when the instance was loaded (or last
+        saved). Falls back to the current value for fields that were deferred.
+        """
+        loaded = getattr(self, '_loaded_values', None) or {}
+        if attname in loaded:
+            return loaded[attname]
+        return getattr(self, attname)
+
+    def changed_fields(self):
+        """
+        Return the attribute names (e.g. `status`, `home_team_id_id`) of fields
+        whose value differs from what was loaded from the database. On an
+        instance that has not been saved yet every field counts as changed.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return {f.attname for f in self._meta.concrete_fields}
+        return {
+            attname for attname, value in loaded.items()
+            if self.__dict__.get(attname, value) != value
+        }
+
+class Fixture(LoadedValuesMixin, models.Model):
     class Status(models.TextChoices):
         UPCOMING = 'UPCOMING'
         LIVE = 'LIVE'
@@ -163,6 +225,15 @@ class Fixture(models.Model):
     def __str__(self):
         return f"{self.home_team_id} vs {self.away_team_id}"
 
+    class Meta:
+        indexes = [
+            # Fixture lists filter by league and/or status and page through
+            # (match_datetime, id); standings read a league's finished fixtures
+            models.Index(fields=['league_id', 'status', 'match_datetime'], name='fixture_league_status_date_idx'),
+            models.Index(fields=['status', 'match_datetime'], name='fixture_status_date_idx'),
+            models.Index(fields=['match_datetime'], name='fixture_date_idx'),
+        ]
+
 
     @property
     def is_draw(self):
@@ -177,59 +248,44 @@ class Fixture(models.Model):
         return "TBD"
     
     def save(self, *args, **kwargs):
-        # Get the previous state if this is an update
-        old_instance = None
-        if self.pk:
-            old_instance = Fixture.objects.get(pk=self.pk)
-
-        # Check if score changed
-        score_changed = self.pk is not None and (
-            Fixture.objects.filter(pk=self.pk)
-            .exclude(home_team_score=self.home_team_score, away_team_score=self.away_team_score)
-            .exists()
-        )
-
-        # Check if status has changed
-        status_changed = self.pk is not None and (
-            Fixture.objects.filter(pk=self.pk)
-            .exclude(status=self.status)
-            .exists()
-        )
-
-        # Check if status has changed to FINISHED
-        status_changed_to_finished = (
-            old_instance and old_instance != self.status and self.status == self.Status.FINISHED
-        )
+        # Previous state is whatever was loaded from the database, if anything
+        is_update = getattr(self, '_loaded_values', None) is not None
+        changed = self.changed_fields() if is_update else set()
+        score_changed = bool(changed & {'home_team_score', 'away_team_score'})
+        status_changed = 'status' in changed
+        old_result = FixtureResult.from_values(self.loaded_value) if is_update else None
 
         # Automatically set victor when scores are updated
         if self.home_team_score is not None and self.away_team_score is not None:
             if self.home_team_score > self.away_team_score:
-                self.victor = self.home_team_id
+                self.victor_id = self.home_team_id_id
             elif self.home_team_score < self.away_team_score:
-                self.victor = self.away_team_id
+                self.victor_id = self.away_team_id_id
             else:
-                self.victor = None
+                self.victor_id = None
         super().save(*args, **kwargs)
+        self._snapshot_loaded_values()
+
+        # Season totals follow a fixture moved to another league
+        if 'league_id_id' in changed:
+            playerstats.rebuild_season_stats([old_result.league_id, self.league_id_id])
 
-        # Calculate league standings if:
-        # 1. The match was just marked as FINISIHED, or
-        # 2. Scores were updated on a FINSIHED match
-        if (status_changed_to_finished or (self.status == self.Status.FINISHED and score_changed)):
-            self.calculate_league_standings()
+        # Move the league table by the difference between the old and new
+        # result. Nothing is written unless a FINISHED result actually changed.
+        events.result_changed(old_result, FixtureResult.from_fixture(self))
 
-        # Notify group if score or status changed
+        # Notify group if score or status changed (sent once the transaction commits)
         if score_changed or status_changed:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"live_match_{self.id}",
-                {
-                    "type": "match_update",
-                    "data": {
-                        "score": self.score_display,
-                        "status": self.status,
-                    }
-                }
-            )
+            events.publish(self.id, "match_update", {
+                "score": self.score_display,
+                "status": self.status,
+            })
+
+    def delete(self, *args, **kwargs):
+        result = FixtureResult.from_fixture(self)
+        deleted = super().delete(*args, **kwargs)
+        events.result_changed(result, None)
+        return deleted
 
     def calculate_league_standings(self):
         """
@@ -239,101 +295,9 @@ class Fixture(models.Model):
         if self.status != self.Status.FINISHED:
             return
 
-        league = self.league_id
-        
-        # Get all teams in this league through LeagueTeam
-        teams_in_league = LeagueTeam.objects.filter(league=league).select_related('team')
-        
-        # Create a set of team IDs for quick lookup
-        league_team_ids = {lt.team.id for lt in teams_in_league}
-        
-        # Initialize standings dictionary with all teams in the league
-        standings = {}
-        for lt in teams_in_league:
-            standings[lt.team.id] = {  # Using team ID as key for consistency
-                'team': lt.team,       # Store the team object
-                'played': 0,
-                'wins': 0,
-                'draws': 0,
-                'losses': 0,
-                'goals_for': 0,
-                'goals_against': 0,
-                'points': 0,
-            }
-
-        # Get all finished matches in this league
-        finished_matches = Fixture.objects.filter(
-            league_id=league,
-            status=self.Status.FINISHED,
-            home_team_score__isnull=False,
-            away_team_score__isnull=False
-        )
-
-        # Process all matches to calculate standings
-        for match in finished_matches:
-            home_team = match.home_team_id
-            away_team = match.away_team_id
-            home_score = match.home_team_score or 0
-            away_score = match.away_team_score or 0
-
-            # Only process matches where both teams are in the league
-            if home_team.id not in league_team_ids or away_team.id not in league_team_ids:
-                continue
-
-            # Update home team stats
-            standings[home_team.id]['played'] += 1
-            standings[home_team.id]['goals_for'] += home_score
-            standings[home_team.id]['goals_against'] += away_score
-
-            # Update away team stats
-            standings[away_team.id]['played'] += 1
-            standings[away_team.id]['goals_for'] += away_score
-            standings[away_team.id]['goals_against'] += home_score
-
-            # Update wins/draws/losses and points
-            if home_score > away_score:
-                standings[home_team.id]['wins'] += 1
-                standings[home_team.id]['points'] += 3
-                standings[away_team.id]['losses'] += 1
-            elif home_score < away_score:
-                standings[away_team.id]['wins'] += 1
-                standings[away_team.id]['points'] += 3
-                standings[home_team.id]['losses'] += 1
-            else:  # draw
-                standings[home_team.id]['draws'] += 1
-                standings[home_team.id]['points'] += 1
-                standings[away_team.id]['draws'] += 1
-                standings[away_team.id]['points'] += 1
-
-        # Convert standings to a list and sort by points, goal difference, etc.
-        sorted_standings = sorted(
-            standings.values(),  # We already have the team objects stored
-            key=lambda x: (
-                -x['points'],  # Higher points first
-                -(x['goals_for'] - x['goals_against']),  # Better GD first
-                -x['goals_for'],  # More goals for first
-                x['team'].name  # Alphabetical as tiebreaker
-            )
-        )
+        rebuild_league_standings(self.league_id_id)
 
-        # Update or create LeagueStanding records
-        for position, stats in enumerate(sorted_standings, start=1):
-            LeagueStanding.objects.update_or_create(
-                league_id=league,
-                team_id=stats['team'],
-                defaults={
-                    'played': stats['played'],
-                    'wins': stats['wins'],
-                    'draws': stats['draws'],
-                    'losses': stats['losses'],
-                    'goals_for': stats['goals_for'],
-                    'goals_against': stats['goals_against'],
-                    'points': stats['points'],
-                    'position': position,
-                }
-            )
-
-class MatchEvent(models.Model):
+class MatchEvent(LoadedValuesMixin, models.Model):
     class Action(models.TextChoices):
         GOAL = 'goal', 'Goal'
         CARD = 'card', 'Card'
@@ -372,54 +336,80 @@ class MatchEvent(models.Model):
     )
 
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
+        is_update = getattr(self, '_loaded_values', None) is not None
+        old_stats = playerstats.event_contribution(self.loaded_value) if is_update else None
         super().save(*args, **kwargs)
+        self._snapshot_loaded_values()
+
+        # Deletions are handled by a post_delete receiver, which also sees
+        # events deleted along with their fixture or player
+        leagues = None
+        if MatchEvent.fixture.is_cached(self):
+            leagues = {self.fixture_id: self.fixture.league_id_id}
+        playerstats.apply_event_change(
+            old_stats,
+            playerstats.event_contribution(lambda attname: getattr(self, attname)),
+            leagues,
+        )
+
+        if events.broadcasts_suppressed():
+            return
 
         # Notify the WS group of the new/updated event
-        channel_layer = get_channel_layer()
+        events.publish(self.fixture_id, "match_event", self.broadcast_payload())
+
+    def broadcast_payload(self):
+        """
+        The live match representation of this event, as sent to WebSocket clients.
+        Names come from the in-process directory, not the related rows.
+        """
+        people = directory.get_directory()
+
+        def person(field):
+            record = people.player(getattr(self, f'{field}_id'), lambda: getattr(self, field))
+            return {'id': record.id, 'name': record.name} if record else None
+
+        player = people.player(self.player_id, lambda: self.player)
+        team = people.team(player.team_id, lambda: self.player.team_id)
         payload = {
+            'id':          self.id,
             'event_type': self.event_type,
             'minute':      self.minute,
             # team inferred from player.team_id
             'team':        {
-                'id': self.player.team_id.id,
-                'name': self.player.team_id.name
+                'id': team.id,
+                'name': team.name
             },
             'player': {
-                'id':   self.player.id,
-                'name': f"{self.player.first_name} {self.player.last_name}"
+                'id':   player.id,
+                'name': player.name
             },
             'time': self.minute,
         }
-        
+
         if self.event_type == MatchEvent.Action.GOAL:
             payload.update({
-                'assistant': (
-                    { 'id': self.assisting.id,
-                      'name': f"{self.assisting.first_name} {self.assisting.last_name}" }
-                    if self.assisting else None
-                )
+                'assistant': person('assisting')
             })
         elif self.event_type == MatchEvent.Action.CARD:
             payload['card_type'] = self.card_type
         elif self.event_type == MatchEvent.Action.SUBSTITUTION:
             payload.update({
-                'player_in':  {'id': self.sub_in.id,  'name': f"{self.sub_in.first_name} {self.sub_in.last_name}"},
-                'player_out': {'id': self.sub_out.id, 'name': f"{self.sub_out.first_name} {self.sub_out.last_name}"}
+                'player_in':  person('sub_in'),
+                'player_out': person('sub_out')
             })
         # injury needs no extras beyond player/time
-
-        async_to_sync(channel_layer.group_send)(
-            f"live_match_{self.fixture.id}",
-            {
-                "type": "match_event",  
-                "data": payload
-            }
-        )
+        return payload
     
     def __str__(self):
         return f"{self.player_id} - {self.event_type} at {self.minute}'"
 
+    class Meta:
+        indexes = [
+            # A fixture's events are always read in match order
+            models.Index(fields=['fixture', 'minute'], name='matchevent_fixture_minute_idx'),
+        ]
+
        
 
 class PlayerStat(models.Model):
@@ -429,10 +419,44 @@ class PlayerStat(models.Model):
     assists = models.IntegerField(default=0)
     minutes_played = models.IntegerField(default=0)
     penalties_minutes = models.IntegerField(default=0)
+    green_cards = models.IntegerField(default=0)
+    yellow_cards = models.IntegerField(default=0)
+    red_cards = models.IntegerField(default=0)
+    subbed_on = models.IntegerField(default=0)
+    subbed_off = models.IntegerField(default=0)
 
     def __str__(self):
         return f"{self.player_id} stats for {self.fixture_id}"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['player_id', 'fixture_id'], name='unique_player_fixture_stat'),
+        ]
+
+class PlayerSeasonStat(models.Model):
+    """
+    A player's PlayerStat totals over one league season, kept current by
+    hockeycore.playerstats.
+    """
+    player_id = models.ForeignKey(Player, on_delete=models.CASCADE)
+    league_id = models.ForeignKey(League, on_delete=models.CASCADE)
+    goals = models.IntegerField(default=0)
+    assists = models.IntegerField(default=0)
+    green_cards = models.IntegerField(default=0)
+    yellow_cards = models.IntegerField(default=0)
+    red_cards = models.IntegerField(default=0)
+    subbed_on = models.IntegerField(default=0)
+    subbed_off = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.player_id} stats for {self.league_id}"
+
+    class Meta:
+        constraints = [
+            # Also the index a player's profile is read through
+            models.UniqueConstraint(fields=['player_id', 'league_id'], name='unique_player_season_stat'),
+        ]
+
 class LeagueStanding(models.Model):
     league_id = models.ForeignKey(League, on_delete=models.CASCADE)
     team_id = models.ForeignKey(Team, on_delete=models.CASCADE) 
@@ -449,4 +473,11 @@ class LeagueStanding(models.Model):
         return f"{self.team_id} - Position {self.position}"
 
     class Meta:
-        ordering = ['position']
\ No newline at end of file
+        ordering = ['position']
+        indexes = [
+            models.Index(fields=['league_id', 'position'], name='standing_league_position_idx'),
+        ]
+        constraints = [
+            # One row per team per league; the standings upsert relies on it
+            models.UniqueConstraint(fields=['league_id', 'team_id'], name='unique_league_standing'),
+        ]
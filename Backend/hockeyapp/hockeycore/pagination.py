@@ -0,0 +1,284 @@
+"""
+Keyset pagination for list endpoints.
+
+Pages are cut with a WHERE on the ordering key of the last row seen rather
+than an OFFSET, so every page costs the same however deep it is. The key is
+the view's ordering (the `?ordering=` chosen through OrderingFilter, or the
+view's `ordering`) with the primary key appended as a tie-breaker, e.g.
+(match_datetime, id) for fixtures.
+
+Responses stay a plain JSON list, as the app expects; the neighbouring pages
+are given in a Link header:
+
+    Link: <https://.../publicplayers/?cursor=...>; rel="next",
+          <https://.../publicplayers/?cursor=...>; rel="prev"
+
+Every list is paged, so no response carries a whole table. `?page_size=`
+picks the page size, up to `max_page_size`; the default is
+REST_FRAMEWORK['PAGE_SIZE']. Clients that want every row follow the next
+links. values() querysets page too (the key columns are added to the
+rows), and only() ones load the key columns with the rest.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    # Used when the view has no ordering of its own
+    ordering = ('pk',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request, view)
+        if page is None:
+            return None
+        return self.cut(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for async views, reading the page with the
+        async ORM.
+        """
+        page = self.page_queryset(queryset, request, view)
+        if page is None:
+            return None
+        return self.cut([row async for row in page])
+
+    def page_queryset(self, queryset, request, view=None):
+        """
+        The queryset of the requested page plus one row (to tell whether
+        there is another), or None if paging is off.
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.keys = self.get_keys(request, queryset, view)
+        self.cursor_position, self.reverse = self.decode_cursor(request)
+
+        keys = [(field, not descending if self.reverse else descending, final)
+                for field, descending, final in self.keys]
+        if queryset._fields is not None:
+            # values() rows need the key columns to give a position
+            missing = [lookup for lookup, _, _ in self.keys if lookup not in queryset._fields]
+            if missing:
+                queryset = queryset.values(*queryset._fields, *missing)
+        else:
+            loaded, deferred = queryset.query.deferred_loading
+            if loaded and not deferred:
+                # only() querysets (?fields=) load the key columns with the rest,
+                # rather than one by one from the last row
+                missing = [
+                    lookup for lookup, _, _ in self.keys
+                    if lookup != 'pk' and '__' not in lookup and lookup not in loaded
+                ]
+                if missing:
+                    queryset = queryset.only(*loaded, *missing)
+        queryset = queryset.order_by(*(self.order_expression(key) for key in keys))
+        if self.cursor_position is not None:
+            queryset = queryset.filter(self.after(keys, self.cursor_position))
+        return queryset[:self.page_size + 1]
+
+    def cut(self, rows):
+        """
+        The page from the rows page_queryset() returned; notes the
+        neighbouring pages' positions.
+        """
+        position, reverse = self.cursor_position, self.reverse
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Coming back from a later page there is always a next one, and
+        # arriving from an earlier one there is always a previous one
+        has_next = has_more if not reverse else position is not None
+        has_previous = has_more if reverse else position is not None
+        self.next_position = self.position(rows[-1]) if has_next and rows else None
+        self.previous_position = self.position(rows[0]) if has_previous and rows else None
+        return rows
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+            except (KeyError, ValueError):
+                pass
+            else:
+                if size > 0:
+                    return min(size, self.max_page_size) if self.max_page_size else size
+        return self.page_size
+
+    # Ordering key
+
+    def get_ordering(self, request, queryset, view):
+        for backend in getattr(view, 'filter_backends', []):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, queryset, view)
+                if ordering:
+                    return list(ordering)
+        return list(getattr(view, 'ordering', None) or self.ordering)
+
+    def get_keys(self, request, queryset, view):
+        """
+        Return [(lookup, descending, model field)] for the ordering, ending in
+        the primary key so that every row has a distinct position.
+        """
+        keys = []
+        for item in self.get_ordering(request, queryset, view):
+            lookup = item.lstrip('-')
+            final = self.final_field(queryset.model, lookup)
+            keys.append((lookup, item.startswith('-'), final))
+            if final.primary_key and '__' not in lookup:
+                return keys
+        keys.append(('pk', False, queryset.model._meta.pk))
+        return keys
+
+    def final_field(self, model, lookup):
+        field = None
+        for name in lookup.split('__'):
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            if field.is_relation:
+                model = field.related_model
+        return field.target_field if field.is_relation else field
+
+    def order_expression(self, key):
+        lookup, descending, final = key
+        if not final.null:
+            return f"-{lookup}" if descending else lookup
+        # Pin down where NULLs go; descending is then the exact reverse
+        if descending:
+            return F(lookup).desc(nulls_last=True)
+        return F(lookup).asc(nulls_first=True)
+
+    def after(self, keys, position):
+        """
+        Rows strictly after `position` in the order given by `keys`:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (lookup, descending, _), value in zip(keys, position):
+            condition |= equal & self.beyond(lookup, descending, value)
+            equal &= Q(**{f"{lookup}__isnull": True}) if value is None else Q(**{lookup: value})
+
+        # Bound the first column on its own too, so the database can seek
+        # straight to the position on an index
+        lookup, descending, _ = keys[0]
+        if position[0] is not None:
+            bound = Q(**{f"{lookup}__{'lte' if descending else 'gte'}": position[0]})
+            if descending and keys[0][2].null:
+                bound |= Q(**{f"{lookup}__isnull": True})
+            condition = bound & condition
+        return condition
+
+    def beyond(self, lookup, descending, value):
+        # NULLs come first ascending and last descending (see order_expression)
+        if value is None:
+            return Q(pk__in=[]) if descending else Q(**{f"{lookup}__isnull": False})
+        if descending:
+            return Q(**{f"{lookup}__lt": value}) | Q(**{f"{lookup}__isnull": True})
+        return Q(**{f"{lookup}__gt": value})
+
+    def position(self, obj):
+        if isinstance(obj, dict):
+            return [obj[lookup] for lookup, _, _ in self.keys]
+        values = []
+        for lookup, _, _ in self.keys:
+            value = obj
+            *path, last = lookup.split('__')
+            for name in path:
+                value = getattr(value, name) if value is not None else None
+            if value is not None and last == 'pk':
+                value = value.pk
+            elif value is not None:
+                # A foreign key orders by its raw id
+                value = getattr(value, value._meta.get_field(last).attname)
+            values.append(value)
+        return values
+
+    # Cursors
+
+    def signature(self):
+        return [f"{'-' if descending else ''}{lookup}" for lookup, descending, _ in self.keys]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if cursor['o'] != self.signature() or len(cursor['v']) != len(self.keys):
+                raise ValueError
+            position = [
+                None if value is None else final.to_python(value)
+                for (_, _, final), value in zip(self.keys, cursor['v'])
+            ]
+            return position, bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        cursor = {'o': self.signature(), 'v': position}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, cls=DjangoJSONEncoder).encode('ascii'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_link_header(self):
+        links = []
+        for rel, url in (('next', self.get_next_link()), ('prev', self.get_previous_link())):
+            if url is not None:
+                links.append(f'<{url}>; rel="{rel}"')
+        return ', '.join(links) or None
+
+    def get_paginated_response(self, data):
+        link = self.get_link_header()
+        return Response(data, headers={'Link': link} if link else None)
+
+    def get_paginated_response_schema(self, schema):
+        return schema
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,223 @@
+"""
+Player statistics.
+
+PlayerStat holds a player's counts for one fixture and PlayerSeasonStat the
+same counts summed over a league (one season of a competition). Both are
+kept current from MatchEvent: when an event is created, edited or deleted we
+take away the counts it used to contribute and add the ones it contributes
+now, with in-place increments on the few rows involved.
+
+rebuild_player_stats() recomputes everything from the events, for backfills.
+"""
+from collections import defaultdict
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete
+
+from . import leaderboards
+from .responsecache import invalidate
+
+STAT_FIELDS = ('goals', 'assists', 'green_cards', 'yellow_cards', 'red_cards', 'subbed_on', 'subbed_off')
+
+CARD_FIELDS = {'green': 'green_cards', 'yellow': 'yellow_cards', 'red': 'red_cards'}
+
+
+def event_lines(value):
+    """
+    Return {player_id: {stat: count}} for what one event contributes, from
+    `value(attname)` (an event's current or loaded values).
+    """
+    from .models import MatchEvent
+
+    lines = {}
+
+    def add(player_id, field):
+        if player_id is not None and field is not None:
+            line = lines.setdefault(player_id, dict.fromkeys(STAT_FIELDS, 0))
+            line[field] += 1
+
+    event_type = value('event_type')
+    if event_type == MatchEvent.Action.GOAL:
+        add(value('player_id'), 'goals')
+        add(value('assisting_id'), 'assists')
+    elif event_type == MatchEvent.Action.CARD:
+        add(value('player_id'), CARD_FIELDS.get(value('card_type')))
+    elif event_type == MatchEvent.Action.SUBSTITUTION:
+        add(value('sub_in_id'), 'subbed_on')
+        add(value('sub_out_id'), 'subbed_off')
+    return lines
+
+
+def event_contribution(value):
+    """
+    Return (fixture_id, {player_id: {stat: count}}) for an event, or None if
+    it counts towards nothing.
+    """
+    lines = event_lines(value)
+    if not lines:
+        return None
+    return value('fixture_id'), lines
+
+
+def apply_event_change(old, new, leagues=None):
+    """
+    Move the stats by the difference between an event's old and new
+    contribution (either may be None). `leagues` maps fixture ids to league
+    ids where the caller already knows them.
+    """
+    deltas = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))
+    for contribution, sign in ((old, -1), (new, 1)):
+        if contribution is None:
+            continue
+        fixture_id, lines = contribution
+        for player_id, line in lines.items():
+            delta = deltas[fixture_id, player_id]
+            for field, count in line.items():
+                delta[field] += sign * count
+
+    deltas = {key: delta for key, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return
+
+    from .models import Fixture, PlayerSeasonStat, PlayerStat
+
+    leagues = dict(leagues or {})
+    missing = {fixture_id for fixture_id, _ in deltas} - set(leagues)
+    if missing:
+        leagues.update(Fixture.objects.filter(pk__in=missing).values_list('id', 'league_id'))
+
+    with transaction.atomic():
+        seasons = set()
+        for (fixture_id, player_id), delta in deltas.items():
+            _add(PlayerStat, {'player_id_id': player_id, 'fixture_id_id': fixture_id}, delta)
+            if fixture_id in leagues:
+                _add(PlayerSeasonStat, {'player_id_id': player_id, 'league_id_id': leagues[fixture_id]}, delta)
+                seasons.add((leagues[fixture_id], player_id))
+        # Updates through the queryset send no signals
+        invalidate('playerstats')
+
+        if seasons:
+            # Hand the rows as they now stand to the leaderboards once committed
+            totals = {key: {} for key in seasons}
+            rows = PlayerSeasonStat.objects.filter(
+                league_id__in={league_id for league_id, _ in seasons},
+                player_id__in={player_id for _, player_id in seasons},
+            ).values('league_id', 'player_id', *STAT_FIELDS)
+            for row in rows:
+                key = (row.pop('league_id'), row.pop('player_id'))
+                if key in totals:
+                    totals[key] = row
+            transaction.on_commit(partial(leaderboards.season_changed, totals))
+
+
+def _add(model, keys, delta):
+    """
+    Add `delta` to the row identified by `keys`, creating it for additions
+    and dropping it once every count is back to zero.
+    """
+    changes = {field: F(field) + count for field, count in delta.items() if count}
+    if model.objects.filter(**keys).update(**changes):
+        if any(count < 0 for count in delta.values()):
+            model.objects.filter(**keys, **_empty(model)).delete()
+        return
+
+    # No row yet. Removing counts from a row that is already gone (its
+    # fixture or league being deleted) leaves nothing to do.
+    initial = {field: count for field, count in delta.items() if count > 0}
+    if not initial:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **initial)
+    except IntegrityError:
+        # Created concurrently; add to that row instead
+        model.objects.filter(**keys).update(**changes)
+
+
+def _empty(model):
+    return {
+        field.attname: 0 for field in model._meta.concrete_fields
+        if field.get_internal_type() == 'IntegerField'
+    }
+
+
+def _event_deleted(sender, instance, **kwargs):
+    # Also runs for events deleted along with their fixture or player
+    apply_event_change(event_contribution(instance.loaded_value), None)
+
+
+post_delete.connect(_event_deleted, sender='hockeycore.MatchEvent')
+
+
+def rebuild_season_stats(league_ids=None):
+    """
+    Recompute PlayerSeasonStat for `league_ids` (or every league) by summing
+    the PlayerStat rows of their fixtures.
+    """
+    from .models import PlayerSeasonStat, PlayerStat
+
+    stats = PlayerStat.objects.all()
+    seasons = PlayerSeasonStat.objects.all()
+    if league_ids is not None:
+        stats = stats.filter(fixture_id__league_id__in=league_ids)
+        seasons = seasons.filter(league_id__in=league_ids)
+
+    totals = stats.values('player_id', 'fixture_id__league_id').annotate(
+        **{f'total_{field}': Sum(field) for field in STAT_FIELDS}
+    )
+    with transaction.atomic():
+        seasons.delete()
+        PlayerSeasonStat.objects.bulk_create(
+            [
+                PlayerSeasonStat(
+                    player_id_id=row['player_id'],
+                    league_id_id=row['fixture_id__league_id'],
+                    **{field: row[f'total_{field}'] for field in STAT_FIELDS},
+                )
+                for row in totals
+            ],
+            batch_size=500,
+        )
+        invalidate('playerstats')
+        transaction.on_commit(partial(leaderboards.reload, league_ids))
+
+
+def rebuild_player_stats(fixture_ids=None):
+    """
+    Recompute PlayerStat from the events of `fixture_ids` (or every fixture),
+    then the season totals of the leagues involved.
+    """
+    from .models import Fixture, MatchEvent, PlayerStat
+
+    events = MatchEvent.objects.all()
+    stats = PlayerStat.objects.all()
+    if fixture_ids is not None:
+        events = events.filter(fixture_id__in=fixture_ids)
+        stats = stats.filter(fixture_id__in=fixture_ids)
+
+    totals = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))
+    fields = ('fixture_id', 'event_type', 'player_id', 'assisting_id', 'card_type', 'sub_in_id', 'sub_out_id')
+    for row in events.values(*fields).iterator():
+        for player_id, line in event_lines(row.get).items():
+            total = totals[row['fixture_id'], player_id]
+            for field, count in line.items():
+                total[field] += count
+
+    with transaction.atomic():
+        stats.delete()
+        PlayerStat.objects.bulk_create(
+            [
+                PlayerStat(player_id_id=player_id, fixture_id_id=fixture_id, **total)
+                for (fixture_id, player_id), total in totals.items()
+            ],
+            batch_size=500,
+        )
+
+        league_ids = None
+        if fixture_ids is not None:
+            league_ids = list(
+                Fixture.objects.filter(pk__in=fixture_ids).values_list('league_id', flat=True).distinct()
+            )
+        rebuild_season_stats(league_ids)
@@ -0,0 +1,178 @@
+"""
+Fast path for large read-only lists.
+
+A DRF serializer reads every column of every row through a field object:
+get_attribute() walks the source, then to_representation() formats the
+value. For a few hundred rows that is most of the request. A Projection is
+worked out once from the serializer class instead. It selects exactly the
+columns the serializer reads, joined names included, with values(), and
+formats each one with the plain function the field's to_representation
+amounts to (int, str, isoformat, ...). Team columns come from the directory,
+as in TeamAttributeField.
+
+The output is the serializer's, key for key and value for value; a
+serializer field the projection does not know how to copy exactly is an
+error when the projection is built, not a silent difference.
+
+Views opt in with ProjectedListMixin. A ?fields= selection (see fieldsets)
+gets its own projection, selecting fewer columns.
+"""
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from rest_framework import fields as drf_fields
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from . import directory, fieldsets
+from .metrics import timed
+from .serializers import TeamAttributeField
+
+_projections = {}
+MAX_PROJECTIONS = 256
+
+
+def _iso_date(value):
+    return value if isinstance(value, str) else value.isoformat()
+
+
+def _same(value):
+    return value
+
+
+class Projection:
+    """
+    The values() columns and per-column formatting equivalent to one
+    serializer class.
+    """
+
+    def __init__(self, serializer_class, selection=None):
+        # A ?fields= selection trims the serializer's fields, and so the columns
+        serializer = serializer_class(context={fieldsets.CONTEXT_KEY: selection})
+        model = serializer.Meta.model
+        self.serializer_class = serializer_class
+        self.columns = []
+        # (output key, column, formatter, team attribute or None)
+        self.fields = []
+        for field in serializer._readable_fields:
+            if isinstance(field, TeamAttributeField):
+                column = self._column(model, f'{field.team_field}_id')
+                self.fields.append((field.field_name, column, None, field.attribute))
+            else:
+                column = self._column(model, '__'.join(field.source_attrs))
+                self.fields.append((field.field_name, column, self._formatter(field), None))
+            if column not in self.columns:
+                self.columns.append(column)
+
+    def _column(self, model, path):
+        """
+        The values() lookup for a serializer source, e.g. 'league_id__name';
+        raw foreign key ids ('home_team_id_id') by their field name.
+        """
+        *relations, last = path.split('__')
+        target = model
+        for name in relations:
+            target = target._meta.get_field(name).related_model
+        try:
+            target._meta.get_field(last)
+        except FieldDoesNotExist:
+            for field in target._meta.concrete_fields:
+                if field.attname == last:
+                    return '__'.join([*relations, field.name])
+            raise ImproperlyConfigured(f'{self.serializer_class.__name__}: no column for {path!r}')
+        return path
+
+    def _formatter(self, field):
+        representation = type(field).to_representation
+        if representation is drf_fields.IntegerField.to_representation:
+            return int
+        if representation is drf_fields.CharField.to_representation:
+            return str
+        if representation is drf_fields.ChoiceField.to_representation:
+            choices = field.choice_strings_to_values
+            return lambda value: choices.get(str(value), value)
+        if representation is drf_fields.DateField.to_representation:
+            output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+            if output_format is None:
+                return _same
+            if output_format.lower() == drf_fields.ISO_8601:
+                return _iso_date
+        if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+            # values() gives the raw id, which is what the field outputs
+            return _same
+        raise ImproperlyConfigured(
+            f'{self.serializer_class.__name__}.{field.field_name}: '
+            f'{type(field).__name__} cannot be projected'
+        )
+
+    @property
+    def team_columns(self):
+        return {column for _, column, _, team_attribute in self.fields if team_attribute is not None}
+
+    def render(self, rows, people=None):
+        """
+        Return the serializer's output for `rows` (values() dicts), naming
+        teams from `people` (this process's directory by default).
+        """
+        if people is None:
+            people = directory.get_directory()
+        teams = people.teams
+        fields = self.fields
+        output = []
+        for row in rows:
+            item = {}
+            for key, column, formatter, team_attribute in fields:
+                value = row[column]
+                if team_attribute is not None:
+                    record = teams.get(value)
+                    if record is None and value is not None:
+                        record = people.team(value, partial(_team, value))
+                    item[key] = getattr(record, team_attribute) if record is not None else None
+                elif value is None:
+                    item[key] = None
+                else:
+                    item[key] = formatter(value)
+            output.append(item)
+        return output
+
+
+def _team(team_id):
+    from .models import Team
+
+    return Team.objects.get(pk=team_id)
+
+
+def projection_for(serializer_class, selection=None):
+    key = (serializer_class, selection.key() if selection is not None else None)
+    projection = _projections.get(key)
+    if projection is None:
+        projection = Projection(serializer_class, selection)
+        # Selections come from query strings; keep a bounded number of them
+        if selection is None or len(_projections) < MAX_PROJECTIONS:
+            _projections[key] = projection
+    return projection
+
+
+class ProjectedListMixin:
+    """
+    Serve list responses through the serializer's Projection. Other
+    actions, and any code that asks for a serializer, are unchanged.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.projected_response(self.filter_queryset(self.get_queryset()))
+
+    def projected_response(self, queryset, paginate=True):
+        selection = self.get_serializer_context().get(fieldsets.CONTEXT_KEY)
+        projection = projection_for(self.get_serializer_class(), selection)
+        rows = queryset.values(*projection.columns)
+        if paginate:
+            page = self.paginate_queryset(rows)
+            if page is not None:
+                with timed('serialize'):
+                    data = projection.render(page)
+                return self.get_paginated_response(data)
+        with timed('serialize'):
+            data = projection.render(rows)
+        return Response(data)
@@ -0,0 +1,81 @@
+"""
+EXPLAIN helpers for checking that hot queries are served from an index.
+
+    full_scans(sql)  ->  ['hockeycore_player', ...]
+
+lists the tables a statement reads with a full table scan. The SQL is run
+as is, so pass it with its parameters already filled in, as captured by
+CaptureQueriesContext or connection.queries. SQLite (tests, local
+development), MySQL and PostgreSQL are understood.
+"""
+import json
+import re
+
+from django.db import connections
+
+
+def explain(sql, using='default'):
+    """
+    Return the plan for `sql`: (id, parent, notused, detail) rows on SQLite,
+    the decoded JSON plan elsewhere.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return cursor.fetchall()
+        if connection.vendor == 'mysql':
+            cursor.execute(f"EXPLAIN FORMAT=JSON {sql}")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+        else:
+            raise NotImplementedError(f"No EXPLAIN support for {connection.vendor}")
+        plan = cursor.fetchone()[0]
+        return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def _walk(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _walk(item)
+
+
+def full_scans(sql, using='default'):
+    """
+    Return the tables `sql` reads with a full table scan.
+    """
+    connection = connections[using]
+    plan = explain(sql, using)
+
+    if connection.vendor == 'sqlite':
+        details = [row[-1] for row in plan]
+        scans = [
+            detail.split()[1] for detail in details
+            if detail.startswith('SCAN ') and ' USING ' not in detail
+            and not detail.startswith('SCAN CONSTANT ROW')
+        ]
+        # SQLite also shows a walk of the outermost table in primary key
+        # order as a plain SCAN. With nothing left to sort it stops after
+        # LIMIT rows, so that one is fine.
+        sorted_after = any(detail.startswith('USE TEMP B-TREE') for detail in details)
+        if (
+            len(scans) == 1 and details[0].startswith(f"SCAN {scans[0]}")
+            and not sorted_after and re.search(r'\bLIMIT\b', sql, re.IGNORECASE)
+        ):
+            return []
+        return scans
+
+    if connection.vendor == 'mysql':
+        return [
+            node['table_name'] for node in _walk(plan)
+            if node.get('access_type') == 'ALL' and 'table_name' in node
+        ]
+
+    return [
+        node['Relation Name'] for node in _walk(plan)
+        if node.get('Node Type') == 'Seq Scan'
+    ]
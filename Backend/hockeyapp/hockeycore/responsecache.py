@@ -0,0 +1,253 @@
+"""
+Response cache for the public read-only endpoints.
+
+Rendered responses are stored in the RESPONSE_CACHE_ALIAS cache ('default'
+unless set) with no timeout, keyed by the full request URL,
+the Accept header and a version token for every resource the endpoint
+reads. Writing a row of one of those resources replaces its token, so the
+old entries are simply never looked up again and the backend's own culling
+clears them out. Compressed copies of a response (see compression) are
+stored next to it under the same key plus the encoding, so they go stale
+with it.
+
+Model saves and deletes invalidate through signals. Bulk writes that skip
+signals (the standings upsert) call invalidate() themselves. Inside a
+transaction the tokens are replaced straight away and again on commit, so a
+request that read the uncommitted state in between cannot leave a stale
+entry behind under the new token.
+"""
+import hashlib
+import threading
+import uuid
+import weakref
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+from . import compression
+
+KEY_PREFIX = 'hockeycore:responses'
+
+# Response headers stored along with the body
+CACHED_HEADERS = ('Content-Type', 'Link')
+
+# Resources whose cached responses go stale when a row of the model changes
+MODEL_RESOURCES = {
+    'hockeycore.league': ('leagues',),
+    'hockeycore.team': ('teams',),
+    'hockeycore.leagueteam': ('leagues', 'teams'),
+    'hockeycore.manager': ('managers',),
+    'hockeycore.player': ('players',),
+    'hockeycore.fixture': ('fixtures',),
+    'hockeycore.matchevent': ('matchevents',),
+    'hockeycore.leaguestanding': ('standings',),
+    'hockeycore.playerstat': ('playerstats',),
+    'hockeycore.playerseasonstat': ('playerstats',),
+}
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+hits = Counter()
+misses = Counter()
+
+
+def _cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(resource):
+    return f"{KEY_PREFIX}:version:{resource}"
+
+
+def _new_token():
+    # Random rather than a counter: if the backend evicts a version key we
+    # must never hand out a token that old entries were stored under
+    return uuid.uuid4().hex
+
+
+def versions(resources):
+    """
+    Return the current version token of each resource, creating missing ones.
+    """
+    cache = _cache()
+    keys = [_version_key(resource) for resource in resources]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_token(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bump(resources):
+    _cache().set_many({_version_key(resource): _new_token() for resource in resources}, None)
+
+
+class _PendingInvalidation:
+    """
+    Resources written in the current transaction, bumped once more on commit.
+
+    Its on_commit hook holds the only strong reference to it, so it goes
+    away with the savepoint or transaction it was registered in when that
+    rolls back.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.resources = set()
+
+    def flush(self):
+        _pending().pop(self.alias, None)
+        _bump(self.resources)
+
+
+def _pending():
+    if not hasattr(_local, 'pending'):
+        _local.pending = {}
+    return _local.pending
+
+
+def invalidate(*resources):
+    """
+    Mark every cached response that reads any of `resources` as stale.
+    """
+    _bump(resources)
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return
+
+    pending_ref = _pending().get(connection.alias)
+    pending = pending_ref() if pending_ref is not None else None
+    if pending is None:
+        # First write in this transaction, or the last hook was rolled back
+        pending = _PendingInvalidation(connection.alias)
+        _pending()[connection.alias] = weakref.ref(pending)
+        transaction.on_commit(pending.flush)
+
+    pending.resources.update(resources)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _invalidate_model(sender, **kwargs):
+    resources = MODEL_RESOURCES.get(sender._meta.label_lower)
+    if resources:
+        invalidate(*resources)
+
+
+@receiver(m2m_changed)
+def _invalidate_m2m(sender, action, **kwargs):
+    resources = MODEL_RESOURCES.get(sender._meta.label_lower)
+    if resources and action.startswith('post_'):
+        invalidate(*resources)
+
+
+def stats():
+    """
+    Hit/miss counts per endpoint since this process started.
+    """
+    with _stats_lock:
+        endpoints = sorted(set(hits) | set(misses))
+        return {
+            endpoint: {'hits': hits[endpoint], 'misses': misses[endpoint]}
+            for endpoint in endpoints
+        }
+
+
+def _count(counter, endpoint):
+    with _stats_lock:
+        counter[endpoint] += 1
+
+
+def cache_key(request, endpoint, resources):
+    """
+    The cache key of the response to `request`, given the current version
+    of every resource it reads.
+    """
+    query = sorted(request.GET.lists())
+    url = f"{request.scheme}://{request.get_host()}{request.path}?{query}"
+    digest = hashlib.md5(
+        f"{url}|{request.META.get('HTTP_ACCEPT', '')}".encode()
+    ).hexdigest()
+    tokens = '.'.join(versions(resources))
+    return f"{KEY_PREFIX}:{endpoint}:{hashlib.md5(tokens.encode()).hexdigest()}:{digest}"
+
+
+def lookup(request, endpoint, key):
+    """
+    Return the cached response for `key`, compressed as `request` accepts,
+    or None on a miss. Counts the hit or miss.
+    """
+    encoding = compression.negotiate(request)
+    encoded_key = f'{key}:{encoding}'
+    found = _cache().get_many([key, encoded_key] if encoding else [key])
+    cached = found.get(key)
+    if cached is None:
+        _count(misses, endpoint)
+        return None
+
+    _count(hits, endpoint)
+    status, headers, content = cached
+    response = HttpResponse(content, status=status, headers=headers)
+    response['X-Cache'] = 'HIT'
+    if encoding is not None and compression.compressible(response):
+        encoded = found.get(encoded_key)
+        if encoded is None:
+            # First request for this encoding since the entry was stored
+            encoded = compression.compress(content, encoding, cached=True)
+            _cache().set(encoded_key, encoded, None)
+        compression.apply(response, encoding, encoded)
+    return response
+
+
+def store(request, key, response):
+    """
+    Cache rendered `response` under `key`, with a compressed copy for the
+    encoding `request` accepts, which `response` is then sent with.
+    """
+    encoding = compression.negotiate(request)
+    headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+    entries = {key: (response.status_code, headers, response.content)}
+    if encoding is not None and compression.compressible(response):
+        entries[f'{key}:{encoding}'] = compression.compress(response.content, encoding, cached=True)
+        compression.apply(response, encoding, entries[f'{key}:{encoding}'])
+    _cache().set_many(entries, None)
+
+
+class CachedResponseMixin:
+    """
+    Serve GET requests from the response cache.
+
+    `cache_resources` lists every resource the viewset's responses read,
+    including related rows its serializer pulls in.
+    """
+    cache_resources = ()
+
+    def cache_endpoint(self):
+        return self.basename
+
+    def response_cache_key(self, request):
+        return cache_key(request, self.cache_endpoint(), self.cache_resources)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or not self.cache_resources:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self.response_cache_key(request)
+        response = lookup(request, self.cache_endpoint(), key)
+        if response is not None:
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        response['X-Cache'] = 'MISS'
+        if response.status_code == 200:
+            if hasattr(response, 'add_post_render_callback'):
+                response.add_post_render_callback(lambda rendered: store(request, key, rendered))
+            else:
+                store(request, key, response)
+        return response
@@ -0,0 +1,242 @@
+"""
+Season schedules.
+
+generate() builds a league's double round robin from its LeagueTeam members:
+one round every `days_between_rounds` days from the start date, each match
+at the home team's venue. Before anything is written the planned fixtures
+are checked, together with the fixtures already booked for those teams and
+venues, for double bookings:
+
+  - a team may not play twice within `rest_days` days,
+  - a venue hosts one match a day.
+
+Each booking is an interval of days in an IntervalIndex, so every check is a
+binary search rather than a scan of the season. Rescheduling a season under
+way (`replace`) leaves out the matches already played or live. A clash raises
+ScheduleConflict listing every one found; otherwise the whole schedule goes
+in with one bulk_create, in one transaction.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import events, search
+from .responsecache import invalidate
+
+
+class ScheduleError(Exception):
+    """
+    The schedule cannot be built from the league and constraints given.
+    """
+
+
+class ScheduleConflict(ScheduleError):
+    """
+    The planned fixtures double-book a team or a venue; `conflicts` lists
+    every clash found.
+    """
+
+    def __init__(self, conflicts):
+        super().__init__(f'{len(conflicts)} scheduling conflict(s)')
+        self.conflicts = conflicts
+
+
+def round_robin(team_ids):
+    """
+    Return the rounds of a double round robin as lists of (home, away),
+    by the circle method.
+    """
+    teams = list(team_ids)
+    if len(teams) % 2:
+        teams.append(None)
+    rounds = []
+    for _ in range(len(teams) - 1):
+        pairs = []
+        for i in range(len(teams) // 2):
+            home, away = teams[i], teams[-1 - i]
+            if home is not None and away is not None:
+                pairs.append((home, away) if len(rounds) % 2 else (away, home))
+        rounds.append(pairs)
+        teams.insert(1, teams.pop())
+    return rounds + [[(away, home) for home, away in pairs] for pairs in rounds]
+
+
+class IntervalIndex:
+    """
+    Half-open [start, end) intervals grouped by key, kept sorted by start.
+
+    overlapping() only looks at intervals starting between `start` minus the
+    longest interval stored under the key and `end`, found by bisection, so
+    a lookup costs O(log n + matches) however long the season.
+    """
+
+    def __init__(self):
+        self._starts = defaultdict(list)
+        self._intervals = defaultdict(list)
+        self._longest = defaultdict(int)
+
+    def add(self, key, start, end, item):
+        starts = self._starts[key]
+        position = bisect_right(starts, start)
+        starts.insert(position, start)
+        self._intervals[key].insert(position, (start, end, item))
+        self._longest[key] = max(self._longest[key], end - start)
+
+    def overlapping(self, key, start, end):
+        starts = self._starts.get(key)
+        if not starts:
+            return []
+        low = bisect_left(starts, start - self._longest[key] + 1)
+        high = bisect_left(starts, end)
+        return [item for other_start, other_end, item in self._intervals[key][low:high] if other_end > start]
+
+
+def _describe(fixture):
+    return {
+        'date': fixture.match_datetime.isoformat(),
+        'home_team_id': fixture.home_team_id_id,
+        'away_team_id': fixture.away_team_id_id,
+        'venue': fixture.venue,
+        'fixture_id': fixture.pk,
+    }
+
+
+def find_conflicts(planned, booked, rest_days=1):
+    """
+    Return the clashes between the `planned` fixtures, and between them and
+    the `booked` ones, as dicts describing both sides.
+    """
+    teams = IntervalIndex()
+    venues = IntervalIndex()
+
+    def book(fixture):
+        day = fixture.match_datetime.toordinal()
+        for team_id in (fixture.home_team_id_id, fixture.away_team_id_id):
+            teams.add(team_id, day, day + rest_days, fixture)
+        venues.add(fixture.venue, day, day + 1, fixture)
+
+    for fixture in booked:
+        book(fixture)
+
+    conflicts = []
+    for fixture in planned:
+        day = fixture.match_datetime.toordinal()
+        for team_id in (fixture.home_team_id_id, fixture.away_team_id_id):
+            for other in teams.overlapping(team_id, day, day + rest_days):
+                conflicts.append({'reason': 'team', 'team_id': team_id,
+                                  'fixture': _describe(fixture), 'conflicts_with': _describe(other)})
+        for other in venues.overlapping(fixture.venue, day, day + 1):
+            conflicts.append({'reason': 'venue', 'venue': fixture.venue,
+                              'fixture': _describe(fixture), 'conflicts_with': _describe(other)})
+        book(fixture)
+    return conflicts
+
+
+def _venues(teams, venues):
+    """
+    Return {team_id: venue}: the one given, else where the team last played
+    at home, else '<team name> Stadium'.
+    """
+    from .models import Fixture
+
+    last_home = dict(
+        Fixture.objects.filter(home_team_id__in=[team.pk for team in teams])
+        .order_by('home_team_id', 'match_datetime', 'id')
+        .values_list('home_team_id', 'venue')
+    )
+    return {
+        team.pk: venues.get(team.pk) or last_home.get(team.pk) or f'{team.name} Stadium'
+        for team in teams
+    }
+
+
+def plan(league, start_date, days_between_rounds=7, venues=None, end_date=None, played=()):
+    """
+    Return the league's double round robin as unsaved Fixtures, in order,
+    leaving out the (home, away) pairs in `played`. Rounds left with no
+    matches are dropped, so the rest stay `days_between_rounds` apart.
+    """
+    from .models import Fixture, Team
+
+    teams = list(Team.objects.filter(leagueteam__league=league).order_by('id'))
+    if len(teams) < 2:
+        raise ScheduleError('A league needs at least two teams to be scheduled.')
+
+    rounds = round_robin([team.pk for team in teams])
+    if played:
+        rounds = [[pair for pair in pairs if pair not in played] for pairs in rounds]
+        rounds = [pairs for pairs in rounds if pairs]
+        if not rounds:
+            raise ScheduleError('Every match of the season has been played or is under way.')
+    last_date = start_date + timedelta(days=days_between_rounds * (len(rounds) - 1))
+    end_date = end_date or league.end_date
+    if end_date and last_date > end_date:
+        raise ScheduleError(
+            f'{len(rounds)} rounds every {days_between_rounds} days run until {last_date}, '
+            f'after the end date {end_date}.'
+        )
+
+    home_venues = _venues(teams, venues or {})
+    return [
+        Fixture(
+            match_datetime=start_date + timedelta(days=days_between_rounds * number),
+            venue=home_venues[home], status=Fixture.Status.UPCOMING,
+            league_id=league, home_team_id_id=home, away_team_id_id=away,
+        )
+        for number, pairs in enumerate(rounds)
+        for home, away in pairs
+    ]
+
+
+def generate(league, start_date, days_between_rounds=7, rest_days=1, venues=None,
+             end_date=None, replace=False, dry_run=False):
+    """
+    Build, check and insert the league's double round robin; return the
+    fixtures. With `replace` the league's upcoming fixtures are deleted
+    first and the matches already played or under way are not booked
+    again; otherwise a league that already has fixtures is refused. With
+    `dry_run` nothing is written.
+    """
+    from .models import Fixture
+
+    existing = Fixture.objects.filter(league_id=league)
+    played = set()
+    if replace:
+        played = set(
+            existing.exclude(status=Fixture.Status.UPCOMING).values_list('home_team_id', 'away_team_id')
+        )
+        existing = existing.filter(status=Fixture.Status.UPCOMING)
+    elif existing.exists():
+        raise ScheduleError('This league already has fixtures; pass replace to reschedule its upcoming ones.')
+
+    planned = plan(league, start_date, days_between_rounds, venues, end_date, played)
+
+    team_ids = {team_id for fixture in planned for team_id in (fixture.home_team_id_id, fixture.away_team_id_id)}
+    window = (
+        planned[0].match_datetime - timedelta(days=rest_days),
+        planned[-1].match_datetime + timedelta(days=rest_days),
+    )
+    booked = Fixture.objects.filter(match_datetime__range=window).filter(
+        Q(home_team_id__in=team_ids) | Q(away_team_id__in=team_ids)
+        | Q(venue__in={fixture.venue for fixture in planned})
+    ).only('match_datetime', 'venue', 'home_team_id', 'away_team_id')
+    if replace:
+        # Those are about to be deleted
+        booked = booked.exclude(pk__in=existing.values('pk'))
+    conflicts = find_conflicts(planned, booked, rest_days)
+    if conflicts:
+        raise ScheduleConflict(conflicts)
+    if dry_run:
+        return planned
+
+    # bulk_create sends no signals, so caches and the search index are told here
+    with transaction.atomic(), events.bulk_changes(broadcast=False, standings=False):
+        if replace:
+            existing.delete()
+        Fixture.objects.bulk_create(planned, batch_size=500)
+        invalidate('fixtures')
+        transaction.on_commit(search.reload)
+    return planned
@@ -0,0 +1,420 @@
+"""
+In-memory search over players, teams, managers and fixtures.
+
+Every searchable row is a document holding the words of its text fields
+(names, nationality, team names, venue), lower-cased and stripped of
+accents. A query word matches a document word that
+
+  * equals it or starts with it, found by bisecting a sorted word list;
+  * contains it (for query words of three letters or more), found through
+    the document words' trigrams;
+  * failing both, and for autocomplete only, is spelt nearly like it, by
+    trigram similarity.
+
+Every query word must match a document for it to count. Results are ranked
+by how closely and in which field the words matched.
+
+The index is built in each process on the first search, with one query per
+model. After that, committed saves and deletes update it in place. As with
+the leaderboards, a version counter (see hockeycore.versions) tells other
+worker processes to rebuild theirs.
+"""
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from rest_framework.filters import SearchFilter
+
+from . import versions
+
+VERSION_KEY = 'hockeycore:search'
+
+# Result ordering for otherwise equal scores
+KINDS = ('team', 'player', 'manager', 'fixture')
+
+# The columns each kind of document is built from
+FIELDS = {
+    'team': ('name', 'short_name', 'manager_id'),
+    'player': ('first_name', 'last_name', 'nationality', 'team_id_id'),
+    'manager': ('first_name', 'last_name'),
+    'fixture': ('venue', 'match_datetime', 'home_team_id_id', 'away_team_id_id'),
+}
+
+EXACT, PREFIX, CONTAINS, SIMILAR = 1.0, 0.8, 0.5, 0.4
+MIN_SIMILARITY = 0.45
+
+_lock = threading.RLock()
+_index = None
+
+
+def words(text):
+    """
+    Split `text` into lower-case words without accents.
+    """
+    text = unicodedata.normalize('NFKD', str(text or '')).casefold()
+    text = ''.join(c if c.isalnum() else ' ' for c in text if not unicodedata.combining(c))
+    return text.split()
+
+
+def _trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _inner_trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class _Document:
+    __slots__ = ('kind', 'id', 'fields', 'words')
+
+    def __init__(self, kind, id, fields):
+        self.kind = kind
+        self.id = id
+        self.fields = fields
+        self.words = {}
+
+
+class SearchIndex:
+    """
+    Documents keyed by (kind, id), with word postings for prefix, substring
+    and similarity lookups.
+
+    Committed changes are applied in place from other threads under the
+    module lock, so lookups take it too.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.documents = {}
+        self.postings = {}
+        self.sorted_words = []
+        self.trigrams = defaultdict(set)
+        self.trigram_counts = {}
+        # team id -> keys of the players and fixtures whose text includes it
+        self.members = defaultdict(set)
+        self.manager_teams = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _weighted_words(self, document):
+        fields = document.fields
+        found = {}
+
+        def add(text, weight):
+            for word in words(text):
+                found[word] = max(found.get(word, 0), weight)
+
+        if document.kind == 'team':
+            add(fields['name'], 1.0)
+            add(fields['short_name'], 1.0)
+        elif document.kind == 'player':
+            add(fields['first_name'], 1.0)
+            add(fields['last_name'], 1.0)
+            add(fields['nationality'], 0.5)
+            team = self.documents.get(('team', fields['team_id_id']))
+            if team is not None:
+                add(team.fields['name'], 0.5)
+                add(team.fields['short_name'], 0.5)
+        elif document.kind == 'manager':
+            add(fields['first_name'], 1.0)
+            add(fields['last_name'], 1.0)
+        elif document.kind == 'fixture':
+            add(fields['venue'], 1.0)
+            for attname in ('home_team_id_id', 'away_team_id_id'):
+                team = self.documents.get(('team', fields[attname]))
+                if team is not None:
+                    add(team.fields['name'], 0.5)
+        return found
+
+    def _link(self, document):
+        document.words = self._weighted_words(document)
+        key = (document.kind, document.id)
+        for word, weight in document.words.items():
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = {}
+                insort(self.sorted_words, word)
+                trigrams = _trigrams(word)
+                self.trigram_counts[word] = len(trigrams)
+                for trigram in trigrams:
+                    self.trigrams[trigram].add(word)
+            posting[key] = weight
+
+    def _unlink(self, document):
+        key = (document.kind, document.id)
+        for word in document.words:
+            posting = self.postings[word]
+            del posting[key]
+            if not posting:
+                del self.postings[word]
+                del self.sorted_words[bisect_left(self.sorted_words, word)]
+                del self.trigram_counts[word]
+                for trigram in _trigrams(word):
+                    self.trigrams[trigram].discard(word)
+                    if not self.trigrams[trigram]:
+                        del self.trigrams[trigram]
+        document.words = {}
+
+    def _team_keys(self, fields, kind):
+        if kind == 'player':
+            return [fields['team_id_id']]
+        if kind == 'fixture':
+            return [fields['home_team_id_id'], fields['away_team_id_id']]
+        return []
+
+    def put(self, kind, id, fields):
+        """
+        Add or replace a document.
+        """
+        self.remove(kind, id)
+        document = self.documents[kind, id] = _Document(kind, id, dict(fields))
+        self._link(document)
+        for team_id in self._team_keys(document.fields, kind):
+            self.members[team_id].add((kind, id))
+        if kind == 'team':
+            if fields['manager_id'] is not None:
+                self.manager_teams[fields['manager_id']] = id
+            self._relink_members(id)
+
+    def remove(self, kind, id):
+        document = self.documents.pop((kind, id), None)
+        if document is None:
+            return
+        self._unlink(document)
+        for team_id in self._team_keys(document.fields, kind):
+            self.members[team_id].discard((kind, id))
+            if not self.members[team_id]:
+                del self.members[team_id]
+        if kind == 'team':
+            if self.manager_teams.get(document.fields['manager_id']) == id:
+                del self.manager_teams[document.fields['manager_id']]
+            self._relink_members(id)
+
+    def _relink_members(self, team_id):
+        # Players and fixtures carry their team names
+        for key in self.members.get(team_id, ()):
+            document = self.documents[key]
+            self._unlink(document)
+            self._link(document)
+
+    def _matching_words(self, term, similar):
+        """
+        Return {word: score} for the index words `term` matches.
+        """
+        matches = {}
+        position = bisect_left(self.sorted_words, term)
+        while position < len(self.sorted_words) and self.sorted_words[position].startswith(term):
+            word = self.sorted_words[position]
+            matches[word] = EXACT if word == term else PREFIX
+            position += 1
+
+        if len(term) < 3:
+            return matches
+
+        postings = sorted((self.trigrams.get(t, ()) for t in _inner_trigrams(term)), key=len)
+        for word in postings[0]:
+            if word not in matches and term in word:
+                matches[word] = CONTAINS
+
+        if similar and not matches:
+            trigrams = _trigrams(term)
+            shared = defaultdict(int)
+            for trigram in trigrams:
+                for word in self.trigrams.get(trigram, ()):
+                    shared[word] += 1
+            for word, count in shared.items():
+                similarity = count / (len(trigrams) + self.trigram_counts[word] - count)
+                if similarity >= MIN_SIMILARITY:
+                    matches[word] = SIMILAR * similarity
+        return matches
+
+    def scores(self, query, kinds=None, similar=True):
+        """
+        Return {(kind, id): score} for the documents matching every word of
+        `query`.
+        """
+        terms = list(dict.fromkeys(words(query)))
+        if not terms:
+            return {}
+        totals = None
+        with _lock:
+            for term in terms:
+                best = {}
+                for word, score in self._matching_words(term, similar).items():
+                    for key, weight in self.postings[word].items():
+                        if kinds is None or key[0] in kinds:
+                            if score * weight > best.get(key, 0):
+                                best[key] = score * weight
+                if totals is None:
+                    totals = best
+                else:
+                    totals = {key: totals[key] + score for key, score in best.items() if key in totals}
+                if not totals:
+                    return {}
+        return totals
+
+    def search(self, query, kinds=None, limit=10):
+        """
+        Return the best `limit` matches for `query` as result dicts.
+        """
+        order = {kind: position for position, kind in enumerate(KINDS)}
+        with _lock:
+            ranked = heapq.nsmallest(
+                limit, self.scores(query, kinds).items(),
+                key=lambda item: (-item[1], order[item[0][0]], item[0][1]),
+            )
+            return [self.result(key, score) for key, score in ranked]
+
+    def _team_name(self, team_id):
+        team = self.documents.get(('team', team_id))
+        return team.fields['name'] if team is not None else ''
+
+    def label(self, key):
+        fields = self.documents[key].fields
+        if key[0] == 'team':
+            return fields['name']
+        if key[0] in ('player', 'manager'):
+            return f"{fields['first_name']} {fields['last_name']}"
+        return f"{self._team_name(fields['home_team_id_id'])} vs {self._team_name(fields['away_team_id_id'])}"
+
+    def result(self, key, score):
+        kind, id = key
+        fields = self.documents[key].fields
+        if kind == 'team':
+            detail = fields['short_name']
+        elif kind == 'player':
+            detail = self._team_name(fields['team_id_id'])
+        elif kind == 'manager':
+            detail = self._team_name(self.manager_teams.get(id))
+        else:
+            detail = f"{fields['venue']}, {fields['match_datetime']}"
+        return {'type': kind, 'id': id, 'label': self.label(key), 'detail': detail, 'score': round(score, 3)}
+
+
+def _models():
+    from .models import Fixture, Manager, Player, Team
+
+    # Teams first: player and fixture documents take words from them
+    return {'team': Team, 'player': Player, 'manager': Manager, 'fixture': Fixture}
+
+
+def _current_version():
+    return versions.current(VERSION_KEY)
+
+
+def _bump():
+    return versions.bump(VERSION_KEY)
+
+
+def build():
+    """
+    Build a fresh index from the database.
+    """
+    index = SearchIndex(_current_version())
+    for kind, model in _models().items():
+        for row in model.objects.values('id', *FIELDS[kind]).iterator():
+            index.put(kind, row.pop('id'), row)
+    return index
+
+
+def get_index():
+    """
+    Return this process's index, building it if it is missing or another
+    process has changed the data since.
+    """
+    global _index
+    version = _current_version()
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = build()
+        return _index
+
+
+def reload():
+    """
+    Make every process rebuild its index on its next search, after rows were
+    written without signals (bulk_create, update).
+    """
+    global _index
+    with _lock:
+        _bump()
+        _index = None
+
+
+def _apply(changes):
+    global _index
+    with _lock:
+        version = _bump()
+        if _index is None:
+            return
+        if version != _index.version + 1:
+            _index = None
+            return
+        for kind, id, fields in changes:
+            if fields is None:
+                _index.remove(kind, id)
+            else:
+                _index.put(kind, id, fields)
+        _index.version = version
+
+
+def _kind(sender):
+    for kind, model in _models().items():
+        if sender is model:
+            return kind
+    return None
+
+
+def _saved(sender, instance, created, **kwargs):
+    kind = _kind(sender)
+    if kind is None:
+        return
+    # Fixtures are saved on every goal; only their text matters here
+    if not created and hasattr(instance, 'changed_fields'):
+        if not instance.changed_fields() & set(FIELDS[kind]):
+            return
+    fields = {attname: getattr(instance, attname) for attname in FIELDS[kind]}
+    transaction.on_commit(lambda: _apply([(kind, instance.pk, fields)]), using=kwargs.get('using'))
+
+
+def _deleted(sender, instance, **kwargs):
+    kind = _kind(sender)
+    if kind is None:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: _apply([(kind, pk, None)]), using=kwargs.get('using'))
+
+
+post_save.connect(_saved, dispatch_uid='hockeycore.search.saved')
+post_delete.connect(_deleted, dispatch_uid='hockeycore.search.deleted')
+
+
+class IndexedSearchFilter(SearchFilter):
+    """
+    SearchFilter that answers ?search= from the index for views naming a
+    `search_kind`, instead of LIKE '%term%' scans over joined tables. Matches
+    words containing each term, as icontains would, without the typo
+    tolerance of the autocomplete.
+
+    Where the index cannot answer the same way, SearchFilter's own query
+    does: for terms under three letters (the index only finds those at the
+    start of a word), and when more than `max_matches` rows match, rather
+    than an IN list of every id.
+    """
+    max_matches = 500
+
+    def filter_queryset(self, request, queryset, view):
+        kind = getattr(view, 'search_kind', None)
+        query = ' '.join(self.get_search_terms(request))
+        if kind is None or not query or any(len(word) < 3 for word in words(query)):
+            return super().filter_queryset(request, queryset, view)
+        scores = get_index().scores(query, kinds={kind}, similar=False)
+        if len(scores) > self.max_matches:
+            return super().filter_queryset(request, queryset, view)
+        return queryset.filter(pk__in=[id for _, id in scores])
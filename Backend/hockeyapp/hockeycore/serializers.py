@@ -1,9 +1,91 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import User, Team, Fixture, League, Player, Manager, Staff, LeagueTeam, MatchEvent, LeagueStanding
+from django.db.models import Prefetch
+from . import directory
+from .fieldsets import SparseFieldsMixin
+from .models import User, Team, Fixture, League, Player, Manager, Staff, LeagueTeam, MatchEvent, LeagueStanding, PlayerSeasonStat
 
-class UserSerializer(serializers.ModelSerializer):
+# Every player reference on an event is serialized (team names come from
+# the directory)
+MATCH_EVENT_RELATED = ('player', 'assisting', 'sub_in', 'sub_out')
+
+
+def match_events_prefetch():
+    """
+    Prefetch for a fixture queryset that loads every fixture's events, with
+    their players and teams, in one query.
+    """
+    return Prefetch(
+        'matchevent_set',
+        queryset=MatchEvent.objects.select_related(*MATCH_EVENT_RELATED).order_by('minute', 'id'),
+    )
+
+
+def fixture_match_events(fixture):
+    """
+    A fixture's events in match order, from the prefetch cache when the
+    queryset used match_events_prefetch().
+    """
+    if 'matchevent_set' in getattr(fixture, '_prefetched_objects_cache', {}):
+        return fixture.matchevent_set.all()
+    return (
+        MatchEvent.objects.filter(fixture_id=fixture)
+        .select_related(*MATCH_EVENT_RELATED)
+        .order_by('minute', 'id')
+    )
+
+def people(field):
+    """
+    The team and player directory for one serialization, looked up once on
+    the root serializer.
+    """
+    root = field.root
+    records = getattr(root, '_directory', None)
+    if records is None:
+        records = root._directory = directory.get_directory()
+    return records
+
+
+def team_record(field, instance, team_field):
+    """
+    The directory record of the team `instance.<team_field>` points at,
+    read from the database only if the directory does not know it yet.
+    """
+    return people(field).team(
+        getattr(instance, f'{team_field}_id'), lambda: getattr(instance, team_field),
+    )
+
+
+def team_summary(field, instance, team_field, logo=True):
+    record = team_record(field, instance, team_field)
+    if record is None:
+        return None
+    summary = {'id': record.id, 'name': record.name, 'short_name': record.short_name}
+    if logo:
+        summary['logo_url'] = record.logo_url
+    return summary
+
+
+class TeamAttributeField(serializers.Field):
+    """
+    Read-only column (name, short_name, logo_url) of a referenced team,
+    from the directory instead of a join.
+    """
+
+    def __init__(self, team_field, attribute, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+        self.team_field = team_field
+        self.attribute = attribute
+        # Only the foreign key column is read (see fieldsets)
+        self.lookups = (team_field,)
+
+    def to_representation(self, instance):
+        record = team_record(self, instance, self.team_field)
+        return getattr(record, self.attribute) if record is not None else None
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -33,18 +115,39 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
         return token
 
-class LeagueSerializer(serializers.ModelSerializer):
+class LeagueSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = League
         fields = '__all__'
 
-class ManagerSerializer(serializers.ModelSerializer):
+class ScheduleSerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField(required=False)
+    days_between_rounds = serializers.IntegerField(min_value=1, default=7)
+    rest_days = serializers.IntegerField(min_value=1, default=1)
+    # {team_id: venue}; teams left out play where they last hosted a match
+    venues = serializers.DictField(child=serializers.CharField(max_length=100), required=False)
+    replace = serializers.BooleanField(default=False)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate_venues(self, value):
+        try:
+            return {int(team_id): venue for team_id, venue in value.items()}
+        except ValueError:
+            raise serializers.ValidationError("Venues must be keyed by team id")
+
+    def validate(self, data):
+        if 'end_date' in data and data['end_date'] < data['start_date']:
+            raise serializers.ValidationError("End date must be after the start date")
+        return data
+
+class ManagerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     managed_team = serializers.PrimaryKeyRelatedField(read_only=True)
     class Meta:
         model = Manager
         fields = '__all__'
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     manager = ManagerSerializer(read_only=True)
     manager_id = serializers.PrimaryKeyRelatedField(
         queryset=Manager.objects.all(),
@@ -57,15 +160,15 @@ class TeamSerializer(serializers.ModelSerializer):
         model = Team
         fields = '__all__'
 
-class LeagueTeamSerializer(serializers.ModelSerializer):
+class LeagueTeamSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = LeagueTeam
         fields = '__all__'
         read_only_fields = ('date_joined',)
 
-class PlayerSerializer(serializers.ModelSerializer):
-    team_name = serializers.CharField(source='team_id.name', read_only=True)
-    team_short_name = serializers.CharField(source='team_id.short_name', read_only=True)
+class PlayerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    team_name = TeamAttributeField('team_id', 'name')
+    team_short_name = TeamAttributeField('team_id', 'short_name')
 
     class Meta:
         model = Player
@@ -78,17 +181,17 @@ class PlayerSerializer(serializers.ModelSerializer):
             'photo': {'required': False},
         }
 
-class StaffSerializer(serializers.ModelSerializer):
+class StaffSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Staff
         fields = '__all__'
 
-class FixtureSerializer(serializers.ModelSerializer):
+class FixtureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Fixture
         fields = '__all__'
 
-class DetailedFixtureSerializer(serializers.ModelSerializer):
+class DetailedFixtureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     home_team = TeamSerializer(source='home_team_id', read_only=True)
     away_team = TeamSerializer(source='away_team_id', read_only=True)
     league = LeagueSerializer(source='league_id', read_only=True)
@@ -103,12 +206,12 @@ class DetailedFixtureSerializer(serializers.ModelSerializer):
             'league_id': {'write_only': True},
         }
 
-class CreateFixtureSerializer(serializers.ModelSerializer):
+class CreateFixtureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Fixture
         fields = '__all__'
 
-class UpdateFixtureSerializer(serializers.ModelSerializer):
+class UpdateFixtureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Fixture
         fields = ['status', 'home_team_score', 'away_team_score', 'venue']
@@ -119,7 +222,7 @@ class UpdateFixtureSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("Scores cannot be negative")
         return data
 
-class PublicFixtureSerializer(serializers.ModelSerializer):
+class PublicFixtureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     home_team = serializers.SerializerMethodField()
     away_team = serializers.SerializerMethodField()
     league = serializers.SerializerMethodField()
@@ -139,20 +242,10 @@ class PublicFixtureSerializer(serializers.ModelSerializer):
         ]
     
     def get_home_team(self, obj):
-        return {
-            'id': obj.home_team_id.id,
-            'name': obj.home_team_id.name,
-            'short_name': obj.home_team_id.short_name,
-            'logo_url': obj.home_team_id.logo_url
-        }
+        return team_summary(self, obj, 'home_team_id')
     
     def get_away_team(self, obj):
-        return {
-            'id': obj.away_team_id.id,
-            'name': obj.away_team_id.name,
-            'short_name': obj.away_team_id.short_name,
-            'logo_url': obj.away_team_id.logo_url
-        }
+        return team_summary(self, obj, 'away_team_id')
     
     def get_league(self, obj):
         return {
@@ -162,30 +255,23 @@ class PublicFixtureSerializer(serializers.ModelSerializer):
         }
     
     def get_victor(self, obj):
-        if obj.victor:
-            return {
-                'id': obj.victor.id,
-                'name': obj.victor.name,
-                'short_name': obj.victor.short_name
-            }
-        return None
+        return team_summary(self, obj, 'victor', logo=False)
     
     def get_score(self, obj):
         return obj.score_display
     
     def get_match_events(self, obj):
-        events = MatchEvent.objects.filter(fixture_id=obj).order_by('minute')
-        return MatchEventSerializer(events, many=True).data
+        return MatchEventSerializer(fixture_match_events(obj), many=True).data
     
-class SimpleFixtureSerializer(serializers.ModelSerializer):
-    home_team_id = serializers.IntegerField(source='home_team_id.id')
-    away_team_id = serializers.IntegerField(source='away_team_id.id')
-    home_team_name = serializers.CharField(source='home_team_id.name')
-    away_team_name = serializers.CharField(source='away_team_id.name')
-    home_team_logo_url = serializers.URLField(source='home_team_id.logo_url')
-    away_team_logo_url = serializers.URLField(source='away_team_id.logo_url')
-    home_team_short_name = serializers.CharField(source='home_team_id.short_name')
-    away_team_short_name = serializers.CharField(source='away_team_id.short_name')
+class SimpleFixtureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    home_team_id = serializers.IntegerField(source='home_team_id_id')
+    away_team_id = serializers.IntegerField(source='away_team_id_id')
+    home_team_name = TeamAttributeField('home_team_id', 'name')
+    away_team_name = TeamAttributeField('away_team_id', 'name')
+    home_team_logo_url = TeamAttributeField('home_team_id', 'logo_url')
+    away_team_logo_url = TeamAttributeField('away_team_id', 'logo_url')
+    home_team_short_name = TeamAttributeField('home_team_id', 'short_name')
+    away_team_short_name = TeamAttributeField('away_team_id', 'short_name')
     league_name = serializers.CharField(source='league_id.name')
     
     class Meta:
@@ -198,7 +284,7 @@ class SimpleFixtureSerializer(serializers.ModelSerializer):
             'home_team_short_name', 'away_team_short_name'
         ]
 
-class PublicFixtureDetailSerializer(serializers.ModelSerializer):
+class PublicFixtureDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     home_team = serializers.SerializerMethodField()
     away_team = serializers.SerializerMethodField()
     league = serializers.SerializerMethodField()
@@ -213,22 +299,21 @@ class PublicFixtureDetailSerializer(serializers.ModelSerializer):
             'home_team', 'away_team', 'league', 'score',
             'victor', 'match_events'
         ]
+        # What the method fields read, for ?fields= (see fieldsets)
+        field_lookups = {
+            'home_team': ('home_team_id',),
+            'away_team': ('away_team_id',),
+            'league': ('league_id__name', 'league_id__season'),
+            'victor': ('victor',),
+            'score': ('home_team_score', 'away_team_score'),
+            'match_events': ('matchevent_set',),
+        }
     
     def get_home_team(self, obj):
-        return {
-            'id': obj.home_team_id.id,
-            'name': obj.home_team_id.name,
-            'short_name': obj.home_team_id.short_name,
-            'logo_url': obj.home_team_id.logo_url
-        }
+        return team_summary(self, obj, 'home_team_id')
     
     def get_away_team(self, obj):
-        return {
-            'id': obj.away_team_id.id,
-            'name': obj.away_team_id.name,
-            'short_name': obj.away_team_id.short_name,
-            'logo_url': obj.away_team_id.logo_url
-        }
+        return team_summary(self, obj, 'away_team_id')
     
     def get_league(self, obj):
         return {
@@ -238,22 +323,15 @@ class PublicFixtureDetailSerializer(serializers.ModelSerializer):
         }
     
     def get_victor(self, obj):
-        if obj.victor:
-            return {
-                'id': obj.victor.id,
-                'name': obj.victor.name,
-                'short_name': obj.victor.short_name
-            }
-        return None
+        return team_summary(self, obj, 'victor', logo=False)
     
     def get_score(self, obj):
         return obj.score_display
     
     def get_match_events(self, obj):
-        events = MatchEvent.objects.filter(fixture_id=obj).order_by('minute')
-        return MatchEventSerializer(events, many=True).data
+        return MatchEventSerializer(fixture_match_events(obj), many=True).data
 
-class MatchEventSerializer(serializers.ModelSerializer):
+class MatchEventSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     player = PlayerSerializer(read_only=True)
     assisting = PlayerSerializer(read_only=True)
     sub_in = PlayerSerializer(read_only=True)
@@ -269,16 +347,19 @@ class MatchEventSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
     def validate(self, data):
-        et = data.get('event_type')
-        # enforce presence of subtype fields
-        if et == MatchEvent.Action.CARD and not data.get('card_type'):
-            raise serializers.ValidationError("`card_type` is required for CARD events")
-        if et == MatchEvent.Action.SUBSTITUTION:
-            if not data.get('sub_in') or not data.get('sub_out'):
-                raise serializers.ValidationError("`sub_in` and `sub_out` are required for SUBSTITUTION")
-        return data
+        return validate_event_subtype(data)
 
-class MatchEventSerializer2(serializers.ModelSerializer):
+def validate_event_subtype(data):
+    et = data.get('event_type')
+    # enforce presence of subtype fields
+    if et == MatchEvent.Action.CARD and not data.get('card_type'):
+        raise serializers.ValidationError("`card_type` is required for CARD events")
+    if et == MatchEvent.Action.SUBSTITUTION:
+        if not data.get('sub_in') or not data.get('sub_out'):
+            raise serializers.ValidationError("`sub_in` and `sub_out` are required for SUBSTITUTION")
+    return data
+
+class MatchEventSerializer2(SparseFieldsMixin, serializers.ModelSerializer):
     # player = PlayerSerializer(read_only=True)
     # assisting = PlayerSerializer(read_only=True)
     # sub_in = PlayerSerializer(read_only=True)
@@ -294,20 +375,59 @@ class MatchEventSerializer2(serializers.ModelSerializer):
         read_only_fields = ['id']
 
     def validate(self, data):
-        et = data.get('event_type')
-        # enforce presence of subtype fields
-        if et == MatchEvent.Action.CARD and not data.get('card_type'):
-            raise serializers.ValidationError("`card_type` is required for CARD events")
-        if et == MatchEvent.Action.SUBSTITUTION:
-            if not data.get('sub_in') or not data.get('sub_out'):
-                raise serializers.ValidationError("`sub_in` and `sub_out` are required for SUBSTITUTION")
+        return validate_event_subtype(data)
+
+class BulkMatchEventItemSerializer(serializers.Serializer):
+    # Players are plain ids here; BulkMatchEventSerializer looks them all up at once
+    minute = serializers.IntegerField(min_value=0, max_value=32767)
+    event_type = serializers.ChoiceField(choices=MatchEvent.Action.choices)
+    player = serializers.IntegerField()
+    assisting = serializers.IntegerField(required=False, allow_null=True)
+    card_type = serializers.ChoiceField(
+        choices=MatchEvent._meta.get_field('card_type').choices, required=False, allow_null=True,
+    )
+    sub_in = serializers.IntegerField(required=False, allow_null=True)
+    sub_out = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate(self, data):
+        return validate_event_subtype(data)
+
+class BulkMatchEventSerializer(serializers.Serializer):
+    """
+    A batch of events for one fixture, validated with one query for the
+    fixture and one for every player the batch mentions.
+    """
+    PLAYER_FIELDS = ('player', 'assisting', 'sub_in', 'sub_out')
+
+    fixture = serializers.PrimaryKeyRelatedField(queryset=Fixture.objects.select_related('league_id'))
+    events = BulkMatchEventItemSerializer(many=True, allow_empty=False, max_length=500)
+
+    def validate(self, data):
+        player_ids = {
+            item[field] for item in data['events'] for field in self.PLAYER_FIELDS
+            if item.get(field) is not None
+        }
+        players = Player.objects.select_related('team_id').in_bulk(player_ids)
+
+        errors = []
+        for item in data['events']:
+            missing = {
+                field: [f'Invalid pk "{item[field]}" - object does not exist.']
+                for field in self.PLAYER_FIELDS
+                if item.get(field) is not None and item[field] not in players
+            }
+            errors.append(missing)
+            for field in self.PLAYER_FIELDS:
+                item[field] = players.get(item.get(field))
+        if any(errors):
+            raise serializers.ValidationError({'events': errors})
         return data
 
-class LeagueStandingSerializer(serializers.ModelSerializer):
-    team_name = serializers.CharField(source='team_id.name', read_only=True)
-    team_short_name = serializers.CharField(source='team_id.short_name', read_only=True)
-    team_logo_url = serializers.CharField(source='team_id.logo_url', read_only=True)
-    league_id = serializers.IntegerField(source='league_id.id')
+class LeagueStandingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    team_name = TeamAttributeField('team_id', 'name')
+    team_short_name = TeamAttributeField('team_id', 'short_name')
+    team_logo_url = TeamAttributeField('team_id', 'logo_url')
+    league_id = serializers.IntegerField(source='league_id_id')
     class Meta:
         model = LeagueStanding
         fields = [
@@ -316,17 +436,29 @@ class LeagueStandingSerializer(serializers.ModelSerializer):
             'goals_for', 'goals_against', 'points', 'league_id'
         ]
 
-class PublicTeamSerializer(serializers.ModelSerializer):
+class PlayerSeasonStatSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    league_name = serializers.CharField(source='league_id.name', read_only=True)
+    season = serializers.CharField(source='league_id.season', read_only=True)
+
+    class Meta:
+        model = PlayerSeasonStat
+        fields = [
+            'player_id', 'league_id', 'league_name', 'season',
+            'goals', 'assists', 'green_cards', 'yellow_cards', 'red_cards',
+            'subbed_on', 'subbed_off',
+        ]
+
+class PublicTeamSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     league_name = serializers.CharField(source='league_id.name', read_only=True)
     
     class Meta:
         model = Team
         fields = ['id', 'name', 'short_name', 'logo_url', 'founded_year', 'league_name']
 
-class PublicPlayerSerializer(serializers.ModelSerializer):
-    team_name = serializers.CharField(source='team_id.name', read_only=True)
-    team_short_name = serializers.CharField(source='team_id.short_name', read_only=True)
-    team_logo = serializers.URLField(source='team_id.logo_url', read_only=True)
+class PublicPlayerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    team_name = TeamAttributeField('team_id', 'name')
+    team_short_name = TeamAttributeField('team_id', 'short_name')
+    team_logo = TeamAttributeField('team_id', 'logo_url')
     
     class Meta:
         model = Player
@@ -347,7 +479,7 @@ class PublicPlayerSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = fields  # All fields are read-only for public API 
 
-class PublicFixtureSerializer(serializers.ModelSerializer):
+class PublicFixtureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     home_team_name = serializers.CharField(source='home_team_id.name', read_only=True)
     away_team_name = serializers.CharField(source='away_team_id.name', read_only=True)
     league_name = serializers.CharField(source='league_id.name', read_only=True)
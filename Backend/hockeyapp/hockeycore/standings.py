@@ -0,0 +1,414 @@
+"""
+League standings.
+
+A finished fixture contributes one result line (played/W/D/L/GF/GA/points) to
+each of its two teams. When a fixture is saved we take away the line it used
+to contribute, add the line it contributes now, re-rank the league in memory
+and write back only the LeagueStanding rows that actually moved.
+
+Full rebuilds (first table of a league, backfills) run as a single aggregate
+query in the database and are written back in bulk. Both break ties on the
+team name in the database's collation, then the team id.
+"""
+from collections import namedtuple
+
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef
+
+from .responsecache import invalidate
+
+STAT_FIELDS = ('played', 'wins', 'draws', 'losses', 'goals_for', 'goals_against', 'points')
+
+
+class FixtureResult(namedtuple('FixtureResult', [
+    'league_id', 'home_team_id', 'away_team_id', 'home_score', 'away_score', 'counted',
+])):
+    """
+    The part of a fixture that feeds the table. `counted` is False for
+    fixtures that are not FINISHED or have no score yet.
+    """
+
+    @classmethod
+    def from_fixture(cls, fixture):
+        return cls.from_values(lambda attname: getattr(fixture, attname))
+
+    @classmethod
+    def from_values(cls, value):
+        """
+        Build a result from `value(attname)`, e.g. a fixture's loaded values.
+        """
+        from .models import Fixture
+
+        home_score = value('home_team_score')
+        away_score = value('away_team_score')
+        counted = (
+            value('status') == Fixture.Status.FINISHED
+            and home_score is not None
+            and away_score is not None
+        )
+        return cls(
+            league_id=value('league_id_id'),
+            home_team_id=value('home_team_id_id'),
+            away_team_id=value('away_team_id_id'),
+            home_score=home_score or 0,
+            away_score=away_score or 0,
+            counted=counted,
+        )
+
+
+def result_lines(result):
+    """
+    Return {team_id: {stat: value}} for the two teams of a counted result.
+    """
+    home = dict.fromkeys(STAT_FIELDS, 0)
+    away = dict.fromkeys(STAT_FIELDS, 0)
+
+    home['played'] = away['played'] = 1
+    home['goals_for'] = away['goals_against'] = result.home_score
+    home['goals_against'] = away['goals_for'] = result.away_score
+
+    if result.home_score > result.away_score:
+        home['wins'], home['points'] = 1, 3
+        away['losses'] = 1
+    elif result.home_score < result.away_score:
+        away['wins'], away['points'] = 1, 3
+        home['losses'] = 1
+    else:
+        home['draws'] = away['draws'] = 1
+        home['points'] = away['points'] = 1
+
+    return {result.home_team_id: home, result.away_team_id: away}
+
+
+def ranking_key(stats, tiebreak):
+    # Points, goal difference, goals for, then `tiebreak`: the team name, or
+    # its place in the database's name order
+    return (
+        -stats['points'],
+        -(stats['goals_for'] - stats['goals_against']),
+        -stats['goals_for'],
+        tiebreak,
+    )
+
+
+def _league_deltas(old, new):
+    """
+    Group the per-team changes by league. A fixture moved between leagues
+    gives one entry per league.
+    """
+    deltas = {}
+    for result, sign in ((old, -1), (new, 1)):
+        if result is None or not result.counted:
+            continue
+        league = deltas.setdefault(result.league_id, {})
+        for team_id, line in result_lines(result).items():
+            team_delta = league.setdefault(team_id, dict.fromkeys(STAT_FIELDS, 0))
+            for field, value in line.items():
+                team_delta[field] += sign * value
+
+    # Drop teams (and leagues) that end up unchanged, e.g. a re-save with the same score
+    for league_id in list(deltas):
+        league = {t: d for t, d in deltas[league_id].items() if any(d.values())}
+        if league:
+            deltas[league_id] = league
+        else:
+            del deltas[league_id]
+    return deltas
+
+
+def apply_result_change(old, new):
+    """
+    Update the standings of the league(s) involved in a fixture going from
+    result `old` to result `new` (either may be None).
+
+    Costs a fixed handful of queries per league no matter how many fixtures
+    have been played. When the stored table does not match the league's
+    membership (first finished match, team added mid-season) the league is
+    rebuilt from scratch instead.
+    """
+    for league_id, delta in _league_deltas(old, new).items():
+        _apply_league_delta(league_id, delta)
+
+
+def _apply_league_delta(league_id, delta):
+    from .models import LeagueTeam, LeagueStanding
+
+    with transaction.atomic():
+        # The members in the order STANDINGS_SQL breaks ties in, collation
+        # included
+        name_order = {
+            team_id: place
+            for place, team_id in enumerate(
+                LeagueTeam.objects.filter(league_id=league_id)
+                .order_by('team__name', 'team_id')
+                .values_list('team_id', flat=True)
+            )
+        }
+        league_team_ids = set(name_order)
+        rows = list(LeagueStanding.objects.filter(league_id=league_id).select_for_update())
+        rows_by_team = {row.team_id_id: row for row in rows}
+
+        if len(rows_by_team) != len(rows) or set(rows_by_team) != league_team_ids:
+            rebuild_league_standings(league_id)
+            return
+
+        # Matches involving a team outside the league never count
+        if not set(delta) <= league_team_ids:
+            return
+
+        changed = set()
+        for team_id, team_delta in delta.items():
+            row = rows_by_team[team_id]
+            for field, value in team_delta.items():
+                setattr(row, field, getattr(row, field) + value)
+            changed.add(team_id)
+
+        ranked = sorted(
+            rows,
+            key=lambda row: ranking_key(
+                {field: getattr(row, field) for field in STAT_FIELDS}, name_order[row.team_id_id]
+            ),
+        )
+        for position, row in enumerate(ranked, start=1):
+            if row.position != position:
+                row.position = position
+                changed.add(row.team_id_id)
+
+        LeagueStanding.objects.bulk_update(
+            [rows_by_team[team_id] for team_id in changed],
+            fields=list(STAT_FIELDS) + ['position'],
+        )
+        if changed:
+            # bulk_update sends no signals
+            invalidate('standings')
+
+
+def python_league_table(league_id):
+    """
+    Compute a league table in Python from every finished fixture.
+
+    Returns a list of {'team_id', <STAT_FIELDS>, 'position'} dicts in table
+    order. Kept as the reference implementation for the SQL version below.
+    """
+    from .models import Fixture, LeagueTeam
+
+    teams_in_league = LeagueTeam.objects.filter(league_id=league_id).select_related('team')
+
+    # Initialize standings dictionary with all teams in the league
+    standings = {}
+    for lt in teams_in_league:
+        standings[lt.team.id] = {'team': lt.team, **dict.fromkeys(STAT_FIELDS, 0)}
+
+    finished_matches = Fixture.objects.filter(
+        league_id=league_id,
+        status=Fixture.Status.FINISHED,
+        home_team_score__isnull=False,
+        away_team_score__isnull=False
+    ).only('league_id', 'home_team_id', 'away_team_id', 'home_team_score', 'away_team_score', 'status')
+
+    for match in finished_matches:
+        result = FixtureResult.from_fixture(match)
+
+        # Only process matches where both teams are in the league
+        if result.home_team_id not in standings or result.away_team_id not in standings:
+            continue
+
+        for team_id, line in result_lines(result).items():
+            for field, value in line.items():
+                standings[team_id][field] += value
+
+    sorted_standings = sorted(
+        standings.values(),
+        key=lambda x: ranking_key(x, x['team'].name)
+    )
+
+    return [
+        {
+            'team_id': stats['team'].id,
+            **{field: stats[field] for field in STAT_FIELDS},
+            'position': position,
+        }
+        for position, stats in enumerate(sorted_standings, start=1)
+    ]
+
+
+STANDINGS_SQL = """
+SELECT league_id, team_id, played, wins, draws, losses, goals_for, goals_against, points,
+       ROW_NUMBER() OVER (
+           PARTITION BY league_id
+           ORDER BY points DESC, goals_for - goals_against DESC, goals_for DESC, team_name ASC, team_id ASC
+       ) AS position
+FROM (
+    SELECT lt.{lt_league} AS league_id,
+           lt.{lt_team} AS team_id,
+           t.{team_name} AS team_name,
+           COUNT(r.team_id) AS played,
+           COALESCE(SUM(CASE WHEN r.gf > r.ga THEN 1 ELSE 0 END), 0) AS wins,
+           COALESCE(SUM(CASE WHEN r.gf = r.ga THEN 1 ELSE 0 END), 0) AS draws,
+           COALESCE(SUM(CASE WHEN r.gf < r.ga THEN 1 ELSE 0 END), 0) AS losses,
+           COALESCE(SUM(r.gf), 0) AS goals_for,
+           COALESCE(SUM(r.ga), 0) AS goals_against,
+           COALESCE(SUM(CASE WHEN r.gf > r.ga THEN 3 WHEN r.gf = r.ga THEN 1 ELSE 0 END), 0) AS points
+    FROM {leagueteam} lt
+    JOIN {team} t ON t.{team_pk} = lt.{lt_team}
+    LEFT JOIN (
+        SELECT {f_league} AS league_id, {f_home} AS team_id, {f_away} AS opponent_id,
+               {f_home_score} AS gf, {f_away_score} AS ga
+        FROM {fixture}
+        WHERE {f_status} = %s AND {f_home_score} IS NOT NULL AND {f_away_score} IS NOT NULL
+        UNION ALL
+        SELECT {f_league}, {f_away}, {f_home}, {f_away_score}, {f_home_score}
+        FROM {fixture}
+        WHERE {f_status} = %s AND {f_home_score} IS NOT NULL AND {f_away_score} IS NOT NULL
+    ) r ON r.league_id = lt.{lt_league}
+       AND r.team_id = lt.{lt_team}
+       AND EXISTS (
+           SELECT 1 FROM {leagueteam} o
+           WHERE o.{lt_league} = lt.{lt_league} AND o.{lt_team} = r.opponent_id
+       )
+    {where}
+    GROUP BY lt.{lt_league}, lt.{lt_team}, t.{team_name}
+) s
+ORDER BY league_id, position
+"""
+
+
+def _standings_sql(connection, league_ids):
+    from .models import Fixture, LeagueTeam, Team
+
+    qn = connection.ops.quote_name
+
+    def column(model, field):
+        return qn(model._meta.get_field(field).column)
+
+    where = ''
+    if league_ids is not None:
+        where = 'WHERE lt.{} IN ({})'.format(
+            column(LeagueTeam, 'league'), ', '.join(['%s'] * len(league_ids))
+        )
+
+    return STANDINGS_SQL.format(
+        leagueteam=qn(LeagueTeam._meta.db_table),
+        team=qn(Team._meta.db_table),
+        fixture=qn(Fixture._meta.db_table),
+        lt_league=column(LeagueTeam, 'league'),
+        lt_team=column(LeagueTeam, 'team'),
+        team_pk=column(Team, 'id'),
+        team_name=column(Team, 'name'),
+        f_league=column(Fixture, 'league_id'),
+        f_home=column(Fixture, 'home_team_id'),
+        f_away=column(Fixture, 'away_team_id'),
+        f_home_score=column(Fixture, 'home_team_score'),
+        f_away_score=column(Fixture, 'away_team_score'),
+        f_status=column(Fixture, 'status'),
+        where=where,
+    )
+
+
+def sql_league_tables(league_ids=None):
+    """
+    Compute league tables inside the database with a single query.
+
+    Home and away results are UNION ALL'd into one row per team per match,
+    aggregated per team and ranked with ROW_NUMBER() using the same tiebreak
+    order as the Python implementation. The name tiebreak follows the
+    column's collation, as incremental updates do, and the team id settles
+    equal names.
+
+    Returns {league_id: [row, ...]} with rows shaped like python_league_table.
+    Pass `league_ids` to limit the leagues computed; None means all of them.
+    """
+    from django.db import connection
+    from .models import Fixture
+
+    if league_ids is not None:
+        league_ids = list(league_ids)
+        if not league_ids:
+            return {}
+
+    finished = Fixture.Status.FINISHED
+    params = [finished, finished] + (league_ids or [])
+
+    tables = {}
+    with connection.cursor() as cursor:
+        cursor.execute(_standings_sql(connection, league_ids), params)
+        for league_id, team_id, *stats, position in cursor.fetchall():
+            row = {'team_id': team_id, 'position': int(position)}
+            # MySQL returns SUM() as DECIMAL
+            row.update((field, int(value)) for field, value in zip(STAT_FIELDS, stats))
+            tables.setdefault(league_id, []).append(row)
+    return tables
+
+
+def write_league_tables(tables):
+    """
+    Upsert computed tables ({league_id: [row, ...]}) into LeagueStanding in
+    bulk, relying on the unique (league_id, team_id) constraint.
+    """
+    from .models import LeagueStanding
+
+    if not tables:
+        return
+
+    standings = [
+        LeagueStanding(
+            league_id_id=league_id,
+            team_id_id=row['team_id'],
+            **{field: row[field] for field in STAT_FIELDS},
+            position=row['position'],
+        )
+        for league_id, rows in tables.items()
+        for row in rows
+    ]
+
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target; the other
+    # backends need one
+    connection = connections[router.db_for_write(LeagueStanding)]
+    unique_fields = None
+    if connection.features.supports_update_conflicts_with_target:
+        unique_fields = ['league_id', 'team_id']
+
+    with transaction.atomic():
+        LeagueStanding.objects.bulk_create(
+            standings,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=list(STAT_FIELDS) + ['position'],
+        )
+        invalidate('standings')
+
+
+def delete_departed_teams(league_ids=None):
+    """
+    Delete the LeagueStanding rows of teams no longer in their league (or
+    only in `league_ids`). Left behind, they would fail every incremental
+    update's membership check and turn it into a rebuild.
+    """
+    from .models import LeagueStanding, LeagueTeam
+
+    departed = LeagueStanding.objects.filter(~Exists(
+        LeagueTeam.objects.filter(league_id=OuterRef('league_id'), team_id=OuterRef('team_id'))
+    ))
+    if league_ids is not None:
+        departed = departed.filter(league_id__in=league_ids)
+    departed.delete()
+
+
+def rebuild_league_standings(league_id):
+    """
+    Recompute a whole league table from every finished fixture.
+    """
+    rebuild_all_standings([league_id])
+
+
+def rebuild_all_standings(league_ids=None):
+    """
+    Recompute every league table (or those in `league_ids`) in a fixed
+    number of round trips, however many teams and fixtures there are.
+    """
+    if league_ids is not None:
+        league_ids = list(league_ids)
+    with transaction.atomic():
+        delete_departed_teams(league_ids)
+        write_league_tables(sql_league_tables(league_ids))
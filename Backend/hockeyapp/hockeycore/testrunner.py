@@ -0,0 +1,30 @@
+"""
+Test runner that swaps every cache for one in process memory, and the
+shared counters for a directory of the run's own, so a test run never
+shares entries with a server on the same host or with an earlier run.
+"""
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._counter_dir = tempfile.mkdtemp(prefix='hockeyapp-counters-')
+        self._caches = override_settings(
+            CACHES={
+                alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+                for alias in settings.CACHES
+            },
+            COUNTER_DIR=self._counter_dir,
+        )
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        shutil.rmtree(self._counter_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
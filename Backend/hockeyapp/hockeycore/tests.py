@@ -1,3 +1,2206 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import random
+import re
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import brotli
+import msgpack
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import benchmark, compression, counters, dbpool, directory, events, leaderboards, metrics, projections, responsecache, schedule, search, versions
+from .queryplans import full_scans
+from .models import (
+    User, Team, League, LeagueTeam, Fixture, LeagueStanding, MatchEvent, Player, Manager,
+    PlayerStat, PlayerSeasonStat,
+)
+from .playerstats import STAT_FIELDS as PLAYER_STAT_FIELDS, rebuild_player_stats
+from .consumers import LiveMatchConsumer
+from .serializers import (
+    LeagueStandingSerializer, PublicFixtureDetailSerializer, PublicPlayerSerializer, SimpleFixtureSerializer,
+)
+from .layers import UnixSocketChannelLayer
+from .middleware import CompressionMiddleware
+from .pagination import KeysetPagination
+from .search import IndexedSearchFilter
+from .renderers import MessagePackParser, ORJSONParser, ORJSONRenderer
+from .standings import (
+    FixtureResult, apply_result_change, python_league_table, rebuild_all_standings, sql_league_tables,
+)
+from .views import PublicLeagueViewSet
+
+
+class FreshStateMixin:
+    """
+    Starts each test without the directory, search index and leaderboards
+    an earlier test loaded into this process: they outlive the rows the
+    test rolled back.
+    """
+
+    def run(self, result=None):
+        directory._directory = None
+        search._index = None
+        leaderboards._leagues.clear()
+        return super().run(result)
+
+
+class FreshStateTestCase(FreshStateMixin, TestCase):
+    pass
+
+
+class FreshStateTransactionTestCase(FreshStateMixin, TransactionTestCase):
+    pass
+
+
+def make_league(name='Premier', teams=6):
+    league = League.objects.create(
+        name=name, season='2025',
+        start_date=date(2025, 1, 1), end_date=date(2025, 12, 31),
+    )
+    members = []
+    for i in range(teams):
+        team = Team.objects.create(name=f'{name} Team {i:02}', short_name=f'T{i}', founded_year=1990)
+        LeagueTeam.objects.create(league=league, team=team)
+        members.append(team)
+    return league, members
+
+
+def make_fixture(league, home, away, status=Fixture.Status.FINISHED, home_score=0, away_score=0):
+    return Fixture.objects.create(
+        match_datetime=date(2025, 3, 1), venue='Windhoek Hockey Stadium',
+        league_id=league, home_team_id=home, away_team_id=away,
+        status=status, home_team_score=home_score, away_team_score=away_score,
+    )
+
+
+def make_player(team):
+    return Player.objects.create(
+        first_name='Test', last_name=f'Player {Player.objects.count()}',
+        dob=date(2000, 1, 1), nationality='Namibian', team_id=team,
+    )
+
+
+def stored_table(league):
+    return list(
+        LeagueStanding.objects.filter(league_id=league).order_by('position').values(
+            'team_id', 'played', 'wins', 'draws', 'losses',
+            'goals_for', 'goals_against', 'points', 'position',
+        )
+    )
+
+
+class StandingsTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=8)
+        rng = random.Random(2025)
+        for _ in range(40):
+            home, away = rng.sample(self.teams, 2)
+            make_fixture(
+                self.league, home, away,
+                status=rng.choice([Fixture.Status.FINISHED] * 3 + [Fixture.Status.LIVE]),
+                home_score=rng.randint(0, 4), away_score=rng.randint(0, 4),
+            )
+        self.fixtures = list(Fixture.objects.filter(league_id=self.league))
+
+    def test_sql_table_matches_python_table(self):
+        self.assertEqual(
+            sql_league_tables([self.league.pk])[self.league.pk],
+            python_league_table(self.league.pk),
+        )
+
+    def test_sql_table_ignores_teams_outside_league(self):
+        outsider = Team.objects.create(name='Guest XI', short_name='GXI', founded_year=2000)
+        make_fixture(self.league, self.teams[0], outsider, home_score=9, away_score=0)
+
+        self.assertEqual(
+            sql_league_tables([self.league.pk])[self.league.pk],
+            python_league_table(self.league.pk),
+        )
+
+    def test_rebuild_all_covers_every_league(self):
+        other, other_teams = make_league(name='Division One', teams=4)
+        make_fixture(other, other_teams[0], other_teams[1], home_score=2, away_score=2)
+
+        rebuild_all_standings()
+
+        self.assertEqual(stored_table(self.league), python_league_table(self.league.pk))
+        self.assertEqual(stored_table(other), python_league_table(other.pk))
+
+    def test_score_corrections_keep_table_in_sync(self):
+        rng = random.Random(7)
+        for _ in range(15):
+            fixture = Fixture.objects.get(pk=rng.choice(self.fixtures).pk)
+            fixture.home_team_score = rng.randint(0, 5)
+            fixture.status = rng.choice([Fixture.Status.FINISHED, Fixture.Status.LIVE])
+            fixture.save()
+            self.assertEqual(stored_table(self.league), python_league_table(self.league.pk))
+
+        Fixture.objects.get(pk=self.fixtures[0].pk).delete()
+        self.assertEqual(stored_table(self.league), python_league_table(self.league.pk))
+
+
+class IncrementalStandingsTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=6)
+        for i in range(5):
+            make_fixture(self.league, self.teams[i], self.teams[i + 1], home_score=i % 3, away_score=1)
+
+    def assertTableCurrent(self):
+        self.assertEqual(stored_table(self.league), python_league_table(self.league.pk))
+
+    def test_new_results_are_added(self):
+        self.assertTableCurrent()
+        make_fixture(self.league, self.teams[5], self.teams[0], home_score=4, away_score=0)
+        self.assertTableCurrent()
+        make_fixture(self.league, self.teams[2], self.teams[3], status=Fixture.Status.UPCOMING)
+        self.assertTableCurrent()
+
+    def test_score_change_moves_the_table(self):
+        fixture = Fixture.objects.filter(league_id=self.league).first()
+        fixture.home_team_score, fixture.away_team_score = 0, 5
+        fixture.save()
+        self.assertTableCurrent()
+
+    def test_status_change_adds_and_removes_the_result(self):
+        fixture = make_fixture(
+            self.league, self.teams[1], self.teams[4], status=Fixture.Status.LIVE, home_score=2, away_score=2,
+        )
+        self.assertTableCurrent()
+        fixture.status = Fixture.Status.FINISHED
+        fixture.save()
+        self.assertTableCurrent()
+        fixture.status = Fixture.Status.LIVE
+        fixture.save()
+        self.assertTableCurrent()
+
+    def test_deleting_a_result_takes_it_out(self):
+        Fixture.objects.filter(league_id=self.league).first().delete()
+        self.assertTableCurrent()
+
+    def test_rebuild_drops_teams_that_left(self):
+        LeagueTeam.objects.filter(league=self.league, team=self.teams[5]).delete()
+        make_fixture(self.league, self.teams[0], self.teams[1], home_score=2, away_score=0)
+        self.assertTableCurrent()
+
+        # The table matches the membership again, so the next result is applied in place
+        with mock.patch('hockeycore.standings.rebuild_league_standings') as rebuild:
+            make_fixture(self.league, self.teams[2], self.teams[3], home_score=1, away_score=0)
+        rebuild.assert_not_called()
+        self.assertTableCurrent()
+
+    def test_ties_are_ranked_as_a_rebuild_ranks_them(self):
+        # Every team level on points, goal difference and goals for
+        Fixture.objects.filter(league_id=self.league).delete()
+        Team.objects.filter(pk=self.teams[3].pk).update(name='Premier Team 99')
+        Team.objects.filter(pk=self.teams[4].pk).update(name='premier team 00')
+        rebuild_all_standings([self.league.pk])
+        fixture = make_fixture(self.league, self.teams[0], self.teams[1], home_score=1, away_score=1)
+        fixture.delete()
+        self.assertEqual(stored_table(self.league), sql_league_tables([self.league.pk])[self.league.pk])
+
+    def test_updates_cost_a_handful_of_queries(self):
+        for _ in range(30):
+            make_fixture(self.league, self.teams[0], self.teams[1], home_score=1, away_score=1)
+        fixture = Fixture.objects.filter(league_id=self.league).first()
+        old = FixtureResult.from_fixture(fixture)
+        fixture.home_team_score = 7
+        # Savepoint, membership, locked standings, one bulk update, release;
+        # however many fixtures the league has played
+        with self.assertNumQueries(5):
+            apply_result_change(old, FixtureResult.from_fixture(fixture))
+        Fixture.objects.filter(pk=fixture.pk).update(home_team_score=7)
+        self.assertTableCurrent()
+
+
+class FixtureChangeTrackingTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        self.fixture = make_fixture(
+            self.league, self.teams[0], self.teams[1], status=Fixture.Status.LIVE,
+        )
+
+    def test_loaded_fixture_has_no_changes(self):
+        fixture = Fixture.objects.get(pk=self.fixture.pk)
+        self.assertEqual(fixture.changed_fields(), set())
+
+    def test_changes_are_detected_in_memory(self):
+        fixture = Fixture.objects.get(pk=self.fixture.pk)
+        fixture.home_team_score = 2
+        fixture.status = Fixture.Status.FINISHED
+
+        with self.assertNumQueries(0):
+            self.assertEqual(fixture.changed_fields(), {'home_team_score', 'status'})
+
+    def test_save_resets_changes(self):
+        self.fixture.away_team_score = 1
+        self.fixture.save()
+        self.assertEqual(self.fixture.changed_fields(), set())
+        self.assertEqual(self.fixture.loaded_value('away_team_score'), 1)
+
+    def test_update_score_query_count(self):
+        admin = User.objects.create_user('admin@example.com', 'Admin', 'secret', role=User.Role.ADMIN)
+        client = APIClient()
+        client.force_authenticate(admin)
+        url = reverse('fixture-update-score', args=[self.fixture.pk])
+
+        # get_object() and the UPDATE itself
+        with self.assertNumQueries(2):
+            response = client.post(url, {'home_team_score': 3}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Fixture.objects.get(pk=self.fixture.pk).victor_id, self.teams[0].pk)
+
+
+@override_settings(LIVE_MATCH_COALESCE_WINDOW=0)
+class EventBusTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        self.fixture = make_fixture(
+            self.league, self.teams[0], self.teams[1], status=Fixture.Status.LIVE,
+        )
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(events.group_name(self.fixture.pk), self.channel)
+
+    def tearDown(self):
+        async_to_sync(self.layer.flush)()
+
+    def receive(self):
+        return async_to_sync(self.layer.receive)(self.channel)
+
+    def assertNothingSent(self):
+        self.assertTrue(self.layer.channels.get(self.channel) is None
+                        or self.layer.channels[self.channel].empty())
+
+    def test_broadcast_waits_for_commit_and_is_batched(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.fixture.home_team_score = 1
+                self.fixture.save()
+                self.fixture.status = Fixture.Status.FINISHED
+                self.fixture.save()
+                self.assertNothingSent()
+
+        message = self.receive()
+        self.assertEqual(message['type'], 'match_batch')
+        self.assertEqual(
+            [m['data'] for m in message['messages']],
+            [{'score': '1-0', 'status': 'LIVE'}, {'score': '1-0', 'status': 'FINISHED'}],
+        )
+        self.assertNothingSent()
+
+    def test_rolled_back_savepoint_is_not_broadcast(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.fixture.home_team_score = 1
+                self.fixture.save()
+                try:
+                    with transaction.atomic():
+                        self.fixture.home_team_score = 5
+                        self.fixture.save()
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+
+        self.assertEqual(self.receive()['data'], {'score': '1-0', 'status': 'LIVE'})
+        self.assertNothingSent()
+
+    def test_rolled_back_changes_are_not_broadcast(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.fixture.home_team_score = 4
+                    self.fixture.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertNothingSent()
+
+    def test_rolled_back_messages_leave_the_queue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for score in range(3):
+                    try:
+                        with transaction.atomic():
+                            self.fixture.home_team_score = score
+                            self.fixture.save()
+                            raise RuntimeError
+                    except RuntimeError:
+                        pass
+                self.assertEqual(len(events._queued()), 0)
+        self.assertNothingSent()
+
+    def test_bulk_changes_defers_standings_and_broadcasts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with events.bulk_changes():
+                for score in range(3):
+                    self.fixture.home_team_score = score + 1
+                    self.fixture.status = Fixture.Status.FINISHED
+                    self.fixture.save()
+                self.assertFalse(LeagueStanding.objects.exists())
+
+        self.assertEqual(stored_table(self.league), python_league_table(self.league.pk))
+        self.assertEqual(len(self.receive()['messages']), 3)
+
+    def test_bulk_changes_send_one_message_per_fixture_in_autocommit(self):
+        autocommit = mock.patch.object(events.transaction, 'get_autocommit', return_value=True)
+        with autocommit, mock.patch.object(events, 'send_batch') as send_batch:
+            with events.bulk_changes():
+                for fixture_id, score in ((1, '1-0'), (1, '2-0'), (2, '0-1')):
+                    events.publish(fixture_id, 'match_update', {'score': score})
+
+        send_batch.assert_called_once_with({
+            1: [{'type': 'match_update', 'data': {'score': '1-0'}}, {'type': 'match_update', 'data': {'score': '2-0'}}],
+            2: [{'type': 'match_update', 'data': {'score': '0-1'}}],
+        })
+
+    def test_sequence_numbers_count_up_per_fixture(self):
+        other = make_fixture(self.league, self.teams[2], self.teams[3], status=Fixture.Status.LIVE)
+        other_channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(events.group_name(other.pk), other_channel)
+        update = {'type': 'match_update', 'data': {}}
+
+        # Counters outlive the rows of earlier tests, ids included
+        start, other_start = events.current_sequence(self.fixture.pk), events.current_sequence(other.pk)
+
+        with self.assertNumQueries(0):
+            events.send_batch({self.fixture.pk: [update, update], other.pk: [update]})
+            events.send_batch({self.fixture.pk: [update]})
+
+        self.assertEqual([m['seq'] - start for m in self.receive()['messages']], [1, 2])
+        self.assertEqual(self.receive()['seq'] - start, 3)
+        self.assertEqual(async_to_sync(self.layer.receive)(other_channel)['seq'] - other_start, 1)
+        self.assertEqual(events.current_sequence(self.fixture.pk) - start, 3)
+
+    def send_update(self, score):
+        events.send_batch({self.fixture.pk: [{'type': 'match_update', 'data': {'score': score}}]})
+
+    @override_settings(LIVE_MATCH_COALESCE_WINDOW=0.05)
+    def test_score_updates_are_coalesced_per_fixture(self):
+        for home in range(5):
+            self.send_update(f'{home}-0')
+        time.sleep(0.2)
+
+        self.assertEqual([self.receive()['data']['score'] for _ in range(2)], ['0-0', '4-0'])
+        self.assertNothingSent()
+        self.assertNotIn(self.fixture.pk, events._windows)
+
+    @override_settings(LIVE_MATCH_COALESCE_WINDOW=0.05)
+    def test_held_back_update_goes_out_before_an_event(self):
+        self.send_update('0-0')
+        self.send_update('1-0')
+        events.send_batch({self.fixture.pk: [{'type': 'match_event', 'data': {'minute': 10}}]})
+
+        self.assertEqual(self.receive()['data'], {'score': '0-0'})
+        batch = self.receive()
+        self.assertEqual(
+            [(m['type'], m['data']) for m in batch['messages']],
+            [('match_update', {'score': '1-0'}), ('match_event', {'minute': 10})],
+        )
+        time.sleep(0.1)
+        self.assertNothingSent()
+
+    def test_sends_without_a_socket_loop_share_one_loop(self):
+        loops = []
+
+        async def group_send(channel_layer, group, message):
+            loops.append(asyncio.get_running_loop())
+
+        with mock.patch.object(events, '_group_send', group_send):
+            self.send_update('1-0')
+            self.send_update('2-0')
+        self.assertEqual(len(loops), 2)
+        self.assertIs(loops[0], loops[1])
+        self.assertTrue(loops[0].is_running())
+
+    def test_bulk_changes_can_drop_broadcasts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with events.bulk_changes(broadcast=False):
+                self.fixture.home_team_score = 2
+                self.fixture.save()
+        self.assertNothingSent()
+
+
+class UnixSocketChannelLayerTests(SimpleTestCase):
+    def test_group_send_reaches_other_processes(self):
+        async def run(path):
+            sender = UnixSocketChannelLayer(path=path, peer_refresh=0)
+            receiver = UnixSocketChannelLayer(path=path, peer_refresh=0)
+            channel = await receiver.new_channel()
+            await receiver.group_add('live_match_1', channel)
+
+            await sender.group_send('live_match_1', {'type': 'match_update', 'data': {'score': '1-0'}})
+            group_message = await asyncio.wait_for(receiver.receive(channel), 5)
+
+            await sender.send(channel, {'type': 'match_event'})
+            direct_message = await asyncio.wait_for(receiver.receive(channel), 5)
+
+            await sender.close()
+            await receiver.close()
+            return group_message, direct_message
+
+        with tempfile.TemporaryDirectory() as path:
+            group_message, direct_message = asyncio.run(run(path))
+
+        self.assertEqual(group_message['data'], {'score': '1-0'})
+        self.assertEqual(direct_message, {'type': 'match_event'})
+
+    def test_connections_from_an_earlier_loop_are_closed(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        def on_loop(coroutine):
+            return asyncio.run_coroutine_threadsafe(coroutine, loop).result(5)
+
+        with tempfile.TemporaryDirectory() as path:
+            sender = UnixSocketChannelLayer(path=path, peer_refresh=0)
+            receiver = UnixSocketChannelLayer(path=path, peer_refresh=0)
+            channel = on_loop(receiver.new_channel())
+            on_loop(receiver.group_add('live_match_1', channel))
+
+            on_loop(sender.group_send('live_match_1', {'type': 'match_update'}))
+            first = sender._writers[receiver.socket_path]
+            # The same sender, from another loop
+            asyncio.run(sender.group_send('live_match_1', {'type': 'match_update'}))
+            on_loop(asyncio.sleep(0))
+
+            self.assertTrue(first.is_closing())
+            # Both got through
+            for _ in range(2):
+                self.assertEqual(on_loop(receiver.receive(channel))['type'], 'match_update')
+            on_loop(receiver.close())
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+    def test_socket_directory_is_private(self):
+        with tempfile.TemporaryDirectory() as parent:
+            path = os.path.join(parent, 'channels')
+            os.mkdir(path, 0o777)
+            os.chmod(path, 0o777)
+            layer = UnixSocketChannelLayer(path=path)
+            asyncio.run(layer.new_channel())
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o700)
+            asyncio.run(layer.close())
+
+            with mock.patch('os.getuid', return_value=os.getuid() + 1):
+                with self.assertRaises(ImproperlyConfigured):
+                    asyncio.run(UnixSocketChannelLayer(path=path).new_channel())
+
+    def test_oversized_frames_drop_the_peer(self):
+        async def run(path):
+            layer = UnixSocketChannelLayer(path=path)
+            channel = await layer.new_channel()
+            reader, writer = await asyncio.open_unix_connection(layer.socket_path)
+            writer.write(struct.pack('!I', 2 ** 31))
+            closed = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            await layer.close()
+            return channel, closed
+
+        with tempfile.TemporaryDirectory() as path:
+            with self.assertLogs('hockeycore.layers', 'WARNING'):
+                _, closed = asyncio.run(run(path))
+        self.assertEqual(closed, b'')
+
+
+@override_settings(LIVE_MATCH_RESUME_BUFFER=3)
+class LiveMatchConsumerTests(FreshStateTransactionTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=2)
+        self.fixture = make_fixture(
+            self.league, self.teams[0], self.teams[1], status=Fixture.Status.LIVE, home_score=1,
+        )
+        self.seq = events.current_sequence(self.fixture.pk)
+
+    async def make_consumer(self, query_string=b'', subprotocols=()):
+        consumer = LiveMatchConsumer()
+        consumer.scope = {
+            'url_route': {'kwargs': {'fixture_id': str(self.fixture.pk)}},
+            'query_string': query_string,
+            'subprotocols': list(subprotocols),
+        }
+        consumer.channel_layer = get_channel_layer()
+        consumer.channel_name = await consumer.channel_layer.new_channel()
+        consumer.frames = []
+        consumer.binary_frames = 0
+
+        async def accept(subprotocol=None, headers=None):
+            consumer.subprotocol = subprotocol
+
+        async def send(text_data=None, bytes_data=None, close=False):
+            if bytes_data is not None:
+                consumer.binary_frames += 1
+                consumer.frames.append(msgpack.unpackb(bytes_data))
+            else:
+                consumer.frames.append(json.loads(text_data))
+
+        consumer.accept, consumer.send = accept, send
+        await consumer.connect()
+        return consumer
+
+    def update(self, score):
+        self.seq += 1
+        return {'type': 'match_update', 'seq': self.seq, 'data': {'score': score, 'status': 'LIVE'}}
+
+    async def test_connect_sends_snapshot(self):
+        consumer = await self.make_consumer()
+        snapshot = consumer.frames[0]
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertEqual((snapshot['score'], snapshot['status'], snapshot['events']), ('1-0', 'LIVE', []))
+        await consumer.disconnect(1000)
+
+    async def test_second_socket_snapshot_comes_from_memory(self):
+        first = await self.make_consumer()
+        await first.match_update(self.update('2-0'))
+
+        second = await self.make_consumer()
+        self.assertEqual(second.frames[0]['score'], '2-0')
+        await first.disconnect(1000)
+        await second.disconnect(1000)
+
+    async def test_resume_replays_only_missed_messages(self):
+        first = await self.make_consumer()
+        seen, missed = self.update('2-0'), self.update('3-0')
+        await first.match_update(seen)
+        await first.match_update(missed)
+
+        resumed = await self.make_consumer(query_string=f'since={seen["seq"]}'.encode())
+        self.assertEqual(
+            [(f['type'], f['seq'], f['score']) for f in resumed.frames],
+            [('score_update', missed['seq'], '3-0')],
+        )
+        await first.disconnect(1000)
+        await resumed.disconnect(1000)
+
+    async def test_resume_too_far_back_gets_snapshot(self):
+        first = await self.make_consumer()
+        old = self.update('2-0')
+        for message in [old] + [self.update(f'{home}-0') for home in range(3, 7)]:
+            await first.match_update(message)
+
+        resumed = await self.make_consumer(query_string=f'since={old["seq"]}'.encode())
+        self.assertEqual([f['type'] for f in resumed.frames], ['snapshot'])
+        self.assertEqual(resumed.frames[0]['score'], '6-0')
+        await first.disconnect(1000)
+        await resumed.disconnect(1000)
+
+    async def test_resume_from_unknown_seq_gets_snapshot(self):
+        resumed = await self.make_consumer(query_string=b'since=1760000000000000')
+        self.assertEqual([f['type'] for f in resumed.frames], ['snapshot'])
+        await resumed.disconnect(1000)
+
+    async def test_connections_are_counted(self):
+        connects, disconnects = metrics.websocket_connects.value(), metrics.websocket_disconnects.value()
+        group_adds = metrics.channel_layer_seconds.count(operation='group_add', source='consumer')
+
+        consumer = await self.make_consumer()
+        self.assertEqual(metrics.websocket_connects.value(), connects + 1)
+        self.assertEqual(
+            metrics.channel_layer_seconds.count(operation='group_add', source='consumer'), group_adds + 1
+        )
+        await consumer.disconnect(1000)
+        self.assertEqual(metrics.websocket_disconnects.value(), disconnects + 1)
+
+    async def test_events_are_not_merged_and_keep_order(self):
+        consumer = await self.make_consumer()
+        await consumer.match_batch({'messages': [
+            {'type': 'match_update', 'data': {'score': '0-0'}},
+            {'type': 'match_update', 'data': {'score': '1-0'}},
+            {'type': 'match_event', 'data': {'minute': 10}},
+            {'type': 'match_event', 'data': {'minute': 11}},
+        ]})
+
+        self.assertEqual(
+            [(f['type'], f.get('score'), f.get('minute')) for f in consumer.frames[1:]],
+            [('score_update', '0-0', None), ('score_update', '1-0', None),
+             ('match_event', None, 10), ('match_event', None, 11)],
+        )
+        await consumer.disconnect(1000)
+
+    async def test_msgpack_subprotocol_gets_binary_frames(self):
+        text = await self.make_consumer()
+        binary = await self.make_consumer(subprotocols=['msgpack'])
+        self.assertIsNone(text.subprotocol)
+        self.assertEqual(binary.subprotocol, 'msgpack')
+
+        update = self.update('2-0')
+        for consumer in (text, binary):
+            await consumer.match_update(update)
+        self.assertEqual((text.binary_frames, binary.binary_frames), (0, 2))
+        self.assertEqual(binary.frames, text.frames)
+        await text.disconnect(1000)
+        await binary.disconnect(1000)
+
+
+class PublicFixtureQueryCountTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        self.client = APIClient()
+
+    def add_fixtures(self, count):
+        for _ in range(count):
+            fixture = make_fixture(self.league, self.teams[0], self.teams[1], home_score=1)
+            home_player = make_player(self.teams[0])
+            away_player = make_player(self.teams[1])
+            MatchEvent.objects.create(
+                fixture=fixture, minute=12, event_type=MatchEvent.Action.GOAL,
+                player=home_player, assisting=make_player(self.teams[0]),
+            )
+            MatchEvent.objects.create(
+                fixture=fixture, minute=40, event_type=MatchEvent.Action.SUBSTITUTION,
+                player=away_player, sub_in=make_player(self.teams[1]), sub_out=away_player,
+            )
+
+    def assertConstantQueries(self, url, expected):
+        for count in (2, 10):
+            self.add_fixtures(count)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_public_fixture_list(self):
+        # Fixtures with their teams and league, then every event with its players and teams
+        self.assertConstantQueries(reverse('publicfixtures-list'), 2)
+
+    def test_public_match_event_list(self):
+        self.assertConstantQueries(reverse('public-matchevents-list'), 1)
+
+    def test_events_are_in_match_order(self):
+        self.add_fixtures(1)
+        fixture = Fixture.objects.get()
+        response = self.client.get(reverse('publicfixtures-detail', args=[fixture.pk]))
+        self.assertEqual([e['minute'] for e in response.data['match_events']], [12, 40])
+        self.assertEqual(response.data['match_events'][0]['player']['team_name'], self.teams[0].name)
+
+
+class ResponseCacheTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        self.fixture = make_fixture(
+            self.league, self.teams[0], self.teams[1], status=Fixture.Status.LIVE,
+        )
+        self.client = APIClient()
+
+    def get(self, url, cache_status, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], cache_status)
+        return json.loads(response.content)
+
+    def test_repeat_requests_are_served_from_cache(self):
+        url = reverse('simplefixtures-list')
+        before = responsecache.stats().get('simplefixtures', {'hits': 0, 'misses': 0})
+        first = self.get(url, 'MISS')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(url, 'HIT'), first)
+        # Different query parameters are a different entry
+        self.get(url, 'MISS', status='LIVE')
+        self.get(url, 'HIT', status='LIVE')
+
+        after = responsecache.stats()['simplefixtures']
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertEqual(after['misses'] - before['misses'], 2)
+
+    def test_fixture_save_invalidates_fixtures_and_standings(self):
+        fixtures_url = reverse('simplefixtures-list')
+        standings_url = reverse('publicleaguestandings-list')
+        self.get(fixtures_url, 'MISS')
+        self.get(standings_url, 'MISS')
+
+        self.fixture.status = Fixture.Status.FINISHED
+        self.fixture.home_team_score = 2
+        self.fixture.save()
+
+        fixtures = self.get(fixtures_url, 'MISS')
+        self.assertEqual(fixtures[0]['status'], 'FINISHED')
+        standings = self.get(standings_url, 'MISS')
+        self.assertEqual(standings[0]['points'], 3)
+
+    def test_match_event_invalidates_fixture_detail(self):
+        url = reverse('publicfixtures-detail', args=[self.fixture.pk])
+        self.assertEqual(self.get(url, 'MISS')['match_events'], [])
+        MatchEvent.objects.create(
+            fixture=self.fixture, minute=5, event_type=MatchEvent.Action.GOAL,
+            player=make_player(self.teams[0]),
+        )
+        self.assertEqual(len(self.get(url, 'MISS')['match_events']), 1)
+
+    def test_admin_viewset_write_invalidates(self):
+        player = make_player(self.teams[0])
+        url = reverse('publicplayers-list')
+        self.get(url, 'MISS')
+
+        admin = User.objects.create_user('admin@example.com', 'Admin', 'pw', role='ADMIN')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.patch(
+            reverse('player-detail', args=[player.pk]), {'jersey_no': 9}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get(url, 'MISS')[0]['jersey_no'], 9)
+
+    def test_unrelated_writes_keep_entries(self):
+        url = reverse('publicleaguestandings-list')
+        self.get(url, 'MISS')
+        Manager.objects.create(first_name='Jo', last_name='Coach')
+        make_player(self.teams[0])
+        self.get(url, 'HIT')
+
+    def test_cache_stats_endpoint(self):
+        self.get(reverse('publicteams-list'), 'MISS')
+        admin = User.objects.create_user('admin@example.com', 'Admin', 'pw', role='ADMIN')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get(reverse('response-cache-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.data['publicteams']['misses'], 1)
+
+
+class ResponseCacheCommitTests(FreshStateTransactionTestCase):
+    def test_entries_cached_before_commit_are_dropped_on_commit(self):
+        team = Team.objects.create(name='Original', short_name='O', founded_year=1990)
+        client = APIClient()
+        url = reverse('publicteams-list')
+        client.get(url)
+
+        with transaction.atomic():
+            team.name = 'Renamed'
+            team.save()
+            # Anything cached while the write is uncommitted...
+            self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+            self.assertEqual(client.get(url)['X-Cache'], 'HIT')
+
+        # ...is not served once it has committed
+        response = client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(response.content)[0]['name'], 'Renamed')
+
+
+class KeysetPaginationTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        self.client = APIClient()
+
+    def add_fixtures(self, dates):
+        for day in dates:
+            fixture = make_fixture(self.league, self.teams[0], self.teams[1], status=Fixture.Status.UPCOMING)
+            Fixture.objects.filter(pk=fixture.pk).update(match_datetime=date(2025, 3, day))
+
+    def links(self, response):
+        return dict(
+            (rel, url) for url, rel in re.findall(r'<([^>]+)>; rel="(\w+)"', response.get('Link', ''))
+        )
+
+    def walk(self, url, rel='next'):
+        """
+        Follow `rel` links from `url`; returns the pages and the SQL run for each.
+        """
+        pages, queries = [], []
+        while url:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in json.loads(response.content)])
+            queries.append([q['sql'] for q in captured.captured_queries])
+            url = self.links(response).get(rel)
+        return pages, queries
+
+    @mock.patch.object(KeysetPagination, 'page_size', 2)
+    @mock.patch.object(KeysetPagination, 'max_page_size', 3)
+    def test_lists_are_paged_by_default(self):
+        self.add_fixtures([1, 2, 3, 1, 2])
+        for name in ('publicfixtures-list', 'simplefixtures-list', 'publicfixtures-upcoming', 'async-fixtures'):
+            with self.subTest(name=name):
+                pages, _ = self.walk(reverse(name))
+                self.assertEqual([len(page) for page in pages], [2, 2, 1])
+
+        # Asking for more than the cap gets the cap
+        pages, _ = self.walk(reverse('simplefixtures-list') + '?page_size=1000')
+        self.assertEqual([len(page) for page in pages], [3, 2])
+
+    def test_fixture_pages_follow_match_date_then_id(self):
+        # Plenty of ties on the date, which an offset-free cursor must get through
+        self.add_fixtures([3, 1, 2, 1, 3, 1, 2, 2, 1, 3, 1])
+        expected = list(Fixture.objects.order_by('match_datetime', 'id').values_list('id', flat=True))
+
+        directory.get_directory()
+        pages, queries = self.walk(reverse('publicfixtures-list') + '?page_size=3')
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertEqual(sum(pages, []), expected)
+        # Every page costs the same queries, and none of them skips rows with OFFSET
+        self.assertEqual({len(page_queries) for page_queries in queries}, {2})
+        self.assertFalse(any('OFFSET' in sql.upper() for sql in sum(queries, [])))
+
+    def test_previous_links_walk_back(self):
+        self.add_fixtures([1, 1, 2, 2, 2, 3, 4])
+        pages, _ = self.walk(reverse('simplefixtures-list') + '?page_size=2')
+        last = reverse('simplefixtures-list') + '?page_size=2'
+        for _ in range(len(pages) - 1):
+            last = self.links(self.client.get(last))['next']
+
+        back, _ = self.walk(last, rel='prev')
+        self.assertEqual(back, list(reversed(pages)))
+
+    def test_filter_and_ordering_parameters(self):
+        self.add_fixtures([1, 2, 3, 4, 5, 6])
+        Fixture.objects.filter(match_datetime__gte=date(2025, 3, 5)).update(status=Fixture.Status.LIVE)
+
+        pages, _ = self.walk(
+            reverse('simplefixtures-list') + '?page_size=2&status=UPCOMING&ordering=-match_datetime'
+        )
+        days = [
+            Fixture.objects.get(pk=pk).match_datetime.day for pk in sum(pages, [])
+        ]
+        self.assertEqual(days, [4, 3, 2, 1])
+
+    def test_actions_are_paginated(self):
+        self.add_fixtures([1, 2, 3])
+        response = self.client.get(reverse('publicfixtures-upcoming') + '?page_size=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 2)
+        self.assertIn('next', self.links(response))
+
+    def test_players_by_last_name_with_null_ordering_key(self):
+        team = self.teams[0]
+        for last_name, jersey in [('B', None), ('A', 4), ('C', None), ('A', 2), ('B', 9)]:
+            Player.objects.create(
+                first_name='P', last_name=last_name, jersey_no=jersey,
+                dob=date(2000, 1, 1), nationality='Namibian', team_id=team,
+            )
+
+        pages, _ = self.walk(reverse('publicplayers-list') + '?page_size=2')
+        self.assertEqual(
+            sum(pages, []), list(Player.objects.order_by('last_name', 'id').values_list('id', flat=True))
+        )
+        orderings = {
+            'jersey_no': (F('jersey_no').asc(nulls_first=True), 'id'),
+            '-jersey_no': (F('jersey_no').desc(nulls_last=True), 'id'),
+        }
+        for ordering, expected in orderings.items():
+            pages, _ = self.walk(reverse('publicplayers-list') + f'?page_size=2&ordering={ordering}')
+            self.assertEqual(sum(pages, []), list(Player.objects.order_by(*expected).values_list('id', flat=True)))
+
+    def test_single_page_has_no_links(self):
+        self.add_fixtures([1] * 3)
+        response = self.client.get(reverse('simplefixtures-list') + '?page_size=100000')
+        self.assertEqual(len(json.loads(response.content)), 3)
+        self.assertNotIn('Link', response)
+
+    def test_bad_cursor(self):
+        response = self.client.get(reverse('simplefixtures-list') + '?cursor=bm9wZQ')
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryPlanTests(FreshStateTestCase):
+    """
+    Every query behind the public endpoints, as the app calls them, must be
+    answered from an index rather than a full table scan.
+    """
+
+    def setUp(self):
+        self.leagues = []
+        for name in ('North', 'South', 'East'):
+            league, teams = make_league(name, teams=6)
+            self.leagues.append(league)
+            for i, home in enumerate(teams):
+                away = teams[(i + 1) % len(teams)]
+                status = Fixture.Status.FINISHED if i % 2 else Fixture.Status.UPCOMING
+                fixture = make_fixture(league, home, away, status=status, home_score=i % 3)
+                scorer = make_player(home)
+                MatchEvent.objects.create(
+                    fixture=fixture, minute=10 + i, event_type=MatchEvent.Action.GOAL, player=scorer,
+                )
+        self.client = APIClient()
+
+    def endpoints(self):
+        league = self.leagues[0]
+        fixture = Fixture.objects.filter(league_id=league).first()
+        return [
+            # A whole table is a full scan by definition; a page is not
+            reverse('publicleagues-list') + '?page_size=50',
+            reverse('publicteams-list') + '?page_size=50',
+            reverse('publicmanagers-list') + '?page_size=50',
+            reverse('publicplayers-list'),
+            reverse('publicplayers-list') + f'?team_id={fixture.home_team_id_id}',
+            reverse('publicfixtures-list'),
+            reverse('publicfixtures-list') + f'?league_id={league.pk}&status=FINISHED',
+            reverse('publicfixtures-detail', args=[fixture.pk]),
+            reverse('publicfixtures-live'),
+            reverse('simplefixtures-list'),
+            reverse('simplefixtures-list') + '?status=UPCOMING',
+            reverse('simplefixtures-upcoming'),
+            reverse('public-matchevents-list') + f'?fixture={fixture.pk}',
+            reverse('publicleaguestandings-list') + f'?league_id={league.pk}',
+            reverse('publicplayerstats-list') + f'?player_id={fixture.home_team_id.player_set.first().pk}',
+        ]
+
+    def test_public_endpoints_use_indexes(self):
+        for url in self.endpoints():
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                for query in captured.captured_queries:
+                    self.assertEqual(full_scans(query['sql']), [], query['sql'])
+
+    def test_unindexed_filter_is_reported(self):
+        with CaptureQueriesContext(connection) as captured:
+            list(Player.objects.filter(nationality='Namibian'))
+        self.assertEqual(full_scans(captured.captured_queries[0]['sql']), ['hockeycore_player'])
+
+
+class PlayerStatsTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        self.fixtures = [
+            make_fixture(self.league, self.teams[0], self.teams[1], status=Fixture.Status.LIVE),
+            make_fixture(self.league, self.teams[0], self.teams[2], status=Fixture.Status.LIVE),
+        ]
+        self.scorer = make_player(self.teams[0])
+        self.assistant = make_player(self.teams[0])
+        self.bench = make_player(self.teams[0])
+
+    def event(self, fixture, event_type, **kwargs):
+        kwargs.setdefault('player', self.scorer)
+        return MatchEvent.objects.create(fixture=fixture, minute=10, event_type=event_type, **kwargs)
+
+    def season(self, player, league=None):
+        row = PlayerSeasonStat.objects.filter(player_id=player, league_id=league or self.league).first()
+        if row is None:
+            return None
+        return {field: getattr(row, field) for field in PLAYER_STAT_FIELDS if getattr(row, field)}
+
+    def stored(self):
+        return {
+            model.__name__: sorted(
+                tuple(row) for row in model.objects.values_list('player_id', *PLAYER_STAT_FIELDS)
+            )
+            for model in (PlayerStat, PlayerSeasonStat)
+        }
+
+    def test_events_add_up_per_fixture_and_season(self):
+        self.event(self.fixtures[0], MatchEvent.Action.GOAL, assisting=self.assistant)
+        self.event(self.fixtures[1], MatchEvent.Action.GOAL)
+        self.event(self.fixtures[1], MatchEvent.Action.CARD, card_type='yellow')
+        self.event(
+            self.fixtures[1], MatchEvent.Action.SUBSTITUTION,
+            sub_in=self.bench, sub_out=self.scorer,
+        )
+
+        self.assertEqual(
+            PlayerStat.objects.get(player_id=self.scorer, fixture_id=self.fixtures[1]).goals, 1
+        )
+        self.assertEqual(self.season(self.scorer), {'goals': 2, 'yellow_cards': 1, 'subbed_off': 1})
+        self.assertEqual(self.season(self.assistant), {'assists': 1})
+        self.assertEqual(self.season(self.bench), {'subbed_on': 1})
+
+    def test_edits_and_deletes_move_the_counts(self):
+        goal = self.event(self.fixtures[0], MatchEvent.Action.GOAL, assisting=self.assistant)
+
+        goal = MatchEvent.objects.get(pk=goal.pk)
+        goal.player, goal.assisting = self.assistant, self.scorer
+        goal.save()
+        self.assertEqual(self.season(self.scorer), {'assists': 1})
+        self.assertEqual(self.season(self.assistant), {'goals': 1})
+
+        goal.event_type, goal.card_type = MatchEvent.Action.CARD, 'red'
+        goal.save()
+        self.assertIsNone(self.season(self.scorer))
+        self.assertEqual(self.season(self.assistant), {'red_cards': 1})
+
+        goal.delete()
+        self.assertFalse(PlayerStat.objects.exists())
+        self.assertFalse(PlayerSeasonStat.objects.exists())
+
+    def test_deleting_a_fixture_takes_its_events_out_of_the_season(self):
+        self.event(self.fixtures[0], MatchEvent.Action.GOAL)
+        self.event(self.fixtures[1], MatchEvent.Action.GOAL)
+        self.fixtures[0].delete()
+        self.assertEqual(self.season(self.scorer), {'goals': 1})
+
+    def test_moving_a_fixture_moves_its_season_totals(self):
+        other, _ = make_league('Cup', teams=0)
+        self.event(self.fixtures[0], MatchEvent.Action.GOAL)
+        self.event(self.fixtures[1], MatchEvent.Action.GOAL)
+
+        fixture = Fixture.objects.get(pk=self.fixtures[0].pk)
+        fixture.league_id = other
+        fixture.save()
+        self.assertEqual(self.season(self.scorer), {'goals': 1})
+        self.assertEqual(self.season(self.scorer, other), {'goals': 1})
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.event(self.fixtures[0], MatchEvent.Action.GOAL, assisting=self.assistant)
+        self.event(self.fixtures[1], MatchEvent.Action.CARD, card_type='green', player=self.bench)
+        sub = self.event(
+            self.fixtures[1], MatchEvent.Action.SUBSTITUTION, sub_in=self.bench, sub_out=self.assistant,
+        )
+        sub.minute = 30
+        sub.save()
+        incremental = self.stored()
+
+        rebuild_player_stats()
+        self.assertEqual(self.stored(), incremental)
+
+    def test_profile_endpoint_is_one_query(self):
+        self.event(self.fixtures[0], MatchEvent.Action.GOAL)
+        url = reverse('publicplayerstats-list') + f'?player_id={self.scorer.pk}'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [{
+            'player_id': self.scorer.pk, 'league_id': self.league.pk,
+            'league_name': self.league.name, 'season': '2025',
+            'goals': 1, 'assists': 0, 'green_cards': 0, 'yellow_cards': 0, 'red_cards': 0,
+            'subbed_on': 0, 'subbed_off': 0,
+        }])
+
+
+class BulkMatchEventTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=2)
+        self.fixture = make_fixture(self.league, self.teams[0], self.teams[1], status=Fixture.Status.LIVE)
+        self.players = [make_player(self.teams[i % 2]) for i in range(6)]
+        admin = User.objects.create_user('admin@example.com', 'Admin', 'pw', role='ADMIN')
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        self.url = reverse('matchevent-bulk')
+
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(events.group_name(self.fixture.pk), self.channel)
+        self.addCleanup(async_to_sync(self.layer.flush))
+
+    def queued_events(self, count=30):
+        rng = random.Random(3)
+        items = []
+        for minute in rng.sample(range(1, 70), count):
+            player, other = rng.sample(self.players, 2)
+            kind = rng.choice(['goal', 'card', 'substitution', 'shot'])
+            item = {'minute': minute, 'event_type': kind, 'player': player.pk}
+            if kind == 'goal':
+                item['assisting'] = other.pk
+            elif kind == 'card':
+                item['card_type'] = 'yellow'
+            elif kind == 'substitution':
+                item.update(sub_in=other.pk, sub_out=player.pk)
+            items.append(item)
+        return items
+
+    def stats(self):
+        return sorted(PlayerSeasonStat.objects.values_list('player_id', *PLAYER_STAT_FIELDS))
+
+    def test_one_request_one_broadcast(self):
+        items = self.queued_events()
+        directory.get_directory()
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    self.url, {'fixture': self.fixture.pk, 'events': items}, format='json',
+                )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 30)
+        self.assertEqual(MatchEvent.objects.filter(fixture=self.fixture).count(), 30)
+        # Validation and the insert take one query each, however many events;
+        # the stats take a few per player
+        sql = [query['sql'] for query in queries]
+        self.assertEqual(len([q for q in sql if q.startswith('SELECT "hockeycore_player".')]), 1)
+        self.assertEqual(len([q for q in sql if 'hockeycore_matchevent' in q]), 1)
+        self.assertLessEqual(len([q for q in sql if 'playerstat' in q]), 4 * len(self.players) + 1)
+
+        message = async_to_sync(self.layer.receive)(self.channel)
+        self.assertEqual(message['type'], 'match_batch')
+        sent = [m['data'] for m in message['messages']]
+        self.assertEqual([data['minute'] for data in sent], sorted(item['minute'] for item in items))
+        self.assertEqual([data['id'] for data in sent], [row['id'] for row in response.data['events']])
+        self.assertTrue(self.layer.channels.get(self.channel) is None or self.layer.channels[self.channel].empty())
+
+        stats = self.stats()
+        rebuild_player_stats()
+        self.assertEqual(stats, self.stats())
+
+    def test_invalid_batch_creates_nothing(self):
+        items = self.queued_events(3)
+        items[1]['player'] = 999999
+        items[2] = {'minute': 5, 'event_type': 'card', 'player': self.players[0].pk}
+        response = self.client.post(self.url, {'fixture': self.fixture.pk, 'events': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('card_type', str(response.data['events'][2]))
+
+        items[2]['card_type'] = 'red'
+        response = self.client.post(self.url, {'fixture': self.fixture.pk, 'events': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['events'][0], {})
+        self.assertIn('player', response.data['events'][1])
+        self.assertFalse(MatchEvent.objects.exists())
+
+
+class DirectoryTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=2)
+        self.fixture = make_fixture(self.league, self.teams[0], self.teams[1], status=Fixture.Status.LIVE)
+        self.scorer = make_player(self.teams[0])
+        self.assistant = make_player(self.teams[0])
+
+    def test_records_are_updated_in_place_on_commit(self):
+        people = directory.get_directory()
+        self.assertEqual(people.player(self.scorer.pk).name, 'Test Player 0')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teams[0].name = 'Renamed'
+            self.teams[0].save()
+            newcomer = make_player(self.teams[1])
+            self.assistant.delete()
+
+        with self.assertNumQueries(0):
+            people = directory.get_directory()
+        self.assertEqual(people.team(self.teams[0].pk).name, 'Renamed')
+        self.assertEqual(people.player(newcomer.pk).team_id, self.teams[1].pk)
+        self.assertIsNone(people.player(self.assistant.pk))
+
+    def test_changes_in_other_processes_reload_it(self):
+        directory.get_directory()
+        Team.objects.filter(pk=self.teams[1].pk).update(short_name='NEW')
+        directory.reload()
+        self.assertEqual(directory.get_directory().team(self.teams[1].pk).short_name, 'NEW')
+
+    def test_saves_of_other_columns_leave_it_alone(self):
+        version = directory.get_directory().version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scorer.jersey_no = 9
+            self.scorer.save(update_fields=['jersey_no'])
+        self.assertEqual(directory.get_directory().version, version)
+
+    def test_broadcast_payload_reads_no_rows(self):
+        directory.get_directory()
+        event = MatchEvent(
+            id=1, fixture_id=self.fixture.pk, minute=9, event_type=MatchEvent.Action.GOAL,
+            player_id=self.scorer.pk, assisting_id=self.assistant.pk,
+        )
+        with self.assertNumQueries(0):
+            payload = event.broadcast_payload()
+        self.assertEqual(payload['team'], {'id': self.teams[0].pk, 'name': self.teams[0].name})
+        self.assertEqual(payload['assistant'], {'id': self.assistant.pk, 'name': 'Test Player 1'})
+
+    def test_unknown_rows_fall_back_to_the_database(self):
+        directory.get_directory()
+        # Committed elsewhere, not yet seen by this process
+        team = Team.objects.create(name='Late Joiners', short_name='LJ', founded_year=2020)
+        late = make_player(team)
+        response = APIClient().get(reverse('publicplayers-detail', args=[late.pk]))
+        self.assertEqual(response.data['team_name'], 'Late Joiners')
+
+
+class ProjectionTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        Team.objects.filter(pk=self.teams[1].pk).update(logo_url='https://example.com/t1.png')
+        for i, (home, away) in enumerate([(0, 1), (2, 3), (1, 2), (3, 0)]):
+            fixture = make_fixture(self.league, self.teams[home], self.teams[away], home_score=i)
+            if i == 3:
+                Fixture.objects.filter(pk=fixture.pk).update(home_team_score=None, status=Fixture.Status.LIVE)
+        for i in range(6):
+            player = make_player(self.teams[i % 4])
+            if i % 2:
+                Player.objects.filter(pk=player.pk).update(jersey_no=i, position='F', height_cm=180)
+        rebuild_all_standings([self.league.pk])
+        directory.reload()
+
+    def assertSameAsSerializer(self, serializer_class, queryset):
+        projection = projections.projection_for(serializer_class)
+        expected = serializer_class(queryset, many=True).data
+        self.assertEqual(
+            json.dumps(projection.render(queryset.values(*projection.columns))),
+            json.dumps(expected),
+        )
+
+    def test_output_matches_the_serializers(self):
+        self.assertSameAsSerializer(SimpleFixtureSerializer, Fixture.objects.order_by('id'))
+        self.assertSameAsSerializer(PublicPlayerSerializer, Player.objects.order_by('id'))
+        self.assertSameAsSerializer(LeagueStandingSerializer, LeagueStanding.objects.order_by('position'))
+
+    def test_unsupported_fields_are_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            projections.Projection(PublicFixtureDetailSerializer)
+
+    def test_pages_through_values_rows(self):
+        url = reverse('publicplayers-list') + '?ordering=-jersey_no&page_size=4'
+        first = self.client.get(url)
+        next_url = re.search(r'<([^>]+)>; rel="next"', first['Link']).group(1)
+        rows = json.loads(first.content) + json.loads(self.client.get(next_url).content)
+        expected = PublicPlayerSerializer(
+            Player.objects.order_by(F('jersey_no').desc(nulls_last=True), 'id'), many=True,
+        ).data
+        self.assertEqual(rows, json.loads(json.dumps(expected)))
+
+
+
+class RendererTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        self.fixture = make_fixture(self.league, self.teams[0], self.teams[1], home_score=2)
+        MatchEvent.objects.create(
+            fixture=self.fixture, minute=12, event_type='GOAL', player=make_player(self.teams[0]),
+        )
+
+    def test_json_matches_drf_renderer(self):
+        data = {
+            'when': timezone.now(), 'day': date(2025, 1, 2), 'amount': Decimal('1.50'),
+            'name': 'Zoë', 'ids': [1, 2], 3: None,
+            'fixtures': PublicFixtureDetailSerializer(Fixture.objects.all(), many=True).data,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_json_edge_cases_match_drf_renderer(self):
+        for data in ({'note': 'line\u2028break\u2029'}, {'big': 2 ** 70, 'small': -2 ** 64}, [2 ** 63, 'x']):
+            with self.subTest(data=data):
+                self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_msgpack_is_negotiated_and_cached_separately(self):
+        url = reverse('simplefixtures-list')
+        as_json = self.client.get(url)
+        as_msgpack = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(as_msgpack['Content-Type'], 'application/msgpack')
+        self.assertEqual(as_msgpack['X-Cache'], 'MISS')
+        self.assertEqual(msgpack.unpackb(as_msgpack.content), json.loads(as_json.content))
+        self.assertLess(len(as_msgpack.content), len(as_json.content))
+
+        again = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual((again['X-Cache'], again.content), ('HIT', as_msgpack.content))
+
+    def test_parsers_read_both_formats(self):
+        payload = {'fixture': self.fixture.pk, 'events': [{'minute': 1, 'ids': [1, 2]}]}
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(json.dumps(payload).encode())), payload)
+        self.assertEqual(MessagePackParser().parse(io.BytesIO(msgpack.packb(payload))), payload)
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"fixture": '))
+
+
+
+@override_settings(RESPONSE_COMPRESSION_MIN_SIZE=200)
+class CompressionTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=6)
+        for home, away in [(0, 1), (2, 3), (4, 5), (1, 0)]:
+            make_fixture(self.league, self.teams[home], self.teams[away])
+        self.url = reverse('simplefixtures-list')
+
+    def test_negotiation(self):
+        factory = RequestFactory()
+        for header, encoding in [
+            ('gzip, deflate, br', 'br'), ('gzip;q=1.0, br;q=0.5', 'gzip'), ('br;q=0, gzip', 'gzip'),
+            ('*', 'br'), ('identity', None), ('', None),
+        ]:
+            with self.subTest(header=header):
+                request = factory.get('/', HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(compression.negotiate(request), encoding)
+
+    def test_cached_responses_are_compressed_once_per_encoding(self):
+        plain = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        with mock.patch.object(compression, 'compress', wraps=compression.compress) as compress:
+            for encoding, decompress in [('gzip', gzip.decompress), ('br', brotli.decompress)] * 2:
+                response = self.client.get(self.url, HTTP_ACCEPT_ENCODING=encoding)
+                self.assertEqual((response['X-Cache'], response['Content-Encoding']), ('HIT', encoding))
+                self.assertEqual(decompress(response.content), plain.content)
+        self.assertEqual([call.args[1] for call in compress.call_args_list], ['gzip', 'br'])
+
+        # A write makes new entries, compressed afresh
+        Fixture.objects.filter(pk=Fixture.objects.first().pk).update(venue='Elsewhere')
+        responsecache.invalidate('fixtures')
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn(b'Elsewhere', gzip.decompress(response.content))
+
+    def test_small_responses_are_left_alone(self):
+        with self.settings(RESPONSE_COMPRESSION_MIN_SIZE=10 ** 6):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        json.loads(response.content)
+
+    def test_middleware_under_asgi(self):
+        body = json.dumps([{'team': 'Windhoek Wanderers'}] * 50).encode()
+
+        async def get_response(request):
+            return HttpResponse(body, content_type='application/json')
+
+        middleware = CompressionMiddleware(get_response)
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = asyncio.run(middleware(request))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), body)
+
+    @override_settings(RESPONSE_COMPRESSION_OFFLOAD_SIZE=2000)
+    def test_large_bodies_are_compressed_off_the_event_loop(self):
+        threads = []
+        compress = compression.compress
+
+        def record_thread(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return compress(*args, **kwargs)
+
+        async def run():
+            responses = []
+            for size in (20, 100):
+                body = json.dumps([{'team': 'Windhoek Wanderers'}] * size).encode()
+                middleware = CompressionMiddleware(
+                    sync_to_async(lambda request: HttpResponse(body, content_type='application/json'))
+                )
+                responses.append(await middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')))
+            return threading.get_ident(), responses
+
+        with mock.patch.object(compression, 'compress', record_thread):
+            loop_thread, responses = asyncio.run(run())
+        self.assertEqual([response['Content-Encoding'] for response in responses], ['gzip', 'gzip'])
+        self.assertEqual(threads[0], loop_thread)
+        self.assertNotEqual(threads[1], loop_thread)
+
+
+class SparseFieldsetTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        manager = Manager.objects.create(first_name='Coach', last_name='One')
+        Team.objects.filter(pk=self.teams[0].pk).update(manager=manager)
+        for home, away in [(0, 1), (2, 3)]:
+            fixture = make_fixture(self.league, self.teams[home], self.teams[away], home_score=2)
+            MatchEvent.objects.create(
+                fixture=fixture, minute=5, event_type='GOAL', player=make_player(self.teams[home]),
+            )
+        admin = User.objects.create_user('admin@example.com', 'Admin', 'pw', role='ADMIN')
+        self.admin = APIClient()
+        self.admin.force_authenticate(admin)
+        directory.get_directory()
+
+    def get(self, client, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content), [query['sql'] for query in queries]
+
+    def test_nested_fields_trim_output_and_joins(self):
+        url = reverse('fixture-list')
+        full, _ = self.get(self.admin, url)
+        rows, queries = self.get(
+            self.admin, url, fields='id,home_team.name,home_team.manager.last_name,away_team,status',
+        )
+        self.assertEqual(rows, [
+            {
+                'id': row['id'],
+                'home_team': {
+                    'name': row['home_team']['name'],
+                    'manager': row['home_team']['manager'] and {'last_name': row['home_team']['manager']['last_name']},
+                },
+                'away_team': row['away_team']['id'],
+                'status': row['status'],
+            }
+            for row in full
+        ])
+        fixtures = [sql for sql in queries if 'FROM "hockeycore_fixture"' in sql]
+        self.assertEqual(len(fixtures), 1)
+        self.assertIn('"hockeycore_manager"."last_name"', fixtures[0])
+        self.assertNotIn('venue', fixtures[0])
+        self.assertNotIn('"hockeycore_league"', fixtures[0])
+        self.assertNotIn('"hockeycore_manager"."phone"', fixtures[0])
+
+    def test_expand_sends_the_whole_object(self):
+        url = reverse('fixture-list')
+        full, _ = self.get(self.admin, url)
+        rows, queries = self.get(self.admin, url, fields='id', expand='victor,home_team.manager')
+        self.assertEqual(rows, [
+            {'id': row['id'], 'victor': row['victor'], 'home_team': row['home_team']} for row in full
+        ])
+        # The manager comes with the team, not from a query per row
+        self.assertFalse([sql for sql in queries if sql.startswith('SELECT') and 'FROM "hockeycore_manager"' in sql])
+
+    def test_method_fields_read_declared_lookups(self):
+        url = reverse('publicfixtures-list')
+        rows, queries = self.get(self.client, url, fields='id,score,league')
+        self.assertEqual(rows[0], {
+            'id': rows[0]['id'], 'score': '2-0',
+            'league': {'id': self.league.pk, 'name': self.league.name, 'season': self.league.season},
+        })
+        self.assertFalse([sql for sql in queries if 'hockeycore_matchevent' in sql])
+
+        rows, queries = self.get(self.client, url, fields='id,match_events')
+        self.assertEqual([len(row['match_events']) for row in rows], [1, 1])
+
+    def test_projected_lists_select_fewer_columns(self):
+        url = reverse('publicplayers-list')
+        full, _ = self.get(self.client, url)
+        rows, queries = self.get(self.client, url, fields='id,last_name,team_name')
+        self.assertEqual(rows, [
+            {'id': row['id'], 'last_name': row['last_name'], 'team_name': row['team_name']} for row in full
+        ])
+        self.assertNotIn('nationality', queries[-1])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(reverse('publicplayers-list'), {'fields': 'id,salary'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('salary', response.json()['fields'][0])
+
+    def test_bad_expansions_and_nested_paths_are_rejected(self):
+        cases = [
+            ('fixture-list', {'expand': 'bogus'}, 'expand', 'bogus'),
+            ('fixture-list', {'expand': 'home_team.bogus'}, 'expand', 'bogus'),
+            ('fixture-list', {'expand': 'status'}, 'expand', 'status'),
+            ('fixture-list', {'fields': 'id,status.name'}, 'fields', 'status'),
+            ('fixture-list', {'fields': 'id,home_team.bogus'}, 'fields', 'bogus'),
+            ('matchevent-list', {'fields': 'id,player.team_name'}, 'fields', 'player'),
+        ]
+        for name, params, param, culprit in cases:
+            with self.subTest(params=params):
+                response = self.admin.get(reverse(name), params)
+                self.assertEqual(response.status_code, 400, response.content)
+                self.assertIn(culprit, response.json()[param][0])
+
+    def test_writes_ignore_the_selection(self):
+        player = Player.objects.first()
+        response = self.admin.patch(
+            reverse('player-detail', args=[player.pk]) + '?fields=id', {'jersey_no': 7}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['jersey_no'], 7)
+
+
+class AsyncReadTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=4)
+        for home, away in [(0, 1), (2, 3), (1, 2)]:
+            fixture = make_fixture(self.league, self.teams[home], self.teams[away], home_score=1)
+            MatchEvent.objects.create(
+                fixture=fixture, minute=5, event_type='GOAL', player=make_player(self.teams[home]),
+            )
+        directory.get_directory()
+
+    def assertSameAs(self, async_name, sync_name, **params):
+        expected = self.client.get(reverse(sync_name), params)
+        response = self.client.get(reverse(async_name), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(
+            response.get('Link', '').replace(reverse(async_name), reverse(sync_name)), expected.get('Link', ''),
+        )
+        return response
+
+    def test_lists_match_the_sync_viewsets(self):
+        self.assertSameAs('async-fixtures', 'simplefixtures-list')
+        self.assertSameAs('async-fixtures', 'simplefixtures-list', page_size=2, ordering='-match_datetime')
+        self.assertSameAs('async-fixtures', 'simplefixtures-list', league_id=self.league.pk, fields='id,home_team_name')
+        self.assertSameAs('async-standings', 'publicleaguestandings-list')
+        self.assertSameAs('async-players', 'publicplayers-list', page_size=2, fields='id,last_name,team_name')
+        self.assertSameAs('async-matchevents', 'public-matchevents-list')
+        self.assertSameAs('async-matchevents', 'public-matchevents-list', fields='id,player.first_name')
+
+    def test_next_page(self):
+        first = self.client.get(reverse('async-players'), {'page_size': 2})
+        next_url = re.search(r'<([^>]+)>; rel="next"', first['Link']).group(1)
+        second = self.client.get(next_url)
+        ids = [row['id'] for row in first.json() + second.json()]
+        self.assertEqual(ids, [row['id'] for row in self.client.get(reverse('publicplayers-list')).json()])
+
+    def test_repeat_requests_hit_the_cache(self):
+        url = reverse('async-fixtures')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        make_fixture(self.league, self.teams[3], self.teams[0])
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()), 4)
+
+    def test_msgpack(self):
+        response = self.client.get(reverse('async-standings'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(
+            msgpack.unpackb(response.content), self.client.get(reverse('publicleaguestandings-list')).json(),
+        )
+
+    def test_formats_are_negotiated_like_the_viewsets(self):
+        url, sync_url = reverse('async-standings'), reverse('publicleaguestandings-list')
+        cases = [
+            ({'HTTP_ACCEPT': 'application/json, application/msgpack;q=0.1'}, ''),
+            ({'HTTP_ACCEPT': 'application/msgpack'}, ''),
+            ({}, '?format=msgpack'),
+            ({'HTTP_ACCEPT': 'text/csv'}, ''),
+        ]
+        for headers, query in cases:
+            with self.subTest(headers=headers, query=query):
+                expected = self.client.get(sync_url + query, **headers)
+                response = self.client.get(url + query, **headers)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response['Content-Type'], expected['Content-Type'])
+                self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.status_code, 406)
+
+    def test_bad_parameters_are_rejected(self):
+        cases = [
+            ('async-players', 'publicplayers-list', {'jersey_no': 'abc'}),
+            ('async-players', 'publicplayers-list', {'fields': 'id,salary'}),
+            ('async-fixtures', 'simplefixtures-list', {'status': 'BOGUS'}),
+            ('async-matchevents', 'public-matchevents-list', {'player': 999999}),
+            ('async-fixtures', 'simplefixtures-list', {'cursor': 'bogus'}),
+        ]
+        for async_name, sync_name, params in cases:
+            with self.subTest(params=params):
+                expected = self.client.get(reverse(sync_name), params)
+                response = self.client.get(reverse(async_name), params)
+                self.assertIn(response.status_code, (400, 404))
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+    def test_filters_and_ordering_are_the_viewsets(self):
+        self.assertSameAs('async-fixtures', 'simplefixtures-list', status='FINISHED', ordering='-match_datetime')
+        self.assertSameAs('async-players', 'publicplayers-list', jersey_no__gte=5, ordering='-jersey_no')
+        self.assertSameAs('async-matchevents', 'public-matchevents-list', fixture=Fixture.objects.first().pk)
+
+
+class CounterTests(SimpleTestCase):
+    def test_concurrent_adds_get_values_of_their_own(self):
+        name = f'test:{uuid.uuid4().hex}'
+        values = []
+
+        def add():
+            for _ in range(50):
+                values.append(counters.add(name))
+
+        threads = [threading.Thread(target=add) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(values), list(range(1, 401)))
+        self.assertEqual(counters.get(name), 400)
+        self.assertEqual(counters.add(name, 5), 405)
+
+    def test_missing_counter_reads_zero(self):
+        self.assertEqual(counters.get(f'test:{uuid.uuid4().hex}'), 0)
+
+
+class RankedSetTests(SimpleTestCase):
+    def test_matches_a_sorted_list(self):
+        rng = random.Random(7)
+        ranked, expected = leaderboards.RankedSet(), set()
+        for _ in range(2000):
+            key = (rng.randint(-20, 0), rng.randint(1, 50))
+            if rng.random() < 0.6:
+                ranked.add(key)
+                expected.add(key)
+            else:
+                ranked.discard(key)
+                expected.discard(key)
+        ordered = sorted(expected)
+        self.assertEqual(list(ranked), ordered)
+        self.assertEqual(len(ranked), len(ordered))
+        for index in rng.sample(range(len(ordered)), 50):
+            self.assertEqual(ranked[index], ordered[index])
+            self.assertEqual(ranked.rank(ordered[index]), index)
+
+    def test_ties_share_a_rank(self):
+        board = leaderboards.Leaderboard()
+        for player_id, count in ((1, 3), (2, 5), (3, 3), (4, 1)):
+            board.set(player_id, count)
+        self.assertEqual(board.top(10), [(1, 2, 5), (2, 1, 3), (2, 3, 3), (4, 4, 1)])
+        self.assertEqual(board.rank(3), 2)
+        board.add(4, -1)
+        self.assertIsNone(board.rank(4))
+        self.assertEqual(len(board), 3)
+
+    def test_reads_wait_for_changes_being_applied(self):
+        board = leaderboards.Leaderboard()
+        board.set(1, 3)
+        rows = []
+        with leaderboards._lock:
+            thread = threading.Thread(target=lambda: rows.append(board.top(10)))
+            thread.start()
+            board.set(2, 5)
+            thread.join(0.1)
+            self.assertEqual(rows, [])
+        thread.join(5)
+        self.assertEqual(rows, [[(1, 2, 5), (2, 1, 3)]])
+
+
+class LeaderboardTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=2)
+        self.fixture = make_fixture(self.league, self.teams[0], self.teams[1], status=Fixture.Status.LIVE)
+        self.players = [make_player(self.teams[0]) for _ in range(3)]
+
+    def event(self, player, event_type=MatchEvent.Action.GOAL, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return MatchEvent.objects.create(
+                fixture=self.fixture, minute=10, event_type=event_type, player=player, **kwargs
+            )
+
+    def scorers(self):
+        return leaderboards.board(self.league.pk, 'scorers').top(10)
+
+    def test_events_move_the_loaded_board_in_place(self):
+        self.event(self.players[0])
+        self.assertEqual(self.scorers(), [(1, self.players[0].pk, 1)])
+
+        with self.assertNumQueries(0):
+            leaderboards.board(self.league.pk, 'scorers')
+
+        goal = self.event(self.players[1], assisting=self.players[0])
+        self.event(self.players[1])
+        self.event(self.players[2], MatchEvent.Action.CARD, card_type='yellow')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scorers(), [(1, self.players[1].pk, 2), (2, self.players[0].pk, 1)])
+            self.assertEqual(
+                leaderboards.board(self.league.pk, 'assists').top(10), [(1, self.players[0].pk, 1)]
+            )
+            self.assertEqual(
+                leaderboards.board(self.league.pk, 'cards').top(10), [(1, self.players[2].pk, 1)]
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            goal.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scorers(), [(1, self.players[0].pk, 1), (1, self.players[1].pk, 1)])
+            self.assertEqual(leaderboards.board(self.league.pk, 'assists').top(10), [])
+
+    def test_change_from_another_process_reloads(self):
+        self.event(self.players[0])
+        self.assertEqual(self.scorers(), [(1, self.players[0].pk, 1)])
+
+        # Another worker commits a goal: the row moves and the version is bumped
+        PlayerSeasonStat.objects.filter(player_id=self.players[0]).update(goals=F('goals') + 1)
+        leaderboards._bump(self.league.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.scorers(), [(1, self.players[0].pk, 2)])
+
+    def test_endpoint(self):
+        self.event(self.players[0])
+        self.event(self.players[0])
+        self.event(self.players[1])
+        url = reverse('leaderboard', args=[self.league.pk, 'scorers'])
+        response = self.client.get(url + '?limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [{
+            'rank': 1, 'player_id': self.players[0].pk, 'name': str(self.players[0]),
+            'team_id': self.teams[0].pk, 'team_name': self.teams[0].name, 'count': 2,
+        }])
+        self.assertEqual(self.client.get(reverse('leaderboard', args=[self.league.pk, 'saves'])).status_code, 404)
+
+    def test_endpoint_reads_unknown_players_and_teams_from_the_database(self):
+        self.event(self.players[0])
+        people = directory.get_directory()
+        # Committed by another process, not seen by this one yet
+        people.players.pop(self.players[0].pk)
+        people.teams.pop(self.teams[0].pk)
+
+        response = self.client.get(reverse('leaderboard', args=[self.league.pk, 'scorers']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['name'], row['team_name']) for row in json.loads(response.content)],
+            [(str(self.players[0]), self.teams[0].name)],
+        )
+
+
+class SearchTests(FreshStateTestCase):
+    def setUp(self):
+        self.manager = Manager.objects.create(first_name='Erik', last_name='Windhorst')
+        self.league, (self.home, self.away) = make_league(teams=2)
+        Team.objects.filter(pk=self.home.pk).update(name='Windhoek Wanderers', short_name='WW', manager=self.manager)
+        Team.objects.filter(pk=self.away.pk).update(name='Swakop Stars', short_name='SS')
+        self.fixture = make_fixture(self.league, self.home, self.away)
+        Fixture.objects.filter(pk=self.fixture.pk).update(venue='Independence Stadium')
+        self.home.refresh_from_db()
+        self.players = [
+            Player.objects.create(
+                first_name=first, last_name=last, nationality=nationality,
+                dob=date(2000, 1, 1), team_id=team,
+            )
+            for first, last, nationality, team in (
+                ('Renée', 'Windt', 'Namibian', self.away),
+                ('John', 'Johnson', 'German', self.home),
+                ('Paul', 'Smith', 'Namibian', self.home),
+            )
+        ]
+
+    def results(self, query, **kwargs):
+        return [(row['type'], row['id']) for row in search.get_index().search(query, **kwargs)]
+
+    def test_prefix_substring_and_typos(self):
+        self.assertEqual(self.results('john'), [('player', self.players[1].pk)])
+        self.assertEqual(self.results('renee'), [('player', self.players[0].pk)])
+        self.assertEqual(self.results('stad'), [('fixture', self.fixture.pk)])
+        self.assertEqual(self.results('ohns'), [('player', self.players[1].pk)])
+        self.assertEqual(self.results('smitth'), [('player', self.players[2].pk)])
+        self.assertEqual(self.results('paul namib'), [('player', self.players[2].pk)])
+        self.assertEqual(self.results(''), [])
+
+    def test_ranking_and_types(self):
+        # Names first, then rows that only mention the word through a team
+        self.assertEqual(self.results('wind'), [
+            ('team', self.home.pk), ('player', self.players[0].pk), ('manager', self.manager.pk),
+            ('player', self.players[1].pk), ('player', self.players[2].pk), ('fixture', self.fixture.pk),
+        ])
+        self.assertEqual(self.results('wind', kinds={'manager'}), [('manager', self.manager.pk)])
+        self.assertEqual(self.results('wind', limit=1), [('team', self.home.pk)])
+
+        row = search.get_index().search('windhorst')[0]
+        self.assertEqual(row['label'], 'Erik Windhorst')
+        self.assertEqual(row['detail'], 'Windhoek Wanderers')
+
+    def test_saves_and_deletes_update_the_index_in_place(self):
+        search.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.home.name = 'Katutura Kings'
+            self.home.save()
+            self.players[2].delete()
+            make_player(self.away)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.results('katutura', kinds={'player'}), [('player', self.players[1].pk)])
+            self.assertEqual(self.results('wanderers'), [])
+            self.assertEqual(self.results('smith'), [])
+            self.assertEqual(len(self.results('test player')), 1)
+
+        # The same as building it again from the database
+        rebuilt = search.build()
+        index = search.get_index()
+        self.assertEqual(index.postings, rebuilt.postings)
+        self.assertEqual(index.sorted_words, rebuilt.sorted_words)
+
+    def test_score_updates_leave_the_index_alone(self):
+        version = search.get_index().version
+        with self.captureOnCommitCallbacks(execute=True):
+            fixture = Fixture.objects.get(pk=self.fixture.pk)
+            fixture.home_team_score = 3
+            fixture.save()
+        self.assertEqual(search.get_index().version, version)
+
+    def test_search_param_matches_icontains(self):
+        url = reverse('publicplayers-list')
+        for term in ('wind', 'ohn', 'namibian', 'ww', 'smith stars', 'jo'):
+            expected = set(Player.objects.filter(
+                *[
+                    Q(first_name__icontains=word) | Q(last_name__icontains=word)
+                    | Q(team_id__name__icontains=word) | Q(team_id__short_name__icontains=word)
+                    | Q(nationality__icontains=word)
+                    for word in term.split()
+                ]
+            ).values_list('id', flat=True))
+            response = self.client.get(url, {'search': term})
+            self.assertEqual({row['id'] for row in json.loads(response.content)}, expected, term)
+
+    @mock.patch.object(IndexedSearchFilter, 'max_matches', 2)
+    def test_search_param_scans_where_the_index_cannot_answer(self):
+        url = reverse('publicplayers-list')
+        for term, count in (('wind', 3), ('ohn', 1), ('oh', 1)):
+            with mock.patch.object(search.SearchIndex, 'scores', wraps=search.get_index().scores) as scores:
+                response = self.client.get(url, {'search': term})
+            self.assertEqual(len(json.loads(response.content)), count, term)
+            # Too many matches for an IN list, or too short for the index
+            self.assertEqual(scores.called, term != 'oh', term)
+
+    def test_searches_wait_for_changes_being_applied(self):
+        index = search.get_index()
+        done = threading.Event()
+        with search._lock:
+            thread = threading.Thread(target=lambda: (index.search('wind'), done.set()))
+            thread.start()
+            self.assertFalse(done.wait(0.1))
+        self.assertTrue(done.wait(5))
+        thread.join()
+
+    @override_settings(VERSION_CHECK_INTERVAL=60)
+    def test_version_is_read_once_per_interval(self):
+        versions._read.pop(search.VERSION_KEY, None)
+        search.get_index()
+        with mock.patch.object(versions.counters, 'get') as get:
+            search.get_index()
+            search.get_index()
+        get.assert_not_called()
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('search'), {'q': 'indep', 'type': 'fixture,team'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [{
+            'type': 'fixture', 'id': self.fixture.pk, 'label': 'Windhoek Wanderers vs Swakop Stars',
+            'detail': f'Independence Stadium, {self.fixture.match_datetime}', 'score': 0.8,
+        }])
+
+
+class ScheduleTests(FreshStateTestCase):
+    def setUp(self):
+        self.league, self.teams = make_league(teams=16)
+        self.admin = User.objects.create_user('admin@example.com', 'Admin', 'pw', role='ADMIN')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('league-generate-schedule', args=[self.league.pk])
+
+    def test_round_robin_meets_every_pair_home_and_away(self):
+        rounds = schedule.round_robin([1, 2, 3, 4, 5])
+        self.assertEqual(len(rounds), 10)
+        for pairs in rounds:
+            teams = [team for pair in pairs for team in pair]
+            self.assertEqual(len(teams), len(set(teams)))
+        games = sorted(pair for pairs in rounds for pair in pairs)
+        self.assertEqual(games, sorted((a, b) for a in range(1, 6) for b in range(1, 6) if a != b))
+
+    def test_interval_index_overlaps(self):
+        index = schedule.IntervalIndex()
+        index.add('a', 10, 20, 'long')
+        index.add('a', 22, 23, 'short')
+        index.add('b', 15, 16, 'other key')
+        self.assertEqual(index.overlapping('a', 19, 21), ['long'])
+        self.assertEqual(index.overlapping('a', 20, 22), [])
+        self.assertEqual(index.overlapping('a', 5, 30), ['long', 'short'])
+        self.assertEqual(index.overlapping('c', 0, 100), [])
+
+    def test_generates_a_season_in_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'start_date': '2025-02-01'}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 240)
+        self.assertEqual(response.data['rounds'], 30)
+        # No per-fixture queries (SQLite splits the insert by its variable limit)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "hockeycore_fixture"')]
+        self.assertLessEqual(len(inserts), 3)
+        self.assertLess(len(queries), 20)
+
+        fixtures = Fixture.objects.filter(league_id=self.league)
+        self.assertEqual(fixtures.count(), 240)
+        pairs = set(fixtures.values_list('home_team_id', 'away_team_id'))
+        self.assertEqual(len(pairs), 240)
+        self.assertEqual(fixtures.filter(venue=f'{self.teams[0].name} Stadium').count(), 15)
+        # bulk_create sends no signals; the search index is rebuilt instead
+        self.assertEqual(len(search.get_index().search(self.teams[0].name, kinds=['fixture'], limit=50)), 30)
+
+    def test_sixteen_team_season_is_fast(self):
+        started = time.perf_counter()
+        fixtures = schedule.generate(self.league, date(2025, 2, 1))
+        self.assertEqual(len(fixtures), 240)
+        self.assertLess(time.perf_counter() - started, 1)
+
+    def test_conflicts_are_reported_and_nothing_is_written(self):
+        cup, (visitors,) = make_league(name='Cup', teams=1)
+        booked = Fixture.objects.create(
+            match_datetime=date(2025, 2, 9), venue='Cup Ground',
+            league_id=cup, home_team_id=self.teams[3], away_team_id=visitors,
+        )
+        response = self.client.post(
+            self.url, {'start_date': '2025-02-01', 'rest_days': 3}, format='json',
+        )
+        self.assertEqual(response.status_code, 409)
+        conflicts = response.data['conflicts']
+        self.assertIn('team', {conflict['reason'] for conflict in conflicts})
+        self.assertTrue(all(conflict['conflicts_with']['fixture_id'] == booked.pk for conflict in conflicts))
+        self.assertFalse(Fixture.objects.filter(league_id=self.league).exists())
+
+    def test_shared_venue_is_a_conflict(self):
+        venues = {self.teams[0].pk: 'National Stadium', self.teams[1].pk: 'National Stadium'}
+        with self.assertRaises(schedule.ScheduleConflict) as raised:
+            schedule.generate(self.league, date(2025, 2, 1), venues=venues)
+        self.assertEqual({conflict['reason'] for conflict in raised.exception.conflicts}, {'venue'})
+
+    def test_dry_run_and_constraints(self):
+        response = self.client.post(
+            self.url, {'start_date': '2025-02-01', 'days_between_rounds': 3, 'dry_run': True}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(response.data['fixtures'][-1]['match_datetime'], date(2025, 4, 29))
+        self.assertFalse(Fixture.objects.exists())
+
+        response = self.client.post(
+            self.url, {'start_date': '2025-02-01', 'end_date': '2025-03-01'}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('after the end date', response.data['error'])
+
+    def test_existing_fixtures_need_replace(self):
+        make_fixture(self.league, self.teams[0], self.teams[1], status=Fixture.Status.UPCOMING)
+        response = self.client.post(self.url, {'start_date': '2025-02-01'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(self.url, {'start_date': '2025-02-01', 'replace': True}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Fixture.objects.filter(league_id=self.league).count(), 240)
+
+    def test_replace_does_not_book_played_matches_again(self):
+        league, teams = make_league(name='Small', teams=4)
+        played = make_fixture(league, teams[0], teams[1], status=Fixture.Status.FINISHED, home_score=2)
+        live = make_fixture(league, teams[2], teams[3], status=Fixture.Status.LIVE)
+        make_fixture(league, teams[1], teams[0], status=Fixture.Status.UPCOMING)
+
+        venues = {team.pk: f'{team.name} Ground' for team in teams}
+        fixtures = schedule.generate(league, date(2025, 3, 8), venues=venues, replace=True)
+        self.assertEqual(len(fixtures), 10)
+        planned = {(fixture.home_team_id_id, fixture.away_team_id_id) for fixture in fixtures}
+        self.assertNotIn((teams[0].pk, teams[1].pk), planned)
+        self.assertNotIn((teams[2].pk, teams[3].pk), planned)
+
+        stored = Fixture.objects.filter(league_id=league)
+        pairs = list(stored.values_list('home_team_id', 'away_team_id'))
+        self.assertEqual(len(pairs), 12)
+        self.assertEqual(len(set(pairs)), 12)
+        self.assertEqual(set(stored.exclude(status=Fixture.Status.UPCOMING)), {played, live})
+
+    def test_requires_admin(self):
+        response = APIClient().post(self.url, {'start_date': '2025-02-01'}, format='json')
+        self.assertIn(response.status_code, (401, 403))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BenchmarkTests(FreshStateTestCase):
+    def test_seed_is_consistent(self):
+        created = benchmark.seed(leagues=1, teams=4, players=3, events=60, seed=1)
+        self.assertEqual(created, {'leagues': 1, 'teams': 4, 'players': 12, 'fixtures': 12, 'events': 60})
+
+        for fixture in Fixture.objects.exclude(status=Fixture.Status.UPCOMING):
+            goals = MatchEvent.objects.filter(fixture=fixture, event_type=MatchEvent.Action.GOAL)
+            self.assertEqual(
+                (fixture.home_team_score, fixture.away_team_score),
+                (goals.filter(player__team_id=fixture.home_team_id).count(),
+                 goals.filter(player__team_id=fixture.away_team_id).count()),
+            )
+        league = League.objects.get()
+        self.assertEqual(stored_table(league), python_league_table(league.pk))
+        stats = {tuple(row) for row in PlayerSeasonStat.objects.values_list('player_id', *PLAYER_STAT_FIELDS)}
+        rebuild_player_stats()
+        self.assertEqual(
+            {tuple(row) for row in PlayerSeasonStat.objects.values_list('player_id', *PLAYER_STAT_FIELDS)}, stats
+        )
+
+    def test_run_covers_every_route_and_leaves_the_data(self):
+        benchmark.seed(leagues=1, teams=4, players=3, events=40)
+        users, members = User.objects.count(), LeagueTeam.objects.count()
+
+        report = benchmark.run(iterations=2)
+
+        self.assertEqual(
+            sorted(row['name'] for row in report['results']),
+            sorted(name for name, _, _, _ in benchmark.routes()),
+        )
+        for row in report['results']:
+            self.assertLess(row['status'], 500, row)
+            self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+        by_name = {row['name']: row for row in report['results']}
+        self.assertEqual(by_name['publicleagues-list']['cache'], 'HIT')
+        self.assertEqual(by_name['publicleagues-list']['queries'], 0)
+        self.assertGreater(by_name['publicleagues-list']['cold_queries'], 0)
+        self.assertEqual(by_name['custom_login']['status'], 200)
+        self.assertEqual((User.objects.count(), LeagueTeam.objects.count()), (users, members))
+
+        comparison = benchmark.compare(report, report)
+        self.assertEqual(len(comparison), len(report['results']))
+        self.assertTrue(all(change == 0 for _, _, _, change, _, _ in comparison))
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_exposition(self):
+        histogram = metrics.Histogram('test_seconds', 'A test.', ('route',), buckets=(0.1, 1))
+        self.addCleanup(metrics._registry.remove, histogram)
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, route='a"b')
+        self.assertEqual(histogram.render(), '\n'.join([
+            '# HELP test_seconds A test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{route="a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{route="a\\"b",le="1.0"} 3',
+            'test_seconds_bucket{route="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{route="a\\"b"} 4.05',
+            'test_seconds_count{route="a\\"b"} 4',
+        ]))
+
+
+class DatabasePoolTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(dbpool.close_pools)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/pool.sqlite3'
+
+    def connections(self, conn_max_age=0, **pool):
+        return ConnectionHandler({
+            'default': {},
+            'pooled': {
+                'ENGINE': 'hockeycore.dbpool.sqlite3', 'NAME': self.path, 'CONN_MAX_AGE': conn_max_age,
+                'OPTIONS': {'pool': pool},
+            },
+        })
+
+    def test_connections_are_reused(self):
+        handler = self.connections()
+        first = handler.create_connection('pooled')
+        first.ensure_connection()
+        raw = first.connection
+        first.close()
+
+        second = handler.create_connection('pooled')
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(second.connection, raw)
+        second.close()
+        stats = second.pool.stats()
+        self.assertEqual((stats['opened'], stats['acquired'], stats['in_use'], stats['idle']), (1, 2, 0, 1))
+
+    def test_waits_for_a_free_connection_up_to_the_timeout(self):
+        handler = self.connections(max_size=1, timeout=0.05)
+        holder = handler.create_connection('pooled')
+        holder.ensure_connection()
+        timeouts = metrics.db_pool_timeouts.value(alias='pooled')
+        with self.assertRaises(dbpool.PoolTimeout):
+            handler.create_connection('pooled').ensure_connection()
+        self.assertEqual(metrics.db_pool_timeouts.value(alias='pooled'), timeouts + 1)
+        holder.close()
+
+        # Released by another thread while this one waits
+        connected = threading.Event()
+
+        def hold():
+            wrapper = handler.create_connection('pooled')
+            wrapper.ensure_connection()
+            connected.set()
+            time.sleep(0.05)
+            wrapper.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        connected.wait()
+        waiter = handler.create_connection('pooled')
+        waiter.pool.timeout = 5
+        waiter.ensure_connection()
+        thread.join()
+        stats = waiter.pool.stats()
+        self.assertEqual((stats['opened'], stats['in_use'], stats['timeouts']), (1, 1, 1))
+        self.assertGreater(stats['longest_wait'], 0.02)
+        self.assertIn('hockeycore_db_pool_connections{alias="pooled",state="in_use"} 1', metrics.render())
+        waiter.close()
+
+    def test_broken_and_expired_connections_are_replaced(self):
+        handler = self.connections(check_after=0)
+        wrapper = handler.create_connection('pooled')
+        wrapper.ensure_connection()
+        broken = wrapper.connection
+        wrapper.close()
+        broken.close()
+        unhealthy = metrics.db_pool_closed.value(alias='pooled', reason='unhealthy')
+
+        wrapper = handler.create_connection('pooled')
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIsNot(wrapper.connection, broken)
+        self.assertEqual(metrics.db_pool_closed.value(alias='pooled', reason='unhealthy'), unhealthy + 1)
+
+        wrapper.pool.max_lifetime = 0
+        wrapper.close()
+        self.assertEqual(wrapper.pool.stats()['idle'], 0)
+
+    def test_transactions_do_not_outlive_the_checkout(self):
+        handler = self.connections()
+        wrapper = handler.create_connection('pooled')
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE scores (goals integer)')
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO scores VALUES (3)')
+        raw = wrapper.connection
+        wrapper.close()
+
+        wrapper = handler.create_connection('pooled')
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM scores')
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertIs(wrapper.connection, raw)
+        self.assertTrue(wrapper.get_autocommit())
+        wrapper.close()
+
+    def test_persistent_connections_are_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.connections(conn_max_age=60).create_connection('pooled').ensure_connection()
+
+    def test_exhausted_pool_answers_503(self):
+        busy = dbpool.PoolTimeout('No database connection free')
+        with mock.patch.object(PublicLeagueViewSet, 'list', side_effect=busy):
+            response = self.client.get(reverse('publicleagues-list'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class ServerTimingTests(FreshStateTestCase):
+    def setUp(self):
+        make_league(teams=3)
+
+    def timing(self, response):
+        return {
+            name: float(value)
+            for name, value in re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing'])
+        }
+
+    def test_header_breaks_down_the_request(self):
+        url = reverse('publicleagues-list')
+        with CaptureQueriesContext(connection) as queries:
+            miss = self.client.get(url)
+        self.assertIn(f'desc="{len(queries)} queries"', miss['Server-Timing'])
+        timing = self.timing(miss)
+        self.assertGreater(timing['db'], 0)
+        self.assertGreater(timing['serialize'], 0)
+        self.assertGreater(timing['render'], 0)
+        self.assertGreaterEqual(timing['total'], timing['db'] + timing['serialize'])
+
+        hit = self.client.get(url)
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertIn('desc="0 queries"', hit['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        before = metrics.request_seconds.count(route='publicleagues-list', method='GET')
+        self.client.get(reverse('publicleagues-list'))
+        self.client.get(reverse('publicleagues-list'))
+        self.assertEqual(metrics.request_seconds.count(route='publicleagues-list', method='GET'), before + 2)
+
+        with self.settings(METRICS_TOKEN='scrape-me'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn(
+            f'hockeycore_request_duration_seconds_count{{route="publicleagues-list",method="GET"}} {before + 2}',
+            body,
+        )
+        self.assertIn('# TYPE hockeycore_request_queries histogram', body)
+        self.assertIn('hockeycore_requests_total{route="publicleagues-list",method="GET",status="200"}', body)
+        self.assertIn('hockeycore_response_cache_hits_total{endpoint="publicleagues"}', body)
+
+    def test_metrics_need_the_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+        with self.settings(METRICS_TOKEN='scrape-me'):
+            for authorization in ({}, {'HTTP_AUTHORIZATION': 'Bearer guess'}, {'HTTP_AUTHORIZATION': 'scrape-me'}):
+                response = self.client.get(url, **authorization)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="metrics"')
@@ -4,6 +4,7 @@ from rest_framework_simplejwt.views import (
 )
 from rest_framework import routers
 from .views import *
+from . import asyncviews
 
 router = routers.DefaultRouter()
 # Admin enpoints
@@ -24,6 +25,7 @@ router.register(r'publicplayers', PublicPlayerViewSet, basename='publicplayers')
 router.register(r'publicmatchevents', PublicMatchEventViewSet, basename='public-matchevents')
 router.register(r'publicmanagers', PublicManagerViewSet, basename='publicmanagers')
 router.register(r'publicleaguestandings', PublicLeagueStandingViewSet, basename='publicleaguestandings')
+router.register(r'publicplayerstats', PublicPlayerSeasonStatViewSet, basename='publicplayerstats')
 
 
 
@@ -33,5 +35,13 @@ urlpatterns = [
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('protected/', ProtectedView.as_view(), name='protected_view'),
     path('admin/leagues/add-team/', AddTeamToLeagueView.as_view(), name='add-team-to-league'),
+    path('admin/cache-stats/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
+    path('leaderboards/<int:league_id>/<str:board>/', LeaderboardView.as_view(), name='leaderboard'),
+    path('search/', SearchView.as_view(), name='search'),
+    # Async versions of the busiest public lists (see asyncviews)
+    path('async/fixtures/', asyncviews.FixtureListView.as_view(), name='async-fixtures'),
+    path('async/standings/', asyncviews.StandingListView.as_view(), name='async-standings'),
+    path('async/players/', asyncviews.PlayerListView.as_view(), name='async-players'),
+    path('async/matchevents/', asyncviews.MatchEventListView.as_view(), name='async-matchevents'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Version counters for the in-memory copies each worker process keeps.
+
+The search index, the team and player directory and the leaderboards are
+held in every process and updated in place as committed changes come in.
+Each change also bumps a counter shared by every process on the host (see
+hockeycore.counters). A bump is atomic, so each change gets a number of its
+own; a process that finds the counter past what it applied itself reloads
+its copy.
+
+Reading a counter is a trip to the file system, so a process reads each one
+at most once every VERSION_CHECK_INTERVAL seconds (1 unless set) and uses
+the value it read in between. Its own bumps count as reads. A change made
+by another process is noticed within the interval.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from . import counters
+
+# Key -> (value, when it was read)
+_read = {}
+_lock = threading.Lock()
+
+
+def _remember(key, value):
+    with _lock:
+        _read[key] = (value, time.monotonic())
+
+
+def current(key):
+    """
+    Return the counter's value, 0 before its first bump.
+    """
+    with _lock:
+        read = _read.get(key)
+    if read is not None and time.monotonic() - read[1] < getattr(settings, 'VERSION_CHECK_INTERVAL', 1.0):
+        return read[0]
+
+    value = counters.get(key)
+    _remember(key, value)
+    return value
+
+
+def bump(key):
+    """
+    Add one to the counter and return the new value. No other bump, in this
+    process or another, gets the same value.
+    """
+    value = counters.add(key)
+    _remember(key, value)
+    return value
@@ -1,6 +1,9 @@
+import hmac
+
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
+from rest_framework.exceptions import NotFound
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.mixins import (
@@ -14,10 +17,19 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import *
 from .models import *
 from .permissions import IsAdmin, IsReadOnly
+from .metrics import TimedSerializerMixin
+from .responsecache import CachedResponseMixin
+from .search import IndexedSearchFilter
+from .ingest import ingest_events
+from .projections import ProjectedListMixin
+from .fieldsets import SparseFieldsViewMixin
+from django.conf import settings
+from django.http import HttpResponse
+from . import directory, leaderboards, metrics, responsecache, schedule, search
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
-from rest_framework.filters import SearchFilter, OrderingFilter
-from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.filters import OrderingFilter
+from django_filters.rest_framework import DjangoFilterBackend, FilterSet, NumberFilter
 
 from rest_framework.decorators import authentication_classes, permission_classes, action
 from rest_framework.permissions import IsAuthenticated
@@ -48,6 +60,8 @@ class ProtectedView(APIView):
     
 
 class AdminOnlyViewSet(
+    TimedSerializerMixin,
+    SparseFieldsViewMixin,
     CreateModelMixin,
     RetrieveModelMixin,
     UpdateModelMixin,
@@ -59,6 +73,8 @@ class AdminOnlyViewSet(
     permission_classes = [IsAdmin]
 
 class ReadOnlyViewSet(
+    TimedSerializerMixin,
+    SparseFieldsViewMixin,
     RetrieveModelMixin,
     ListModelMixin,
     GenericViewSet
@@ -70,6 +86,41 @@ class LeagueViewSet(AdminOnlyViewSet):
     queryset = League.objects.all()
     serializer_class = LeagueSerializer
 
+    @action(detail=True, methods=['post'], url_path='schedule')
+    def generate_schedule(self, request, pk=None):
+        """
+        Create the league's double round-robin fixtures in one go (see
+        hockeycore.schedule). Double bookings are answered with 409 and the
+        list of clashes; `dry_run` returns the schedule without saving it.
+        """
+        league = self.get_object()
+        serializer = ScheduleSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        options = serializer.validated_data
+        try:
+            fixtures = schedule.generate(league, **options)
+        except schedule.ScheduleConflict as e:
+            return Response({'error': str(e), 'conflicts': e.conflicts}, status=status.HTTP_409_CONFLICT)
+        except schedule.ScheduleError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'league_id': league.pk,
+            'created': 0 if options['dry_run'] else len(fixtures),
+            'rounds': len({fixture.match_datetime for fixture in fixtures}),
+            'fixtures': [
+                {
+                    'id': fixture.pk,
+                    'match_datetime': fixture.match_datetime,
+                    'venue': fixture.venue,
+                    'home_team_id': fixture.home_team_id_id,
+                    'away_team_id': fixture.away_team_id_id,
+                }
+                for fixture in fixtures
+            ],
+        }, status=status.HTTP_200_OK if options['dry_run'] else status.HTTP_201_CREATED)
+
 class TeamViewSet(AdminOnlyViewSet):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
@@ -89,9 +140,10 @@ class ManagerViewSet(AdminOnlyViewSet):
     serializer_class = ManagerSerializer
     permission_classes = [IsAdmin]
 
-class PublicManagerViewSet(ReadOnlyViewSet):
+class PublicManagerViewSet(CachedResponseMixin, ReadOnlyViewSet):
     queryset = Manager.objects.all()
     serializer_class = ManagerSerializer
+    cache_resources = ('managers', 'teams')
 
 class StaffViewSet(ReadOnlyViewSet):
     queryset = Staff.objects.all()
@@ -102,7 +154,7 @@ class FixtureViewSet(AdminOnlyViewSet):
     queryset = Fixture.objects.all().select_related(
         'home_team_id', 'away_team_id', 'league_id', 'victor'
     )
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, OrderingFilter]
     filterset_fields = {
         'league_id': ['exact'],
         'status': ['exact'],
@@ -111,8 +163,9 @@ class FixtureViewSet(AdminOnlyViewSet):
         'away_team_id': ['exact'],
     }
     search_fields = ['home_team_id__name', 'away_team_id__name', 'venue']
+    search_kind = 'fixture'
     ordering_fields = ['match_datetime', 'league_id__name']
-    ordering = ['match_datetime']
+    ordering = ['match_datetime', 'id']
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -140,8 +193,11 @@ class FixtureViewSet(AdminOnlyViewSet):
             self.get_queryset().filter(status=Fixture.Status.UPCOMING)
         )
         page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def live(self, request):
@@ -149,8 +205,11 @@ class FixtureViewSet(AdminOnlyViewSet):
             self.get_queryset().filter(status=Fixture.Status.LIVE)
         )
         page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def finished(self, request):
@@ -158,13 +217,16 @@ class FixtureViewSet(AdminOnlyViewSet):
             self.get_queryset().filter(status=Fixture.Status.FINISHED)
         )
         page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
-
-class PublicFixtureViewSet(ReadOnlyViewSet):
-    queryset = Fixture.objects.all().select_related(
-        'home_team_id', 'away_team_id', 'league_id', 'victor',
-    ).prefetch_related('matchevent_set')
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+class PublicFixtureViewSet(CachedResponseMixin, ReadOnlyViewSet):
+    # Teams come from the directory
+    queryset = Fixture.objects.all().select_related('league_id').prefetch_related(match_events_prefetch())
+    cache_resources = ('fixtures', 'teams', 'leagues', 'matchevents', 'players')
     
     def get_serializer_class(self):
         # if self.action == 'retrieve':
@@ -172,15 +234,16 @@ class PublicFixtureViewSet(ReadOnlyViewSet):
         # return PublicFixtureSerializer
     
     # Keep all the existing filter and action methods
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, OrderingFilter]
     filterset_fields = {
         'league_id': ['exact'],
         'status': ['exact'],
         'match_datetime': ['exact', 'gte', 'lte'],
     }
     search_fields = ['home_team_id__name', 'away_team_id__name', 'venue']
+    search_kind = 'fixture'
     ordering_fields = ['match_datetime']
-    ordering = ['match_datetime']
+    ordering = ['match_datetime', 'id']
 
     @action(detail=False, methods=['get'])
     def upcoming(self, request):
@@ -188,8 +251,11 @@ class PublicFixtureViewSet(ReadOnlyViewSet):
             self.get_queryset().filter(status=Fixture.Status.UPCOMING)
         )
         page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def live(self, request):
@@ -197,8 +263,11 @@ class PublicFixtureViewSet(ReadOnlyViewSet):
             self.get_queryset().filter(status=Fixture.Status.LIVE)
         )
         page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def finished(self, request):
@@ -206,54 +275,53 @@ class PublicFixtureViewSet(ReadOnlyViewSet):
             self.get_queryset().filter(status=Fixture.Status.FINISHED)
         )
         page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
-
-class SimpleFixtureViewSet(ReadOnlyModelViewSet):
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+class SimpleFixtureViewSet(
+    CachedResponseMixin, ProjectedListMixin, TimedSerializerMixin, SparseFieldsViewMixin, ReadOnlyModelViewSet
+):
     """
     A simple viewset for viewing fixtures with basic information including scores.
     Uses PublicFixtureSerializer for all actions.
     """
-    queryset = Fixture.objects.all().select_related(
-        'home_team_id', 'away_team_id', 'league_id'
-    )
+    queryset = Fixture.objects.all().select_related('league_id')
     serializer_class = SimpleFixtureSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    cache_resources = ('fixtures', 'teams', 'leagues')
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, OrderingFilter]
     filterset_fields = {
         'league_id': ['exact'],
         'status': ['exact'],
         'match_datetime': ['exact', 'gte', 'lte'],
     }
     search_fields = ['home_team_id__name', 'away_team_id__name', 'venue']
+    search_kind = 'fixture'
     ordering_fields = ['match_datetime']
-    ordering = ['match_datetime']
+    ordering = ['match_datetime', 'id']
 
     @action(detail=False, methods=['get'])
     def upcoming(self, request):
         queryset = self.filter_queryset(
             self.get_queryset().filter(status=Fixture.Status.UPCOMING)
         )
-        page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        return self.projected_response(queryset)
 
     @action(detail=False, methods=['get'])
     def live(self, request):
         queryset = self.filter_queryset(
             self.get_queryset().filter(status=Fixture.Status.LIVE)
         )
-        page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        return self.projected_response(queryset)
 
     @action(detail=False, methods=['get'])
     def finished(self, request):
         queryset = self.filter_queryset(
             self.get_queryset().filter(status=Fixture.Status.FINISHED)
         )
-        page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        return self.projected_response(queryset)
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -269,33 +337,53 @@ class MatchEventViewSet(AdminOnlyViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['fixture', 'event_type', 'player']
 
-class PublicMatchEventViewSet(ReadOnlyViewSet):
-    queryset = MatchEvent.objects.all().select_related(
-        'fixture', 'player', 'assisting', 'sub_in', 'sub_out'
-    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create a fixture's queued events in one request:
+        {"fixture": id, "events": [{minute, event_type, player, ...}, ...]}.
+        They are saved together and broadcast as one batch, in match order.
+        """
+        serializer = BulkMatchEventSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        fixture = serializer.validated_data['fixture']
+        created = ingest_events(fixture, serializer.validated_data['events'])
+        return Response({
+            'fixture': fixture.pk,
+            'created': len(created),
+            'events': MatchEventSerializer2(created, many=True).data,
+        }, status=status.HTTP_201_CREATED)
+
+class PublicMatchEventViewSet(CachedResponseMixin, ReadOnlyViewSet):
+    queryset = MatchEvent.objects.all().select_related(*MATCH_EVENT_RELATED)
     serializer_class = MatchEventSerializer
+    cache_resources = ('matchevents', 'players', 'teams')
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['fixture', 'event_type', 'player']
 
-class PublicLeagueViewSet(ReadOnlyViewSet):
+class PublicLeagueViewSet(CachedResponseMixin, ReadOnlyViewSet):
     queryset = League.objects.all()
     serializer_class = LeagueSerializer
+    cache_resources = ('leagues',)
     # Add any filters for public view
     filterset_fields = ['status']
 
-class PublicTeamViewSet(ReadOnlyViewSet):
+class PublicTeamViewSet(CachedResponseMixin, ReadOnlyViewSet):
     queryset = Team.objects.all()
     serializer_class = PublicTeamSerializer
+    cache_resources = ('teams',)
 
-class PublicPlayerViewSet(ReadOnlyViewSet):
+class PublicPlayerViewSet(CachedResponseMixin, ProjectedListMixin, ReadOnlyViewSet):
     """
     Public read-only viewset for player data with filtering and search capabilities.
     """
-    queryset = Player.objects.all().select_related('team_id')
+    queryset = Player.objects.all()
     serializer_class = PublicPlayerSerializer
+    cache_resources = ('players', 'teams')
     
     # Add filtering, searching, and ordering capabilities
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, OrderingFilter]
     filterset_fields = {
         'team_id': ['exact'],
         'position': ['exact'],
@@ -308,13 +396,14 @@ class PublicPlayerViewSet(ReadOnlyViewSet):
         'team_id__short_name',
         'nationality',
     ]
+    search_kind = 'player'
     ordering_fields = [
         'last_name',
         'first_name',
         'jersey_no',
         'team_id__name',
     ]
-    ordering = ['last_name']  # Default ordering
+    ordering = ['last_name', 'id']  # Default ordering
 
     @action(detail=False, methods=['get'])
     def by_team(self, request):
@@ -330,22 +419,104 @@ class PublicPlayerViewSet(ReadOnlyViewSet):
         
         try:
             players = self.get_queryset().filter(team_id=team_id)
-            serializer = self.get_serializer(players, many=True)
-            return Response(serializer.data)
+            return self.projected_response(players, paginate=False)
         except Exception as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-class PublicLeagueStandingViewSet(ReadOnlyViewSet):
-    queryset = LeagueStanding.objects.select_related('team_id', 'league_id').all()
+class PublicLeagueStandingViewSet(CachedResponseMixin, ProjectedListMixin, ReadOnlyViewSet):
+    queryset = LeagueStanding.objects.all()
     serializer_class = LeagueStandingSerializer
+    cache_resources = ('standings', 'teams', 'leagues')
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['league_id']
     ordering_fields = ['position']
     ordering = ['position']
 
+class PlayerSeasonStatFilter(FilterSet):
+    # Plain ids, so filtering costs no lookup of the player or league itself
+    player_id = NumberFilter()
+    league_id = NumberFilter()
+
+    class Meta:
+        model = PlayerSeasonStat
+        fields = ['player_id', 'league_id']
+
+class PublicPlayerSeasonStatViewSet(CachedResponseMixin, ReadOnlyViewSet):
+    """
+    A player's season totals, e.g. /publicplayerstats/?player_id=12 for a
+    profile page. Read straight from the materialized rows.
+    """
+    queryset = PlayerSeasonStat.objects.select_related('league_id')
+    serializer_class = PlayerSeasonStatSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PlayerSeasonStatFilter
+    ordering = ['league_id', 'id']
+    cache_resources = ('playerstats', 'leagues')
+
+class LeaderboardView(APIView):
+    """
+    A league's top scorers, assisters or most carded players, e.g.
+    /leaderboards/3/scorers/?limit=10, served from the in-memory boards.
+    """
+    permission_classes = [IsReadOnly]
+    default_limit = 10
+    max_limit = 100
+
+    def get(self, request, league_id, board):
+        if board not in leaderboards.BOARDS:
+            raise NotFound(f"Unknown leaderboard '{board}'")
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+
+        rows = leaderboards.board(league_id, board).top(max(limit, 0))
+        people = directory.get_directory()
+        # Players and teams another process added a moment ago come from the database
+        missing = [player_id for _, player_id, _ in rows if people.player(player_id) is None]
+        found = {
+            player.pk: directory.PlayerRecord.from_model(player)
+            for player in Player.objects.filter(pk__in=missing)
+        } if missing else {}
+        results = []
+        for rank, player_id, count in rows:
+            player = people.player(player_id) or found.get(player_id)
+            if player is None:
+                continue
+            team = people.team(player.team_id, lambda: Team.objects.get(pk=player.team_id))
+            results.append({
+                'rank': rank,
+                'player_id': player_id,
+                'name': player.name,
+                'team_id': player.team_id,
+                'team_name': team.name,
+                'count': count,
+            })
+        return Response(results)
+
+class SearchView(APIView):
+    """
+    Autocomplete across teams, players, managers and fixtures, e.g.
+    /search/?q=wind&type=team,fixture&limit=10. Ranked best match first.
+    """
+    permission_classes = [IsReadOnly]
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        kinds = None
+        if request.query_params.get('type'):
+            kinds = set(request.query_params['type'].split(',')) & set(search.KINDS)
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        return Response(search.get_index().search(query, kinds, max(limit, 0)))
+
 @authentication_classes([JWTAuthentication])
 @permission_classes([IsAdmin])
 class AddTeamToLeagueView(APIView):
@@ -363,4 +534,24 @@ class AddTeamToLeagueView(APIView):
             
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAdmin])
+class ResponseCacheStatsView(APIView):
+    def get(self, request):
+        return Response(responsecache.stats())
+
+def metrics_view(request):
+    """
+    Request, WebSocket and cache metrics for Prometheus to scrape, for
+    requests bearing the METRICS_TOKEN (`Authorization: Bearer <token>`).
+    With no token set the endpoint answers nobody.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if not token or scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), token.encode()):
+        response = HttpResponse('Not authorised.', status=401, content_type='text/plain; charset=utf-8')
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -3,6 +3,7 @@ import '../services/match_service.dart';
 import 'package:dio/dio.dart';
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:hockeyapp/config.dart';
+import 'package:hockeyapp/services/paging.dart';
 
 class FixtureDetailPage extends StatefulWidget {
   final int fixtureId;
@@ -89,11 +90,11 @@ class _FixtureDetailPageState extends State<FixtureDetailPage> {
       final homeTeamId = _fixture!['home_team']['id'];
       final awayTeamId = _fixture!['away_team']['id'];
 
-      final playerResp1 = await dio.get('/admin/players/', queryParameters: {'team_id': homeTeamId});
-      final playerResp2 = await dio.get('/admin/players/', queryParameters: {'team_id': awayTeamId});
+      final homePlayers = await getAllPages(dio, '/admin/players/', queryParameters: {'team_id': homeTeamId});
+      final awayPlayers = await getAllPages(dio, '/admin/players/', queryParameters: {'team_id': awayTeamId});
 
-      _homePlayers = List<Map<String, dynamic>>.from(playerResp1.data);
-      _awayPlayers = List<Map<String, dynamic>>.from(playerResp2.data);
+      _homePlayers = List<Map<String, dynamic>>.from(homePlayers);
+      _awayPlayers = List<Map<String, dynamic>>.from(awayPlayers);
 
       _buildPlayerNamesMap();
     } catch (e) {
@@ -109,10 +110,10 @@ class _FixtureDetailPageState extends State<FixtureDetailPage> {
     setState(() => _loadingEvents = true);
     try {
       final dio = await _createAuthDio();
-      final resp = await dio.get('/admin/matchevents/', queryParameters: {
+      final events = await getAllPages(dio, '/admin/matchevents/', queryParameters: {
           'fixture': widget.fixtureId,
       });
-      _events = List<Map<String, dynamic>>.from(resp.data);
+      _events = List<Map<String, dynamic>>.from(events);
       _events.sort((a, b) => b['minute'].compareTo(a['minute']));
     } catch(e){
       ScaffoldMessenger.of(context).showSnackBar(
@@ -2,6 +2,7 @@ import 'package:flutter/material.dart';
 import 'package:dio/dio.dart';
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:hockeyapp/config.dart';
+import 'package:hockeyapp/services/paging.dart';
 import '../services/league_service.dart';
 import '../services/team_service.dart';
 import '../services/auth_service.dart';
@@ -146,12 +147,13 @@ class _LeagueDetailPageState extends State<LeagueDetailPage>
     setState(() => _loadingFixtures = true);
     try {
       final dio = await _createAuthDio();
-      final resp = await dio.get(
+      final fixtures = await getAllPages(
+        dio,
         'admin/fixtures/',
         queryParameters: {'league_id': widget.id},
       );
       setState(() {
-        _fixtures = List<Map<String, dynamic>>.from(resp.data);
+        _fixtures = List<Map<String, dynamic>>.from(fixtures);
       });
     } catch (e) {
       // handle error…
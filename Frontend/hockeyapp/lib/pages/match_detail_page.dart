@@ -33,7 +33,7 @@ class _MatchDetailPageState extends State<MatchDetailPage> {
       final data = jsonDecode(message);
       print(data);
       setState(() {
-        if(data['type'] == 'score_update'){
+        if(data['type'] == 'score_update' || data['type'] == 'snapshot'){
           _liveScore = data['score'];
           _liveStatus = data['status'];
         } else{
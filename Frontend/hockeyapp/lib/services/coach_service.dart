@@ -1,6 +1,7 @@
 import 'package:dio/dio.dart';
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:hockeyapp/config.dart';
+import 'package:hockeyapp/services/paging.dart';
 
 class Coach {
   final int id;
@@ -42,13 +43,8 @@ class CoachService {
 
   Future<List<Coach>> listCoaches() async {
     await _attachToken();
-    final resp = await _dio.get('admin/managers/');
-    final data = resp.data;
-    if (data is List) {
-      return data.map((e) => Coach.fromJson(e)).toList();
-    } else {
-      throw Exception('Expected a list but got ${data.runtimeType}');
-    }
+    final data = await getAllPages(_dio, 'admin/managers/');
+    return data.map((e) => Coach.fromJson(e)).toList();
   }
 
   Future<Coach> getCoach(int id) async {
@@ -98,8 +94,7 @@ class CoachService {
 
   Future<List<Coach>> listUnassignedCoaches() async {
     await _attachToken();
-    final resp = await _dio.get('admin/managers/');
-    final data = resp.data as List;
+    final data = await getAllPages(_dio, 'admin/managers/');
     // filter where coach is NOT assigned (no managed_team)
     return data
         .where((m) => m['managed_team'] == null)
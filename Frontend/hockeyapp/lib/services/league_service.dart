@@ -1,6 +1,7 @@
 import 'package:dio/dio.dart';
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:hockeyapp/config.dart';
+import 'package:hockeyapp/services/paging.dart';
 
 class League {
   final int id;
@@ -54,15 +55,8 @@ class LeagueService {
 
   Future<List<League>> listLeagues() async {
   await _attachToken();
-  final resp = await _dio.get('admin/leagues/');
-  
-  // SAFER: assume response is a List
-  final data = resp.data;
-  if (data is List) {
-    return data.map((item) => League.fromJson(item)).toList();
-  } else {
-    throw Exception("Expected a list but got ${data.runtimeType}");
-  }
+  final data = await getAllPages(_dio, 'admin/leagues/');
+  return data.map((item) => League.fromJson(item)).toList();
 }
 
 
@@ -74,15 +68,8 @@ class LeagueService {
 
   Future<List<League>> listPublicLeagues() async {
     await _attachToken();
-    final resp = await _dio.get('publicleagues/');
-    
-    // SAFER: assume response is a List
-    final data = resp.data;
-    if (data is List) {
-      return data.map((item) => League.fromJson(item)).toList();
-    } else {
-      throw Exception("Expected a list but got ${data.runtimeType}");
-    }
+    final data = await getAllPages(_dio, 'publicleagues/');
+    return data.map((item) => League.fromJson(item)).toList();
   }
 
   Future<League> getPublicLeague(int id) async {
@@ -3,6 +3,7 @@
 import 'package:dio/dio.dart';
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:hockeyapp/config.dart';
+import 'package:hockeyapp/services/paging.dart';
 
 class Match {
   final int id;
@@ -73,16 +74,16 @@ class MatchService {
 
   Future<List<Map<String, dynamic>>> getPastEvents(int fixtureId) async {
     await _attachToken();
-    final resp = await _dio.get('/publicmatchevents/', queryParameters: {
+    final data = await getAllPages(_dio, '/publicmatchevents/', queryParameters: {
       'fixture': fixtureId,
     });
-    return List<Map<String, dynamic>>.from(resp.data);
+    return List<Map<String, dynamic>>.from(data);
   }
 
   Future<List<Match>> listFixtures() async {
     await _attachToken();
-    final resp = await _dio.get('simplefixtures/');
-    final list = (resp.data as List).cast<Map<String, dynamic>>();
+    final data = await getAllPages(_dio, 'simplefixtures/');
+    final list = data.cast<Map<String, dynamic>>();
     return list.map((j) => Match.fromJson(j)).toList();
   }
 
@@ -0,0 +1,34 @@
+// lib/services/paging.dart
+import 'package:dio/dio.dart';
+
+final _nextLink = RegExp(r'<([^>]+)>;\s*rel="next"');
+
+/// The URL of the page after [response], from its Link header, or null on
+/// the last page.
+String? nextPageUrl(Response response) {
+  final link = response.headers.map['link']?.join(', ');
+  if (link == null) return null;
+  return _nextLink.firstMatch(link)?.group(1);
+}
+
+/// GETs the list at [path] and every page after it, following the Link
+/// header, and returns the rows of all of them.
+Future<List<dynamic>> getAllPages(
+  Dio dio,
+  String path, {
+  Map<String, dynamic>? queryParameters,
+}) async {
+  final rows = <dynamic>[];
+  var response = await dio.get(path, queryParameters: queryParameters);
+  while (true) {
+    final data = response.data;
+    if (data is! List) {
+      throw Exception('Expected a list but got ${data.runtimeType}');
+    }
+    rows.addAll(data);
+    final next = nextPageUrl(response);
+    if (next == null) return rows;
+    // The next link is absolute and already carries the query
+    response = await dio.get(next);
+  }
+}
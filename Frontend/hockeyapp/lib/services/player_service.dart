@@ -2,6 +2,7 @@
 import 'package:dio/dio.dart';
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:hockeyapp/config.dart';
+import 'package:hockeyapp/services/paging.dart';
 
 class Player {
   final int id;
@@ -69,15 +70,8 @@ class PlayerService {
 
   Future<List<Player>> listPlayers() async {
     await _attachToken();
-    final response = await _dio.get('players/');
-    
-    // Handle both list response and paginated response
-    if (response.data is List) {
-      return (response.data as List).map((json) => Player.fromJson(json)).toList();
-    } else if (response.data['results'] is List) {
-      return (response.data['results'] as List).map((json) => Player.fromJson(json)).toList();
-    }
-    throw Exception('Invalid players list format');
+    final data = await getAllPages(_dio, 'players/');
+    return data.map((json) => Player.fromJson(json)).toList();
   }
 
   Future<Player> createPlayer({
@@ -130,17 +124,8 @@ class PlayerService {
   }
 
   Future<List<Player>> publicListPlayers() async {
-    final resp = await _dio.get('publicplayers/');
-    
-    final data = resp.data;
-    print(data);
-    if (data is List) {
-      return data.map((item) => Player.fromJson(item)).toList();
-    } else if (data['results'] is List) {
-      return (data['results'] as List).map((item) => Player.fromJson(item)).toList();
-    } else {
-      throw Exception("Expected a list but got ${data.runtimeType}");
-    }
+    final data = await getAllPages(_dio, 'publicplayers/');
+    return data.map((item) => Player.fromJson(item)).toList();
   }
 
 }
\ No newline at end of file
@@ -1,6 +1,7 @@
 import 'package:dio/dio.dart';
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:hockeyapp/config.dart';
+import 'package:hockeyapp/services/paging.dart';
 import 'package:hockeyapp/services/coach_service.dart' as coach_service;
 
 class Team {
@@ -56,15 +57,8 @@ class TeamService {
 
   Future<List<Team>> listTeams() async {
     await _attachToken();
-    final resp = await _dio.get('publicteams/');
-    
-    // SAFER: assume response is a List
-    final data = resp.data;
-    if (data is List) {
-      return data.map((item) => Team.fromJson(item)).toList();
-    } else {
-      throw Exception("Expected a list but got ${data.runtimeType}");
-    }
+    final data = await getAllPages(_dio, 'publicteams/');
+    return data.map((item) => Team.fromJson(item)).toList();
   }
 
 